@@ -55,7 +55,7 @@ async def add_test_data():
             kb_doc = EmployeeKBCreate(**doc_data)
             
             # Add to database
-            doc_id = employee_kb_service.create_document(kb_doc)
+            doc_id = await employee_kb_service.create_document(kb_doc)
             print(f"✅ Added: {doc_data['title']} (ID: {doc_id})")
             added_count += 1
             
@@ -66,7 +66,7 @@ async def add_test_data():
     
     # Show current stats
     try:
-        stats = employee_kb_service.get_document_stats()
+        stats = await employee_kb_service.get_document_stats()
         print(f"\n📊 Current Collection Stats:")
         print(f"   Total documents: {stats['total_documents']}")
     except Exception as e:
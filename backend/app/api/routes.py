@@ -1,6 +1,11 @@
-from datetime import datetime, timezone
-from typing import Dict, Optional
-from fastapi import APIRouter, HTTPException
+import secrets
+import time
+from datetime import date, datetime, timezone
+from typing import Dict, List, Optional
+from fastapi import APIRouter, Header, HTTPException, Query
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import FileResponse, StreamingResponse
+from starlette.background import BackgroundTask
 from pydantic import BaseModel
 
 from ..models.policy import (
@@ -11,13 +16,30 @@ from ..models.policy import (
     EmployeeKBCreate, 
     EmployeeKBUpdate,
     EnhancedAskRequest, 
-    EnhancedAskResponse
+    EnhancedAskResponse,
+    BatchAskRequest,
+    BatchAskResponse,
+    AskDryRunResponse
 )
 from ..models.employee import Employee, EmployeeResponse
 from ..models.feedback import FeedbackCreate, FeedbackResponse, FeedbackStats
+from ..config import settings
 from ..services.mongo_ops import mongo_service
 from ..services.excel_writer import excel_writer
+from ..services.export_queue import PENDING_EXPORT_FIELD, export_queue
+from ..services.employee_export import EXPORT_FORMATS, employee_exporter
 from ..services.ai_connector import ai_connector
+from ..services.ask_service import ask_service
+from ..services.answer_cache import answer_cache
+from ..services.semantic_cache import semantic_cache
+from ..services.shared_cache import answer_tiers, context_tiers, shared_cache
+from ..services.context_snapshot import context_snapshots
+from ..services.conversation_store import conversation_store
+from ..services.digest import digest_worker
+from ..services.single_flight import ask_single_flight
+from ..services.intent_router import intent_router
+from ..services.model_router import model_router
+from ..services.usage_tracker import usage_tracker
 from ..services.policy_service import policy_service
 from ..services.employee_kb_service import employee_kb_service
 from ..services.feedback_service import feedback_service
@@ -48,11 +70,24 @@ async def onboard_employee(employee: Employee):
         # Add server-side timestamp
         employee_dict["created_at"] = datetime.now(timezone.utc)
         
+        # Mark the export as pending in the same write, so the queue picks it up even if enqueueing below fails
+        if settings.EXPORT_QUEUE_ENABLED:
+            employee_dict[PENDING_EXPORT_FIELD] = True
+        
         # Save to MongoDB
-        employee_id = mongo_service.save_employee(employee_dict)
+        employee_id = await mongo_service.save_employee(employee_dict)
         
-        # Append to Excel file
-        excel_export_status = excel_writer.append_employee_row(employee_dict)
+        # Queue the Excel export (written in the background) or append to the Excel file now
+        if settings.EXPORT_QUEUE_ENABLED:
+            try:
+                excel_export_status = await export_queue.enqueue(employee_id, employee_dict.get("employee_code"))
+            except Exception as e:
+                import logging
+                logger = logging.getLogger(__name__)
+                logger.warning(f"Failed to queue Excel export for {employee_id}, left to the export worker: {str(e)}")
+                excel_export_status = "queued"
+        else:
+            excel_export_status = await run_in_threadpool(excel_writer.append_employee_row, employee_dict)
         
         return EmployeeResponse(status="success", id=employee_id, excel_export=excel_export_status)
         
@@ -67,6 +102,66 @@ async def onboard_employee(employee: Employee):
             detail="Failed to onboard employee. Please try again."
         )
 
+@router.get("/export/status", response_model=dict)
+async def get_export_status(employee_id: Optional[str] = None):
+    """Excel export queue counters, or the export status of one onboarded employee"""
+    try:
+        if employee_id:
+            entry = await export_queue.get_entry(employee_id)
+            if entry is None:
+                raise HTTPException(status_code=404, detail="No export queued for this employee")
+            return {"status": "success", "export": entry}
+        return {"status": "success", "stats": await export_queue.get_stats()}
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        import logging
+        logger = logging.getLogger(__name__)
+        logger.error(f"Failed to get export status: {str(e)}")
+        raise HTTPException(status_code=500, detail="Failed to get export status")
+
+@router.get("/employees/export")
+async def export_employees(
+    export_format: str = Query("xlsx", alias="format"),
+    joined_from: Optional[date] = None,
+    joined_to: Optional[date] = None,
+    designation: Optional[List[str]] = Query(None),
+    x_export_api_key: Optional[str] = Header(None)
+):
+    """Download onboarded employees from MongoDB as XLSX or CSV, optionally filtered by date of joining and designation
+
+    The export holds every employee's personal data, so it requires the
+    EXPORT_API_KEY admin key in the X-Export-API-Key header and is disabled
+    while no key is configured.
+    """
+    if not settings.EXPORT_API_KEY:
+        raise HTTPException(status_code=404, detail="Employee export is not enabled")
+    if not x_export_api_key or not secrets.compare_digest(x_export_api_key, settings.EXPORT_API_KEY):
+        raise HTTPException(status_code=401, detail="Invalid or missing export API key")
+    if export_format not in EXPORT_FORMATS:
+        raise HTTPException(status_code=400, detail=f"format must be one of: {', '.join(EXPORT_FORMATS)}")
+    query = employee_exporter.build_query(joined_from, joined_to, designation)
+    filename = f"onboarded_employees.{export_format}"
+    headers = {"Content-Disposition": f'attachment; filename="{filename}"'}
+    
+    if export_format == "csv":
+        return StreamingResponse(employee_exporter.csv_chunks(query), media_type="text/csv; charset=utf-8", headers=headers)
+    
+    try:
+        path = await employee_exporter.write_xlsx(query)
+    except Exception as e:
+        import logging
+        logger = logging.getLogger(__name__)
+        logger.error(f"Failed to export employees: {str(e)}")
+        raise HTTPException(status_code=500, detail="Failed to export employees")
+    return FileResponse(
+        path,
+        media_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+        headers=headers,
+        background=BackgroundTask(employee_exporter.remove_file, path)
+    )
+
 # Legacy /api/ask endpoint removed - use consolidated /api/ask endpoint instead
 
 # Policy Management Endpoints
@@ -82,7 +177,7 @@ async def get_policies(
     try:
         # Get by specific section ID
         if section_id:
-            section = policy_service.get_section_by_id(section_id)
+            section = await policy_service.get_section_by_id(section_id)
             if not section:
                 raise HTTPException(status_code=404, detail="Policy section not found")
             return [section]  # Return as list for consistency
@@ -92,7 +187,7 @@ async def get_policies(
             if step < 1 or step > 17:
                 raise HTTPException(status_code=400, detail="Step order must be between 1 and 17")
             
-            section = policy_service.get_section_by_order(step)
+            section = await policy_service.get_section_by_order(step)
             if not section:
                 raise HTTPException(status_code=404, detail=f"Policy section for step {step} not found")
             return [section]  # Return as list for consistency
@@ -101,7 +196,7 @@ async def get_policies(
         elif search:
             # For now, return all policies and let frontend filter
             # In future, implement search in policy_service
-            sections = policy_service.get_all_sections()
+            sections = await policy_service.get_all_sections()
             # Simple text search (case-insensitive)
             filtered_sections = [
                 s for s in sections 
@@ -111,7 +206,7 @@ async def get_policies(
         
         # Get all policies with pagination
         else:
-            sections = policy_service.get_all_sections()
+            sections = await policy_service.get_all_sections()
             return sections[offset:offset + limit]
         
     except HTTPException:
@@ -134,7 +229,7 @@ async def get_policies(
 async def create_policy_section(section: PolicySectionCreate):
     """Create a new HR policy section"""
     try:
-        section_id = policy_service.create_section(section)
+        section_id = await policy_service.create_section(section)
         return {
             "status": "success",
             "message": "Policy section created successfully",
@@ -181,7 +276,7 @@ async def update_policy_section(section_id: str, updates: PolicySectionUpdate):
     """Update an existing HR policy section"""
     try:
         # Check if section exists
-        existing_section = policy_service.get_section_by_id(section_id)
+        existing_section = await policy_service.get_section_by_id(section_id)
         if not existing_section:
             raise HTTPException(
                 status_code=404, 
@@ -191,7 +286,7 @@ async def update_policy_section(section_id: str, updates: PolicySectionUpdate):
                 }
             )
         
-        success = policy_service.update_section(section_id, updates)
+        success = await policy_service.update_section(section_id, updates)
         if success:
             return {
                 "status": "success",
@@ -236,7 +331,7 @@ async def delete_policy_section(section_id: str):
     """Delete an HR policy section"""
     try:
         # Check if section exists
-        existing_section = policy_service.get_section_by_id(section_id)
+        existing_section = await policy_service.get_section_by_id(section_id)
         if not existing_section:
             raise HTTPException(
                 status_code=404, 
@@ -246,7 +341,7 @@ async def delete_policy_section(section_id: str):
                 }
             )
         
-        success = policy_service.delete_section(section_id)
+        success = await policy_service.delete_section(section_id)
         if success:
             return {
                 "status": "success",
@@ -271,7 +366,7 @@ async def delete_policy_section(section_id: str):
 async def get_used_orders():
     """Get list of used order numbers for frontend validation"""
     try:
-        used_orders = policy_service.get_used_orders()
+        used_orders = await policy_service.get_used_orders()
         return {
             "status": "success",
             "used_orders": used_orders
@@ -290,7 +385,7 @@ async def get_used_orders():
 async def get_used_section_ids():
     """Get list of used section IDs for frontend validation"""
     try:
-        used_section_ids = policy_service.get_used_orders()
+        used_section_ids = await policy_service.get_used_orders()
         return {
             "status": "success",
             "used_section_ids": used_section_ids
@@ -313,7 +408,7 @@ async def get_used_section_ids():
 async def create_employee_kb_document(kb_doc: EmployeeKBCreate):
     """Create a new Employee Knowledge Base document"""
     try:
-        doc_id = employee_kb_service.create_document(kb_doc)
+        doc_id = await employee_kb_service.create_document(kb_doc)
         return {
             "status": "success",
             "message": "Employee KB document created successfully",
@@ -334,7 +429,7 @@ async def create_employee_kb_document(kb_doc: EmployeeKBCreate):
 async def get_employee_kb_documents(limit: int = 50):
     """Get all Employee KB documents"""
     try:
-        docs = employee_kb_service.get_all_documents(limit)
+        docs = await employee_kb_service.get_all_documents(limit)
         return docs
         
     except Exception as e:
@@ -351,7 +446,7 @@ async def get_employee_kb_documents(limit: int = 50):
 async def get_employee_kb_document(doc_id: str):
     """Get a specific Employee KB document by ID"""
     try:
-        doc = employee_kb_service.get_document_by_id(doc_id)
+        doc = await employee_kb_service.get_document_by_id(doc_id)
         if not doc:
             raise HTTPException(status_code=404, detail="Employee KB document not found")
         
@@ -373,7 +468,7 @@ async def get_employee_kb_document(doc_id: str):
 async def update_employee_kb_document(doc_id: str, updates: EmployeeKBUpdate):
     """Update an existing Employee KB document"""
     try:
-        success = employee_kb_service.update_document(doc_id, updates)
+        success = await employee_kb_service.update_document(doc_id, updates)
         if success:
             return {
                 "status": "success",
@@ -398,7 +493,7 @@ async def update_employee_kb_document(doc_id: str, updates: EmployeeKBUpdate):
 async def delete_employee_kb_document(doc_id: str):
     """Delete an Employee KB document"""
     try:
-        success = employee_kb_service.delete_document(doc_id)
+        success = await employee_kb_service.delete_document(doc_id)
         if success:
             return {
                 "status": "success",
@@ -425,7 +520,7 @@ async def delete_employee_kb_document(doc_id: str):
 async def get_employee_kb_stats():
     """Get statistics about Employee KB documents"""
     try:
-        stats = employee_kb_service.get_document_stats()
+        stats = await employee_kb_service.get_document_stats()
         return {
             "status": "success",
             "stats": stats
@@ -442,80 +537,18 @@ async def get_employee_kb_stats():
         )
 
 @router.post("/ask", response_model=EnhancedAskResponse)
-async def enhanced_ask(request: EnhancedAskRequest):
-    """Enhanced ask endpoint supporting both onboarding and employee helpdesk scopes"""
+async def enhanced_ask(request: EnhancedAskRequest, x_chat_session_id: Optional[str] = Header(None)):
+    """Enhanced ask endpoint supporting both onboarding and employee helpdesk scopes
+    
+    Questions sent with an X-Chat-Session-ID header are answered as follow-ups
+    of that chat's earlier questions.
+    """
     try:
-        if request.scope == "employee":
-            # Employee Helpdesk Mode - Use specialized helpdesk method
-            try:
-                # Get all documents for context (Global Mode approach)
-                context = employee_kb_service.get_all_documents_for_context()
-                
-                # Process question with AI using the specialized helpdesk method
-                answer = await ai_connector.ask_helpdesk_question(
-                    question=request.message,
-                    context=context,
-                    max_tokens=512
-                )
-                
-                return EnhancedAskResponse(
-                    scope="employee",
-                    answer=answer
-                )
-                
-            except Exception as e:
-                # Fallback to generic response if AI processing fails
-                import logging
-                logger = logging.getLogger(__name__)
-                logger.error(f"Failed to process employee question with AI: {str(e)}")
-                
-                answer = "Employee Helpdesk Mode is active. Ask about insurance, payroll, holidays, IT, reimbursements, etc."
-                
-                return EnhancedAskResponse(
-                    scope="employee",
-                    answer=answer
-                )
-            
-        elif request.scope == "onboarding":
-            # Onboarding Mode - use policy context and AI processing
-            if not request.mode:
-                # Default to global mode if none specified
-                request.mode = "global"
-            
-            # Determine the actual mode to use
-            actual_mode = request.mode
-            if request.mode == "auto":
-                if request.section_id:
-                    actual_mode = "guided"
-                else:
-                    actual_mode = "global"
-            
-            # Get policy context based on mode
-            try:
-                context = policy_service.get_sections_for_context(actual_mode, request.section_id)
-            except ValueError as e:
-                raise HTTPException(status_code=404, detail=str(e))
-            
-            # Ask AI with context
-            answer = await ai_connector.ask_policy_question(
-                question=request.message,
-                context=context,
-                mode=actual_mode,
-                max_tokens=512
-            )
-            
-            return EnhancedAskResponse(
-                scope="onboarding",
-                mode_used=actual_mode,
-                answer=answer
-            )
+        return await ask_service.answer(request, x_chat_session_id)
         
-        else:
-            raise HTTPException(
-                status_code=400, 
-                detail="Invalid scope. Use 'onboarding' or 'employee'"
-            )
-            
+    except ValueError as e:
+        # Requested policy context does not exist
+        raise HTTPException(status_code=404, detail=str(e))
     except HTTPException:
         raise
     except Exception as e:
@@ -528,6 +561,147 @@ async def enhanced_ask(request: EnhancedAskRequest):
             detail="Failed to process request. Please try again."
         )
 
+@router.post("/ask/dry-run", response_model=AskDryRunResponse)
+async def ask_dry_run(request: EnhancedAskRequest, x_chat_session_id: Optional[str] = Header(None)):
+    """Build the context for a question and report the prompt size and cost without calling the AI"""
+    try:
+        return await ask_service.dry_run(request, x_chat_session_id)
+        
+    except ValueError as e:
+        # Requested policy context does not exist
+        raise HTTPException(status_code=404, detail=str(e))
+    except Exception as e:
+        import logging
+        logger = logging.getLogger(__name__)
+        logger.error(f"Failed to process ask dry run: {str(e)}")
+        
+        raise HTTPException(
+            status_code=500,
+            detail="Failed to process request. Please try again."
+        )
+
+@router.post("/ask/batch", response_model=BatchAskResponse)
+async def batch_ask(request: BatchAskRequest):
+    """Answer a list of questions concurrently; results are returned in request order"""
+    try:
+        started = time.perf_counter()
+        concurrency = min(request.concurrency or settings.ASK_BATCH_CONCURRENCY, settings.ASK_BATCH_CONCURRENCY)
+        results = await ask_service.answer_batch(request.items, concurrency)
+        succeeded = sum(1 for result in results if result.status == "ok")
+        
+        return BatchAskResponse(
+            results=results,
+            total=len(results),
+            succeeded=succeeded,
+            failed=len(results) - succeeded,
+            elapsed_ms=round((time.perf_counter() - started) * 1000, 1)
+        )
+        
+    except Exception as e:
+        import logging
+        logger = logging.getLogger(__name__)
+        logger.error(f"Failed to process batch ask request: {str(e)}")
+        
+        raise HTTPException(
+            status_code=500,
+            detail="Failed to process batch request. Please try again."
+        )
+
+@router.post("/ask/stream")
+async def enhanced_ask_stream(request: EnhancedAskRequest, x_chat_session_id: Optional[str] = Header(None)):
+    """Streaming variant of /ask: relays answer tokens as server-sent events"""
+    try:
+        history = await conversation_store.history(x_chat_session_id)
+        ask_context = await ask_service.context_or_fallback(request, history)
+        
+    except ValueError as e:
+        # Requested policy context does not exist
+        raise HTTPException(status_code=404, detail=str(e))
+    except Exception as e:
+        import logging
+        logger = logging.getLogger(__name__)
+        logger.error(f"Failed to prepare streaming ask request: {str(e)}")
+        
+        raise HTTPException(
+            status_code=500,
+            detail="Failed to process request. Please try again."
+        )
+    
+    return StreamingResponse(
+        ask_service.stream(request, ask_context, x_chat_session_id),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@router.get("/ask/cache/stats", response_model=dict)
+async def get_answer_cache_stats():
+    """Get answer cache, semantic cache, shared cache, request coalescing, intent routing, context snapshot, digest and conversation counters for capacity planning"""
+    return {
+        "status": "success",
+        "stats": answer_cache.get_stats(),
+        "semantic_cache": {"enabled": settings.SEMANTIC_CACHE_ENABLED, **semantic_cache.get_stats()},
+        "shared_cache": {
+            **shared_cache.get_stats(),
+            "answers": answer_tiers.get_stats(),
+            "contexts": context_tiers.get_stats()
+        },
+        "single_flight": ask_single_flight.get_stats(),
+        "intent_router": intent_router.get_stats(),
+        "context_snapshots": context_snapshots.get_stats(),
+        "digests": {
+            **digest_worker.get_stats(),
+            "policy_sections": len(policy_service.digests),
+            "kb_documents": len(employee_kb_service.digests)
+        },
+        "conversations": conversation_store.get_stats()
+    }
+
+@router.delete("/ask/sessions/{session_id}", response_model=dict)
+async def clear_conversation(session_id: str):
+    """Forget the conversation of a session (e.g. when the user starts a new chat)"""
+    try:
+        if not await conversation_store.clear(session_id):
+            raise HTTPException(status_code=404, detail="Conversation not found")
+        return {"status": "success", "message": "Conversation cleared"}
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        import logging
+        logger = logging.getLogger(__name__)
+        logger.error(f"Failed to clear conversation {session_id}: {str(e)}")
+        
+        raise HTTPException(
+            status_code=500,
+            detail="Failed to clear conversation. Please try again."
+        )
+
+@router.get("/ai/stats", response_model=dict)
+async def get_ai_resilience_stats():
+    """Get Azure AI retry counters, circuit breaker state and model routing counters"""
+    return {
+        "status": "success",
+        "stats": ai_connector.get_resilience_stats(),
+        "model_router": model_router.get_stats()
+    }
+
+@router.get("/ai/usage", response_model=dict)
+async def get_ai_usage(sort_by: str = "prompt_tokens", limit: int = 50):
+    """Get token, latency and cost totals per scope / mode / section, largest first"""
+    try:
+        return {
+            "status": "success",
+            "stats": usage_tracker.get_report(sort_by=sort_by, limit=max(1, limit))
+        }
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@router.delete("/ai/usage", response_model=dict)
+async def reset_ai_usage():
+    """Reset the usage totals of this worker"""
+    usage_tracker.reset()
+    return {"status": "success", "message": "Usage totals reset"}
+
 # ============================================================================
 # FEEDBACK ENDPOINTS
 # ============================================================================
@@ -537,7 +711,7 @@ async def submit_feedback(feedback: FeedbackCreate):
     """Submit user feedback"""
     try:
         # Create feedback using service
-        feedback_id = feedback_service.create_feedback(feedback)
+        feedback_id = await feedback_service.create_feedback(feedback)
         
         return FeedbackResponse(
             status="success",
@@ -579,10 +753,10 @@ async def get_feedback(
     try:
         if category:
             # Get feedback by category
-            feedback_list = feedback_service.get_feedback_by_category(category, limit)
+            feedback_list = await feedback_service.get_feedback_by_category(category, limit)
         else:
             # Get all feedback with pagination
-            feedback_list = feedback_service.get_feedback(limit, offset)
+            feedback_list = await feedback_service.get_feedback(limit, offset)
         
         return {
             "status": "success",
@@ -608,7 +782,7 @@ async def get_feedback(
 async def get_feedback_by_id(feedback_id: str):
     """Get a specific feedback entry by ID"""
     try:
-        feedback = feedback_service.get_feedback_by_id(feedback_id)
+        feedback = await feedback_service.get_feedback_by_id(feedback_id)
         
         if not feedback:
             raise HTTPException(
@@ -645,7 +819,7 @@ async def get_feedback_by_id(feedback_id: str):
 async def get_feedback_stats():
     """Get feedback statistics and analytics"""
     try:
-        stats = feedback_service.get_feedback_stats()
+        stats = await feedback_service.get_feedback_stats()
         
         return {
             "status": "success",
@@ -670,7 +844,7 @@ async def get_feedback_stats():
 async def delete_feedback(feedback_id: str):
     """Delete a feedback entry by ID"""
     try:
-        success = feedback_service.delete_feedback(feedback_id)
+        success = await feedback_service.delete_feedback(feedback_id)
         
         if success:
             return {
@@ -2,14 +2,41 @@
 Configuration settings for Azure production deployment
 """
 import os
+from pathlib import Path
 from typing import Optional
+from dotenv import load_dotenv
+
+# Load environment variables
+load_dotenv(encoding="utf-8", override=True)
+
+
+def _optional_bool(value: Optional[str]) -> Optional[bool]:
+    """Parse an optional boolean env var, keeping None when it is unset"""
+    if value is None or value == "":
+        return None
+    return value.lower() == "true"
+
 
 class Settings:
     """Application settings for production deployment"""
     
     # Database Configuration
+    MONGO_URI: Optional[str] = os.getenv("MONGO_URI")
+    MONGO_DB: Optional[str] = os.getenv("MONGO_DB")
     MONGODB_URL: str = os.getenv("MONGODB_URL", "mongodb://localhost:27017")
-    MONGODB_DATABASE: str = os.getenv("MONGODB_DATABASE", "hr_onboarding")
+    MONGODB_DATABASE: str = os.getenv("MONGODB_DATABASE", "onboarding_bot")
+    
+    # Connection Pool Configuration (one shared pool per worker process)
+    MONGO_MAX_POOL_SIZE: int = int(os.getenv("MONGO_MAX_POOL_SIZE", "10"))
+    MONGO_MIN_POOL_SIZE: int = int(os.getenv("MONGO_MIN_POOL_SIZE", "0"))
+    MONGO_MAX_IDLE_TIME_MS: int = int(os.getenv("MONGO_MAX_IDLE_TIME_MS", "120000"))
+    MONGO_WAIT_QUEUE_TIMEOUT_MS: int = int(os.getenv("MONGO_WAIT_QUEUE_TIMEOUT_MS", "10000"))
+    MONGO_SERVER_SELECTION_TIMEOUT_MS: int = int(os.getenv("MONGO_SERVER_SELECTION_TIMEOUT_MS", "5000"))
+    MONGO_CONNECT_TIMEOUT_MS: int = int(os.getenv("MONGO_CONNECT_TIMEOUT_MS", "10000"))
+    MONGO_SOCKET_TIMEOUT_MS: int = int(os.getenv("MONGO_SOCKET_TIMEOUT_MS", "20000"))
+    # Unset means "use the connection string / driver default" (Cosmos requires retrywrites=false)
+    MONGO_RETRY_WRITES: Optional[bool] = _optional_bool(os.getenv("MONGO_RETRY_WRITES"))
+    MONGO_RETRY_READS: Optional[bool] = _optional_bool(os.getenv("MONGO_RETRY_READS"))
     
     # Cosmos DB Configuration (MongoDB API)
     COSMOS_DB_CONNECTION_STRING: Optional[str] = os.getenv("COSMOS_DB_CONNECTION_STRING")
@@ -18,6 +45,114 @@ class Settings:
     COSMOS_DB_COLLECTION_POLICIES: str = os.getenv("COSMOS_DB_COLLECTION_POLICIES", "policies")
     COSMOS_DB_COLLECTION_EMPLOYEE_KB: str = os.getenv("COSMOS_DB_COLLECTION_EMPLOYEE_KB", "employee_kb")
     
+    # Retrieval Configuration (context selection for /api/ask global mode)
+    RETRIEVAL_ENABLED: bool = os.getenv("RETRIEVAL_ENABLED", "true").lower() == "true"
+    RETRIEVAL_TOP_K: int = int(os.getenv("RETRIEVAL_TOP_K", "8"))
+    RETRIEVAL_CONTEXT_CHAR_BUDGET: int = int(os.getenv("RETRIEVAL_CONTEXT_CHAR_BUDGET", "12000"))
+    RETRIEVAL_CHUNK_SIZE: int = int(os.getenv("RETRIEVAL_CHUNK_SIZE", "1200"))
+    RETRIEVAL_CHUNK_OVERLAP: int = int(os.getenv("RETRIEVAL_CHUNK_OVERLAP", "200"))
+    # Full rebuild interval so each worker picks up writes made by other workers
+    RETRIEVAL_INDEX_REFRESH_SECONDS: int = int(os.getenv("RETRIEVAL_INDEX_REFRESH_SECONDS", "300"))
+    
+    # Embedding Store Configuration (semantic retrieval alongside BM25)
+    EMBEDDINGS_ENABLED: bool = os.getenv("EMBEDDINGS_ENABLED", "true").lower() == "true"
+    EMBEDDING_PROVIDER: str = os.getenv("EMBEDDING_PROVIDER", "hashing")  # "hashing" (offline) or "azure"
+    EMBEDDING_DIMENSION: int = int(os.getenv("EMBEDDING_DIMENSION", "384"))
+    EMBEDDING_STORE_DIR: str = os.getenv(
+        "EMBEDDING_STORE_DIR",
+        str(Path(__file__).resolve().parent.parent / "data" / "embeddings")
+    )
+    AZURE_AI_EMBEDDING_DEPLOYMENT: Optional[str] = os.getenv("AZURE_AI_EMBEDDING_DEPLOYMENT")
+    
+    # Answer Cache Configuration (/api/ask)
+    ANSWER_CACHE_ENABLED: bool = os.getenv("ANSWER_CACHE_ENABLED", "true").lower() == "true"
+    ANSWER_CACHE_MAX_ENTRIES: int = int(os.getenv("ANSWER_CACHE_MAX_ENTRIES", "1000"))
+    ANSWER_CACHE_MAX_BYTES: int = int(os.getenv("ANSWER_CACHE_MAX_BYTES", str(8 * 1024 * 1024)))
+    ANSWER_CACHE_TTL_SECONDS: int = int(os.getenv("ANSWER_CACHE_TTL_SECONDS", "3600"))
+    
+    # Shared L2 cache (Redis protocol, needs the `redis` package) behind the in-process answer / context caches
+    REDIS_URL: Optional[str] = os.getenv("REDIS_URL")  # e.g. rediss://:<key>@<name>.redis.cache.windows.net:6380/0
+    REDIS_KEY_PREFIX: str = os.getenv("REDIS_KEY_PREFIX", "hr-onboarding")
+    REDIS_TIMEOUT_SECONDS: float = float(os.getenv("REDIS_TIMEOUT_SECONDS", "0.5"))
+    REDIS_CONTEXT_TTL_SECONDS: int = int(os.getenv("REDIS_CONTEXT_TTL_SECONDS", "3600"))
+    
+    # Near-duplicate question cache (MinHash / LSH) in front of the AI; tune with evaluate_semantic_cache.py
+    SEMANTIC_CACHE_ENABLED: bool = os.getenv("SEMANTIC_CACHE_ENABLED", "false").lower() == "true"
+    SEMANTIC_CACHE_THRESHOLD: float = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.7"))  # Jaccard similarity of question terms
+    SEMANTIC_CACHE_MAX_ENTRIES: int = int(os.getenv("SEMANTIC_CACHE_MAX_ENTRIES", "2000"))
+    SEMANTIC_CACHE_TTL_SECONDS: int = int(os.getenv("SEMANTIC_CACHE_TTL_SECONDS", "3600"))
+    
+    # Global-mode digests: compact per-document summaries written in the background
+    GLOBAL_DIGESTS_ENABLED: bool = os.getenv("GLOBAL_DIGESTS_ENABLED", "true").lower() == "true"
+    GLOBAL_DIGEST_MAX_TOKENS: int = int(os.getenv("GLOBAL_DIGEST_MAX_TOKENS", "80"))
+    GLOBAL_DIGEST_MIN_TOKENS: int = int(os.getenv("GLOBAL_DIGEST_MIN_TOKENS", "2000"))  # smaller corpora are sent in full
+    GLOBAL_DIGEST_FULL_DOCUMENTS: int = int(os.getenv("GLOBAL_DIGEST_FULL_DOCUMENTS", "2"))
+    
+    # Pre-rendered prompt prefixes per scope / mode / section, rebuilt after writes
+    CONTEXT_SNAPSHOTS_ENABLED: bool = os.getenv("CONTEXT_SNAPSHOTS_ENABLED", "true").lower() == "true"
+    
+    # Conversation memory per X-Chat-Session-ID: recent turns plus a rolling summary of older ones
+    CONVERSATIONS_ENABLED: bool = os.getenv("CONVERSATIONS_ENABLED", "true").lower() == "true"
+    CONVERSATION_WINDOW_TOKENS: int = int(os.getenv("CONVERSATION_WINDOW_TOKENS", "800"))
+    CONVERSATION_MAX_TURNS: int = int(os.getenv("CONVERSATION_MAX_TURNS", "6"))
+    CONVERSATION_SUMMARY_MAX_TOKENS: int = int(os.getenv("CONVERSATION_SUMMARY_MAX_TOKENS", "200"))
+    CONVERSATION_TTL_SECONDS: int = int(os.getenv("CONVERSATION_TTL_SECONDS", "1800"))
+    CONVERSATION_MAX_SESSIONS: int = int(os.getenv("CONVERSATION_MAX_SESSIONS", "5000"))
+    CONVERSATION_PERSIST: bool = os.getenv("CONVERSATION_PERSIST", "false").lower() == "true"  # also keep sessions in MongoDB
+    
+    # Coalesce identical in-flight /api/ask completions
+    AI_SINGLE_FLIGHT_ENABLED: bool = os.getenv("AI_SINGLE_FLIGHT_ENABLED", "true").lower() == "true"
+    
+    # Answer navigational onboarding questions ("what is step 4") without the AI
+    INTENT_ROUTER_ENABLED: bool = os.getenv("INTENT_ROUTER_ENABLED", "true").lower() == "true"
+    
+    # Extractive answers from the policies / KB when the AI cannot answer (and optional fast path)
+    EXTRACTIVE_FALLBACK_ENABLED: bool = os.getenv("EXTRACTIVE_FALLBACK_ENABLED", "true").lower() == "true"
+    EXTRACTIVE_FALLBACK_AFTER_SECONDS: float = float(os.getenv("EXTRACTIVE_FALLBACK_AFTER_SECONDS", "20"))  # 0 waits for the AI
+    EXTRACTIVE_MIN_CONFIDENCE: float = float(os.getenv("EXTRACTIVE_MIN_CONFIDENCE", "0.3"))
+    EXTRACTIVE_FAST_PATH_ENABLED: bool = os.getenv("EXTRACTIVE_FAST_PATH_ENABLED", "false").lower() == "true"
+    EXTRACTIVE_FAST_PATH_CONFIDENCE: float = float(os.getenv("EXTRACTIVE_FAST_PATH_CONFIDENCE", "0.85"))
+    
+    # /api/ask/batch fan-out
+    ASK_BATCH_CONCURRENCY: int = int(os.getenv("ASK_BATCH_CONCURRENCY", "8"))
+    
+    # Prompt Token Budget (context window of the Azure deployment)
+    AI_CONTEXT_WINDOW: int = int(os.getenv("AI_CONTEXT_WINDOW", "128000"))
+    AI_PROMPT_TOKEN_BUDGET: int = int(os.getenv("AI_PROMPT_TOKEN_BUDGET", "6000"))
+    AI_TOKENIZER_ENCODING: str = os.getenv("AI_TOKENIZER_ENCODING", "o200k_base")  # used when tiktoken is installed
+    
+    # Azure AI Resilience (retries with backoff, circuit breaker)
+    AI_RETRY_MAX_ATTEMPTS: int = int(os.getenv("AI_RETRY_MAX_ATTEMPTS", "3"))
+    AI_RETRY_BASE_DELAY: float = float(os.getenv("AI_RETRY_BASE_DELAY", "0.5"))
+    AI_RETRY_MAX_DELAY: float = float(os.getenv("AI_RETRY_MAX_DELAY", "8"))
+    AI_REQUEST_DEADLINE_SECONDS: float = float(os.getenv("AI_REQUEST_DEADLINE_SECONDS", "45"))
+    AI_BREAKER_FAILURE_THRESHOLD: int = int(os.getenv("AI_BREAKER_FAILURE_THRESHOLD", "5"))
+    AI_BREAKER_RECOVERY_SECONDS: float = float(os.getenv("AI_BREAKER_RECOVERY_SECONDS", "30"))
+    AI_BREAKER_HALF_OPEN_CALLS: int = int(os.getenv("AI_BREAKER_HALF_OPEN_CALLS", "1"))
+    
+    # Azure AI Rate Limiting (per worker process; 0 disables a bucket)
+    AI_RATE_LIMIT_RPM: int = int(os.getenv("AI_RATE_LIMIT_RPM", "0"))
+    AI_RATE_LIMIT_TPM: int = int(os.getenv("AI_RATE_LIMIT_TPM", "0"))
+    AI_RATE_LIMIT_MAX_WAIT_SECONDS: float = float(os.getenv("AI_RATE_LIMIT_MAX_WAIT_SECONDS", "10"))
+    
+    # Azure AI Deployments (AZURE_AI_DEPLOYMENTS is an optional JSON list for a multi-region pool)
+    AZURE_AI_ENDPOINT: Optional[str] = os.getenv("AZURE_AI_ENDPOINT")
+    AZURE_AI_API_KEY: Optional[str] = os.getenv("AZURE_AI_API_KEY")
+    AZURE_AI_DEPLOYMENT: str = os.getenv("AZURE_AI_DEPLOYMENT", "hr-onboarding-gpt4")
+    AZURE_AI_DEPLOYMENTS: Optional[str] = os.getenv("AZURE_AI_DEPLOYMENTS")
+    AI_POOL_EWMA_ALPHA: float = float(os.getenv("AI_POOL_EWMA_ALPHA", "0.2"))
+    
+    # Route simple questions to a fast deployment (tier "fast" in AZURE_AI_DEPLOYMENTS, or AZURE_AI_FAST_DEPLOYMENT)
+    AZURE_AI_FAST_DEPLOYMENT: Optional[str] = os.getenv("AZURE_AI_FAST_DEPLOYMENT")
+    MODEL_ROUTER_ENABLED: bool = os.getenv("MODEL_ROUTER_ENABLED", "true").lower() == "true"
+    MODEL_ROUTER_FAST_MAX_WORDS: int = int(os.getenv("MODEL_ROUTER_FAST_MAX_WORDS", "20"))
+    MODEL_ROUTER_FAST_MAX_PROMPT_TOKENS: int = int(os.getenv("MODEL_ROUTER_FAST_MAX_PROMPT_TOKENS", "3000"))
+    MODEL_ROUTER_MIN_CONFIDENCE: float = float(os.getenv("MODEL_ROUTER_MIN_CONFIDENCE", "0.5"))
+    
+    # Azure AI usage accounting (/api/ai/usage); prices per 1K tokens, 0 leaves cost at 0
+    AI_PROMPT_COST_PER_1K_TOKENS: float = float(os.getenv("AI_PROMPT_COST_PER_1K_TOKENS", "0"))
+    AI_COMPLETION_COST_PER_1K_TOKENS: float = float(os.getenv("AI_COMPLETION_COST_PER_1K_TOKENS", "0"))
+    
     # AI Configuration
     OPENAI_API_KEY: Optional[str] = os.getenv("OPENAI_API_KEY")
     AI_MODEL: str = os.getenv("AI_MODEL", "gpt-3.5-turbo")
@@ -38,12 +173,26 @@ class Settings:
     # File Storage Configuration
     EXCEL_FILE_PATH: str = os.getenv("EXCEL_FILE_PATH", "/tmp/onboarded_employees.xlsx")
     
+    # Excel export outbox: /api/onboard queues the row, a background worker appends batches
+    EXPORT_QUEUE_ENABLED: bool = os.getenv("EXPORT_QUEUE_ENABLED", "true").lower() == "true"
+    EXPORT_BATCH_SIZE: int = int(os.getenv("EXPORT_BATCH_SIZE", "100"))
+    EXPORT_POLL_SECONDS: float = float(os.getenv("EXPORT_POLL_SECONDS", "5"))
+    EXPORT_MAX_ATTEMPTS: int = int(os.getenv("EXPORT_MAX_ATTEMPTS", "8"))
+    EXPORT_RETRY_BASE_SECONDS: float = float(os.getenv("EXPORT_RETRY_BASE_SECONDS", "2"))
+    EXPORT_RETRY_MAX_SECONDS: float = float(os.getenv("EXPORT_RETRY_MAX_SECONDS", "300"))
+    EXPORT_CLAIM_TIMEOUT_SECONDS: int = int(os.getenv("EXPORT_CLAIM_TIMEOUT_SECONDS", "300"))  # reclaim batches of a crashed worker
+    EXPORT_RETENTION_DAYS: int = int(os.getenv("EXPORT_RETENTION_DAYS", "30"))  # exported entries are then deleted
+    EMPLOYEE_EXPORT_BATCH_SIZE: int = int(os.getenv("EMPLOYEE_EXPORT_BATCH_SIZE", "500"))  # /api/employees/export cursor batch
+    EXPORT_API_KEY: Optional[str] = os.getenv("EXPORT_API_KEY")  # required as X-Export-API-Key; unset disables /api/employees/export
+    
     # Logging Configuration
     LOG_LEVEL: str = os.getenv("LOG_LEVEL", "INFO")
     
     @property
     def database_url(self) -> str:
         """Get the appropriate database URL based on environment"""
+        if self.MONGO_URI:
+            return self.MONGO_URI
         if self.COSMOS_DB_CONNECTION_STRING:
             return self.COSMOS_DB_CONNECTION_STRING
         return self.MONGODB_URL
@@ -51,6 +200,8 @@ class Settings:
     @property
     def database_name(self) -> str:
         """Get the appropriate database name based on environment"""
+        if self.MONGO_DB:
+            return self.MONGO_DB
         if self.COSMOS_DB_CONNECTION_STRING:
             return self.COSMOS_DB_DATABASE_NAME
         return self.MONGODB_DATABASE
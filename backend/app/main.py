@@ -1,12 +1,42 @@
+import logging
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from .api.routes import router
+from .services.cosmos_connection import cosmos_connection
+from .services.ai_connector import cleanup_ai_connector
+from .services.digest import digest_worker
+from .services.shared_cache import shared_cache
+from .services.export_queue import export_queue
+
+logger = logging.getLogger(__name__)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Open shared resources on startup and release them on shutdown"""
+    try:
+        await cosmos_connection.connect()
+    except Exception as e:
+        # Keep serving; services retry through the shared client on first use
+        logger.error(f"Database unavailable at startup: {str(e)}")
+    digest_worker.start()
+    shared_cache.start()
+    export_queue.start()
+    
+    yield
+    
+    await digest_worker.stop()
+    await shared_cache.stop()
+    await export_queue.stop()
+    await cleanup_ai_connector()
+    cosmos_connection.close()
 
 # Create FastAPI app
 app = FastAPI(
     title="HR Onboarding Backend",
     description="Backend API for HR Onboarding Chatbot",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
 # Configure CORS
@@ -23,4 +23,4 @@ class Employee(BaseModel):
 class EmployeeResponse(BaseModel):
     status: str
     id: str
-    excel_export: str  # "ok" or "failed"
+    excel_export: str  # "queued", "ok" or "failed"
@@ -1,6 +1,6 @@
 import re
 from datetime import datetime
-from typing import Optional
+from typing import List, Optional
 from pydantic import BaseModel, Field, field_validator, ValidationInfo
 
 
@@ -9,6 +9,10 @@ class PolicySection(BaseModel):
     title: str = Field(..., min_length=1, max_length=150, description="Title of the policy section")
     content: str = Field(..., min_length=1, max_length=20000, description="Full content of the policy section")
     order: int = Field(..., ge=1, description="Order/step number (minimum 1)")
+    token_count: Optional[int] = Field(None, description="Estimated prompt tokens of the content, cached at write time")
+    digest: Optional[str] = Field(None, description="Short summary used in global-mode prompts, written in the background")
+    digest_token_count: Optional[int] = Field(None, description="Estimated prompt tokens of the digest")
+    digest_hash: Optional[str] = Field(None, description="Hash of the content the digest was made from")
     updated_at: Optional[datetime] = Field(None, description="Last update timestamp")
 
     @field_validator('section_id')
@@ -63,6 +67,10 @@ class EmployeeKB(BaseModel):
     title: str = Field(..., min_length=1, max_length=200, description="Title of the KB document")
     content: str = Field(..., min_length=1, max_length=50000, description="Full content of the KB document")
     effective_from: datetime = Field(default_factory=lambda: datetime.now(), description="When this document becomes effective")
+    token_count: Optional[int] = Field(None, description="Estimated prompt tokens of the content, cached at write time")
+    digest: Optional[str] = Field(None, description="Short summary used in global-mode prompts, written in the background")
+    digest_token_count: Optional[int] = Field(None, description="Estimated prompt tokens of the digest")
+    digest_hash: Optional[str] = Field(None, description="Hash of the content the digest was made from")
 
     created_at: datetime = Field(default_factory=lambda: datetime.now(), description="Creation timestamp")
     updated_at: Optional[datetime] = Field(None, description="Last update timestamp")
@@ -134,4 +142,54 @@ class EnhancedAskResponse(BaseModel):
     scope: str = Field(..., description="The scope that was used")
     mode_used: Optional[str] = Field(None, description="Mode used (only for onboarding scope)")
     answer: str = Field(..., description="The AI-generated answer")
+    cached: bool = Field(False, description="Whether the answer was served from the answer cache")
+    prompt_tokens: Optional[int] = Field(None, description="Estimated prompt tokens sent to the model for this question")
+    source: str = Field("ai", description="'ai', 'extractive' when the answer quotes the policies / KB directly, or 'intent' for navigational questions")
+    references: Optional[List[str]] = Field(None, description="Sections or documents quoted by an extractive or navigational answer")
     timestamp: datetime = Field(default_factory=lambda: datetime.now(), description="Response timestamp")
+
+
+class BatchAskRequest(BaseModel):
+    """Request model for /api/ask/batch"""
+    items: List[EnhancedAskRequest] = Field(..., min_length=1, max_length=200, description="Questions to answer, in order")
+    concurrency: Optional[int] = Field(None, ge=1, description="Max questions answered at once (capped by ASK_BATCH_CONCURRENCY)")
+
+
+class BatchAskItemResult(BaseModel):
+    """Result for one item of a batch, at the same position as the request item"""
+    index: int = Field(..., description="Position of the item in the request")
+    status: str = Field(..., description="'ok', 'not_found' (context missing) or 'error' (AI failure)")
+    scope: str = Field(..., description="The scope that was used")
+    mode_used: Optional[str] = Field(None, description="Mode used (only for onboarding scope)")
+    answer: Optional[str] = Field(None, description="The AI-generated answer when status is 'ok'")
+    error: Optional[str] = Field(None, description="Error message when status is not 'ok'")
+    cached: bool = Field(False, description="Whether the answer was served from the answer cache")
+    prompt_tokens: Optional[int] = Field(None, description="Estimated prompt tokens sent to the model for this question")
+    latency_ms: float = Field(0.0, description="Time spent on this item, including queueing")
+
+
+class BatchAskResponse(BaseModel):
+    """Response model for /api/ask/batch"""
+    results: List[BatchAskItemResult]
+    total: int
+    succeeded: int
+    failed: int
+    elapsed_ms: float
+
+
+class AskDryRunResponse(BaseModel):
+    """Prompt that /api/ask would send for a question, sized without calling the model"""
+    scope: str = Field(..., description="The scope that was used")
+    mode_used: Optional[str] = Field(None, description="Mode used (only for onboarding scope)")
+    section_id: Optional[str] = Field(None, description="Section the context was taken from (guided mode)")
+    prompt_tokens: int = Field(..., description="Estimated prompt tokens, after context truncation")
+    template_tokens: int = Field(..., description="Tokens of the system prompt template without context")
+    question_tokens: int = Field(..., description="Tokens of the question")
+    history_tokens: int = Field(0, description="Tokens of the earlier conversation sent with the question (X-Chat-Session-ID)")
+    context_tokens: int = Field(..., description="Tokens of the context that would be sent")
+    context_chars: int = Field(..., description="Characters of the context that would be sent")
+    context_truncated: bool = Field(..., description="Whether the context would be cut to fit the prompt budget")
+    max_tokens: int = Field(..., description="Completion tokens reserved for the answer")
+    prompt_token_budget: int = Field(..., description="Largest prompt allowed in the context window")
+    context_window: int = Field(..., description="Configured model context window (AI_CONTEXT_WINDOW)")
+    estimated_prompt_cost: float = Field(..., description="prompt_tokens priced at AI_PROMPT_COST_PER_1K_TOKENS")
@@ -1,10 +1,18 @@
-import os
+import json
+import time
 import logging
 import httpx
 import asyncio
-from typing import Dict, Any, Optional
+from dataclasses import dataclass
+from typing import Dict, Any, AsyncIterator, List, Optional, Sequence, Tuple
 from dotenv import load_dotenv
 
+from ..config import settings
+from .deployment_pool import API_VERSION, TIER_LARGE, DeploymentMember, load_deployment_pool
+from .rate_limiter import PRIORITY_ONBOARDING, RateLimitExceeded, Reservation, request_priority
+from .resilience import RetryPolicy, RETRYABLE_STATUS_CODES, parse_retry_after
+from .token_budget import MESSAGE_OVERHEAD_TOKENS, count_tokens, prompt_token_budget, truncate_to_tokens
+
 # Load environment variables
 load_dotenv(encoding="utf-8", override=True)
 
@@ -12,37 +20,87 @@ load_dotenv(encoding="utf-8", override=True)
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+class AIServiceError(Exception):
+    """Raised when the AI service could not produce an answer; the message is safe to show to users"""
+
+class AIUnavailableError(AIServiceError):
+    """Raised without calling Azure while every circuit breaker is open or the rate limiter is saturated"""
+
+@dataclass
+class CompletionStats:
+    """Token usage and upstream latency of one completion, filled in for usage accounting"""
+    estimated_prompt_tokens: int = 0
+    prompt_tokens: Optional[int] = None
+    completion_tokens: Optional[int] = None
+    latency_seconds: Optional[float] = None
+    first_token_seconds: Optional[float] = None
+    deployment: Optional[str] = None
+
+@dataclass(frozen=True)
+class RenderedPrompt:
+    """System prompt rendered ahead of time for a context known to fit the prompt budget"""
+    system_prompt: str
+    context_tokens: int
+
+def _header_int(headers: httpx.Headers, name: str) -> Optional[int]:
+    """Integer value of a response header, if present and numeric"""
+    try:
+        return int(headers[name])
+    except (KeyError, ValueError):
+        return None
+
 class AIConnector:
     def __init__(self):
-        # Get Azure OpenAI configuration
-        self.azure_resource = os.getenv("AZURE_AI_ENDPOINT", "").replace("https://", "").replace("http://", "").split("/")[0]
-        self.azure_api_key = os.getenv("AZURE_AI_API_KEY")
-        self.azure_deployment = os.getenv("AZURE_AI_DEPLOYMENT", "hr-onboarding-gpt4")
-        self.api_version = "2024-12-01-preview"
+        # Deployments to route completions to (one unless AZURE_AI_DEPLOYMENTS is set)
+        self.pool = load_deployment_pool()
+        self.api_version = API_VERSION
         
-        # Build the complete endpoint URL
-        if self.azure_resource and self.azure_deployment:
-            self.azure_endpoint = f"https://{self.azure_resource}/openai/deployments/{self.azure_deployment}/chat/completions?api-version={self.api_version}"
-        else:
-            self.azure_endpoint = None
+        # The primary member backs the single-endpoint attributes (also used for embeddings)
+        primary = self.pool.primary
+        self.azure_resource = primary.resource if primary else ""
+        self.azure_base_url = primary.base_url if primary else ""
+        self.azure_api_key = primary.api_key if primary else settings.AZURE_AI_API_KEY
+        self.azure_deployment = primary.deployment if primary else settings.AZURE_AI_DEPLOYMENT
+        self.azure_endpoint = primary.endpoint if primary else None
         
         # Initialize shared HTTP client with HTTP/2 and connection pooling
         self._client: Optional[httpx.AsyncClient] = None
         self._client_lock = asyncio.Lock()
+        
+        # Retries with backoff and failover; each member has its own circuit
+        # breaker and RPM/TPM rate limiter
+        self.retry_policy = RetryPolicy(
+            max_attempts=settings.AI_RETRY_MAX_ATTEMPTS,
+            base_delay=settings.AI_RETRY_BASE_DELAY,
+            max_delay=settings.AI_RETRY_MAX_DELAY,
+            deadline_seconds=settings.AI_REQUEST_DEADLINE_SECONDS
+        )
+        self.resilience_stats = {"requests": 0, "attempts": 0, "retries": 0, "failovers": 0, "exhausted": 0, "short_circuited": 0}
+        
+        # Token counts of the empty system prompt per (scope, mode)
+        self._template_tokens: Dict[Tuple[str, str], int] = {}
     
     async def _get_client(self) -> httpx.AsyncClient:
         """Get or create the shared HTTP client"""
         if self._client is None:
             async with self._client_lock:
                 if self._client is None:
+                    limits = httpx.Limits(
+                        max_keepalive_connections=20,
+                        max_connections=100,
+                        keepalive_expiry=30.0
+                    )
+                    # Each pool member's resource gets its own connection pool
+                    mounts = {
+                        member.base_url: httpx.AsyncHTTPTransport(http2=True, limits=limits)
+                        for member in self.pool.members
+                    }
+                    
                     # Create client with HTTP/2, connection pooling, and gzip
                     self._client = httpx.AsyncClient(
                         http2=True,  # HTTP/2 enabled with h2 package
-                        limits=httpx.Limits(
-                            max_keepalive_connections=20,
-                            max_connections=100,
-                            keepalive_expiry=30.0
-                        ),
+                        limits=limits,
+                        mounts=mounts,
                         timeout=httpx.Timeout(
                             connect=5.0,  # Shorter connect timeout
                             read=30.0,   # Reasonable read timeout
@@ -83,81 +141,9 @@ Please answer the employee's question based on the above policy information."""
         
         return base_prompt.format(context=context, mode=mode)
     
-    async def ask_ai(self, question: str, context: str = "", mode: str = "global", max_tokens: int = 512) -> str:
-        """Send question to Azure AI with policy context and return answer"""
-        try:
-            # Check if Azure AI is configured
-            if not self.azure_endpoint or not self.azure_api_key:
-                logger.error(f"Azure AI not configured. Endpoint: {self.azure_endpoint}, API Key: {'Set' if self.azure_api_key else 'Not Set'}")
-                return "AI is not configured yet. Please check AZURE_AI_ENDPOINT and AZURE_AI_API_KEY in .env."
-            
-            logger.info(f"Calling Azure AI deployment: {self.azure_deployment} (mode: {mode})")
-            
-            # Generate system prompt with context
-            system_prompt = self._get_system_prompt(context, mode)
-            
-            # Prepare request with enhanced context
-            headers = {
-                "api-key": self.azure_api_key,
-                "Content-Type": "application/json"
-            }
-            
-            payload = {
-                "messages": [
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": question}
-                ],
-                "max_tokens": max_tokens,
-                "temperature": 0.7,
-                "top_p": 1.0,
-                "model": self.azure_deployment
-            }
-            
-            # Get shared client and make request
-            client = await self._get_client()
-            response = await client.post(
-                self.azure_endpoint,
-                json=payload,
-                headers=headers
-            )
-            
-            if response.status_code == 200:
-                data = response.json()
-                # Log only essential info, not full response
-                logger.info(f"Azure AI response received (status: {response.status_code}, latency: {response.elapsed.total_seconds():.2f}s)")
-                
-                # Handle different response formats
-                if "choices" in data and len(data["choices"]) > 0:
-                    answer = data["choices"][0]["message"]["content"]
-                elif "answer" in data:
-                    answer = data["answer"]
-                else:
-                    answer = "No answer received from AI service."
-                    logger.warning(f"Unexpected response format: {list(data.keys())}")
-                
-                logger.info(f"AI question answered successfully in {mode} mode")
-                return answer
-            else:
-                error_detail = response.text if response.text else "No error details"
-                logger.error(f"Azure AI returned status {response.status_code}: {error_detail[:200]}...")
-                return f"AI service returned error: {response.status_code}. Details: {error_detail}"
-                
-        except httpx.TimeoutException:
-            logger.error("Timeout while calling Azure AI service")
-            return "AI service request timed out. Please try again."
-        except Exception as e:
-            logger.error(f"Error calling Azure AI service: {str(e)}")
-            return "Error connecting to AI service. Please try again later."
-    
-    async def ask_policy_question(self, question: str, context: str, mode: str = "auto", max_tokens: int = 512) -> str:
-        """Specialized method for policy questions with context"""
-        return await self.ask_ai(question, context, mode, max_tokens)
-    
-    async def ask_helpdesk_question(self, question: str, context: str, max_tokens: int = 512) -> str:
-        """Specialized method for employee helpdesk questions with SOP context and company information"""
-        try:
-            # Enhanced helpdesk prompt with company information capability
-            helpdesk_prompt = f"""You are an Employee Helpdesk Assistant for a company. Your role is to provide accurate, helpful, and professional answers to employee questions about company procedures, benefits, support, and general company information.
+    def _get_helpdesk_prompt(self, context: str) -> str:
+        """Generate the employee helpdesk system prompt with SOP context and company information"""
+        return f"""You are an Employee Helpdesk Assistant for a company. Your role is to provide accurate, helpful, and professional answers to employee questions about company procedures, benefits, support, and general company information.
 
 IMPORTANT RULES:
 1. For SOP/procedure questions: Only answer based on the provided SOP content - do not make up information
@@ -186,59 +172,452 @@ You have access to general company information and can help with:
 - General workplace etiquette
 
 Please answer the employee's question based on the above information. If it's an SOP-specific question, use the provided content. If it's a general company question, provide helpful guidance based on common HR knowledge."""
+    
+    def _ensure_configured(self):
+        """Raise AIServiceError if the Azure endpoint or key is missing"""
+        if not self.pool.members or not all(member.api_key for member in self.pool.members):
+            logger.error(f"Azure AI not configured. Endpoint: {self.azure_endpoint}, API Key: {'Set' if self.azure_api_key else 'Not Set'}")
+            raise AIServiceError("AI is not configured yet. Please check AZURE_AI_ENDPOINT and AZURE_AI_API_KEY in .env.")
+    
+    def _build_system_prompt(self, context: str, scope: str, mode: str) -> Tuple[str, str]:
+        """Return (system prompt, log label) for a scope ('onboarding' or 'employee')"""
+        if scope == "employee":
+            return self._get_helpdesk_prompt(context), "helpdesk"
+        return self._get_system_prompt(context, mode), f"mode: {mode}"
+    
+    @staticmethod
+    def history_tokens(history: Optional[Sequence[Dict[str, str]]]) -> int:
+        """Tokens of the earlier conversation messages sent before the question"""
+        return sum(count_tokens(message["content"]) + MESSAGE_OVERHEAD_TOKENS for message in history or ())
+    
+    def _prompt_overhead_tokens(self, question: str, scope: str, mode: str,
+                                history: Optional[Sequence[Dict[str, str]]] = None) -> int:
+        """Tokens used by everything in the prompt except the context"""
+        key = (scope, mode)
+        if key not in self._template_tokens:
+            self._template_tokens[key] = count_tokens(self._build_system_prompt("", scope, mode)[0])
+        return self._template_tokens[key] + count_tokens(question) + 2 * MESSAGE_OVERHEAD_TOKENS + self.history_tokens(history)
+    
+    def context_token_budget(self, question: str, scope: str = "onboarding", mode: str = "global", max_tokens: int = 512,
+                             history: Optional[Sequence[Dict[str, str]]] = None) -> int:
+        """Tokens left for context after the prompt template, the conversation history, the question and max_tokens"""
+        return max(0, prompt_token_budget(max_tokens) - self._prompt_overhead_tokens(question, scope, mode, history))
+    
+    def estimate_prompt_tokens(self, question: str, context: str, scope: str = "onboarding", mode: str = "global",
+                               context_tokens: Optional[int] = None, history: Optional[Sequence[Dict[str, str]]] = None) -> int:
+        """Estimated prompt tokens for a question and context (pass context_tokens if already counted)"""
+        if context_tokens is None:
+            context_tokens = count_tokens(context)
+        return self._prompt_overhead_tokens(question, scope, mode, history) + context_tokens
+    
+    def render_prompt(self, context: str, scope: str = "onboarding", mode: str = "global") -> RenderedPrompt:
+        """Render the system prompt for a context once, for reuse across questions"""
+        return RenderedPrompt(self._build_system_prompt(context, scope, mode)[0], count_tokens(context))
+    
+    def _prepare_prompt(self, question: str, context: str, scope: str, mode: str, max_tokens: int,
+                        prompt: Optional[RenderedPrompt], history: Optional[Sequence[Dict[str, str]]] = None) -> Tuple[str, str, int]:
+        """(system prompt, log label, estimated prompt tokens), reusing a pre-rendered prompt when given"""
+        label = "helpdesk" if scope == "employee" else f"mode: {mode}"
+        if prompt is not None:
+            return prompt.system_prompt, label, self.estimate_prompt_tokens(
+                question, context, scope, mode, prompt.context_tokens, history
+            )
+        context = self._fit_context(question, context, scope, mode, max_tokens, history)
+        system_prompt, label = self._build_system_prompt(context, scope, mode)
+        return system_prompt, label, self.estimate_prompt_tokens(question, context, scope, mode, history=history)
+    
+    def describe_prompt(self, question: str, context: str, scope: str = "onboarding", mode: str = "global", max_tokens: int = 512,
+                        history: Optional[Sequence[Dict[str, str]]] = None) -> Dict[str, Any]:
+        """Size of the prompt that would be sent for a question, without calling the model"""
+        fitted = self._fit_context(question, context, scope, mode, max_tokens, history)
+        overhead = self._prompt_overhead_tokens(question, scope, mode, history)
+        context_tokens = count_tokens(fitted)
+        return {
+            "prompt_tokens": overhead + context_tokens,
+            "template_tokens": self._template_tokens[(scope, mode)],
+            "question_tokens": count_tokens(question),
+            "history_tokens": self.history_tokens(history),
+            "context_tokens": context_tokens,
+            "context_chars": len(fitted),
+            "context_truncated": fitted != context,
+            "max_tokens": max_tokens,
+            "prompt_token_budget": prompt_token_budget(max_tokens),
+        }
+    
+    def _fit_context(self, question: str, context: str, scope: str, mode: str, max_tokens: int,
+                     history: Optional[Sequence[Dict[str, str]]] = None) -> str:
+        """Truncate context that would push the prompt past the token budget"""
+        budget = self.context_token_budget(question, scope, mode, max_tokens, history)
+        context_tokens = count_tokens(context)
+        if context_tokens <= budget:
+            return context
+        logger.warning(f"Context of ~{context_tokens} tokens exceeds the budget of {budget}; truncating")
+        return truncate_to_tokens(context, budget)
+    
+    def _build_request(self, system_prompt: str, question: str, max_tokens: int, stream: bool = False,
+                       history: Optional[Sequence[Dict[str, str]]] = None) -> Tuple[Dict[str, str], Dict[str, Any]]:
+        """Return (headers, payload) for a chat completions call; history goes between the system prompt and the question"""
+        headers = {
+            "api-key": self.azure_api_key,
+            "Content-Type": "application/json"
+        }
+        
+        payload = {
+            "messages": [
+                {"role": "system", "content": system_prompt},
+                *(history or ()),
+                {"role": "user", "content": question}
+            ],
+            "max_tokens": max_tokens,
+            "temperature": 0.7,
+            "top_p": 1.0,
+            "model": self.azure_deployment
+        }
+        if stream:
+            payload["stream"] = True
+            # Final chunk carries token usage for rate limiter reconciliation
+            payload["stream_options"] = {"include_usage": True}
+        return headers, payload
+    
+    def _attempt_timeout(self, deadline: float) -> httpx.Timeout:
+        """Per-attempt timeout that never runs past the request deadline"""
+        remaining = max(0.1, deadline - time.monotonic())
+        return httpx.Timeout(connect=min(5.0, remaining), read=min(30.0, remaining), write=min(10.0, remaining), pool=min(5.0, remaining))
+    
+    async def _send(self, headers: Dict[str, str], payload: Dict[str, Any], label: str, stream: bool = False,
+                    estimated_tokens: int = 0, priority: int = PRIORITY_ONBOARDING,
+                    tier: str = TIER_LARGE) -> Tuple[httpx.Response, Reservation, DeploymentMember]:
+        """POST to a pool member with rate limiting, failover, retries and circuit breakers
+        
+        Each attempt picks a member (weighted by latency, error rate and
+        weight, skipping open breakers and members that already failed this
+        request) and reserves estimated_tokens from its rate limiter,
+        queueing by priority. A timeout, 429 or 5xx fails over to another
+        member immediately; once every available member has failed, the
+        request backs off before the next round.
+        
+        Returns a 200 response, its reservation (to reconcile against usage)
+        and the member that served it; with stream=True the body is not read
+        yet and the caller must close the response. Raises AIUnavailableError
+        while every breaker is open or the rate limiter queue is full, and
+        AIServiceError once retries are exhausted, the deadline has passed or
+        a non-retryable status is returned.
+        """
+        client = await self._get_client()
+        deadline = time.monotonic() + self.retry_policy.deadline_seconds
+        attempts = 0
+        failed: List[DeploymentMember] = []
+        error: Optional[AIServiceError] = None
+        retry_after = None
+        self.resilience_stats["requests"] += 1
+        
+        while True:
+            member = self.pool.choose(exclude=failed, tier=tier)
+            if member is None and failed:
+                # Every available member failed this request: back off, then start another round
+                delay = self.retry_policy.next_delay(attempts, retry_after, deadline)
+                if delay is None:
+                    self.resilience_stats["exhausted"] += 1
+                    raise error
+                self.resilience_stats["retries"] += 1
+                logger.warning(f"Retrying Azure AI request in {delay:.2f}s after attempt {attempts} ({label})")
+                await asyncio.sleep(delay)
+                failed.clear()
+                retry_after = None
+                continue
+            if member is None:
+                self.resilience_stats["short_circuited"] += 1
+                wait = max(1, round(self.pool.retry_after()))
+                logger.warning(f"Circuit breaker open, not calling Azure AI ({label})")
+                raise AIUnavailableError(f"AI service is temporarily unavailable. Please try again in {wait} second{'s' if wait != 1 else ''}.")
             
-            # Prepare request with enhanced helpdesk prompt
-            headers = {
-                "api-key": self.azure_api_key,
-                "Content-Type": "application/json"
-            }
-            
-            payload = {
-                "messages": [
-                    {"role": "system", "content": helpdesk_prompt},
-                    {"role": "user", "content": question}
-                ],
-                "max_tokens": max_tokens,
-                "temperature": 0.7,
-                "top_p": 1.0,
-                "model": self.azure_deployment
-            }
+            try:
+                reservation = await member.rate_limiter.acquire(estimated_tokens, priority, deadline - time.monotonic())
+            except RateLimitExceeded:
+                failed.append(member)
+                error = AIUnavailableError("AI service is busy right now. Please try again in a few seconds.")
+                if self.pool.candidates(exclude=failed):
+                    continue
+                raise error
             
-            # Get shared client and make request
-            client = await self._get_client()
-            response = await client.post(
-                self.azure_endpoint,
-                json=payload,
-                headers=headers
-            )
+            if not member.circuit_breaker.allow_request():
+                # Another request is already probing this half-open member
+                member.rate_limiter.refund(reservation)
+                failed.append(member)
+                if error is None:
+                    error = AIUnavailableError("AI service is temporarily unavailable. Please try again shortly.")
+                continue
             
-            if response.status_code == 200:
-                data = response.json()
-                # Log only essential info, not full response
-                logger.info(f"Azure AI helpdesk response received (status: {response.status_code}, latency: {response.elapsed.total_seconds():.2f}s)")
-                
-                # Handle different response formats
-                if "choices" in data and len(data["choices"]) > 0:
-                    answer = data["choices"][0]["message"]["content"]
-                elif "answer" in data:
-                    answer = data["answer"]
+            attempts += 1
+            self.resilience_stats["attempts"] += 1
+            recorded = False
+            member.in_flight += 1
+            started = time.monotonic()
+            try:
+                request = client.build_request(
+                    "POST",
+                    member.endpoint,
+                    json={**payload, "model": member.deployment},
+                    headers={**headers, "api-key": member.api_key},
+                    timeout=self._attempt_timeout(deadline)
+                )
+                try:
+                    response = await client.send(request, stream=stream)
+                except httpx.TimeoutException:
+                    member.circuit_breaker.record_failure()
+                    member.record(time.monotonic() - started, False)
+                    recorded = True
+                    logger.error(f"Timeout while calling Azure AI service on {member.name} (attempt {attempts})")
+                    error = AIServiceError("AI service request timed out. Please try again.")
+                except httpx.TransportError as e:
+                    member.circuit_breaker.record_failure()
+                    member.record(None, False)
+                    recorded = True
+                    logger.error(f"Error calling Azure AI service on {member.name} (attempt {attempts}): {str(e)}")
+                    error = AIServiceError("Error connecting to AI service. Please try again later.")
                 else:
-                    answer = "No answer received from AI service."
-                    logger.warning(f"Unexpected response format: {list(data.keys())}")
-                
-                logger.info(f"AI helpdesk question answered successfully")
-                return answer
-            else:
-                error_detail = response.text if response.text else "No error details"
-                logger.error(f"Azure AI returned status {response.status_code}: {error_detail[:200]}...")
-                return f"AI service returned error: {response.status_code}. Details: {error_detail}"
-                
-        except httpx.TimeoutException:
-            logger.error("Timeout while calling Azure AI service")
-            return "AI service request timed out. Please try again."
+                    latency = time.monotonic() - started
+                    if response.status_code == 200:
+                        member.circuit_breaker.record_success()
+                        member.record(latency, True)
+                        recorded = True
+                        member.rate_limiter.observe_remaining(
+                            _header_int(response.headers, "x-ratelimit-remaining-requests"),
+                            _header_int(response.headers, "x-ratelimit-remaining-tokens")
+                        )
+                        return response, reservation, member
+                    
+                    if stream:
+                        error_detail = (await response.aread()).decode("utf-8", errors="replace")
+                        await response.aclose()
+                    else:
+                        error_detail = response.text
+                    error_detail = error_detail or "No error details"
+                    logger.error(f"Azure AI returned status {response.status_code} from {member.name}: {error_detail[:200]}...")
+                    error = AIServiceError(f"AI service returned error: {response.status_code}. Details: {error_detail}")
+                    
+                    if response.status_code not in RETRYABLE_STATUS_CODES:
+                        # The deployment is healthy, the request itself was rejected
+                        member.circuit_breaker.record_success()
+                        member.record(latency, True)
+                        recorded = True
+                        raise error
+                    member.circuit_breaker.record_failure()
+                    member.record(latency, False)
+                    recorded = True
+                    member_retry_after = parse_retry_after(response.headers)
+                    if member_retry_after is not None:
+                        retry_after = member_retry_after if retry_after is None else min(retry_after, member_retry_after)
+                    if response.status_code == 429:
+                        # Throttled requests do not use quota; hold this member's queue instead
+                        member.rate_limiter.refund(reservation)
+                        member.rate_limiter.throttled(member_retry_after)
+            finally:
+                member.in_flight -= 1
+                if not recorded:
+                    member.circuit_breaker.release()
+            
+            failed.append(member)
+            if attempts >= self.retry_policy.max_attempts or time.monotonic() >= deadline:
+                self.resilience_stats["exhausted"] += 1
+                raise error
+            if self.pool.candidates(exclude=failed):
+                self.resilience_stats["failovers"] += 1
+                logger.warning(f"Failing over from {member.name} after attempt {attempts} ({label})")
+    
+    async def _request_completion(self, system_prompt: str, question: str, max_tokens: int, label: str,
+                                  estimated_prompt_tokens: Optional[int] = None, priority: int = PRIORITY_ONBOARDING,
+                                  stats: Optional[CompletionStats] = None, tier: str = TIER_LARGE,
+                                  history: Optional[Sequence[Dict[str, str]]] = None) -> str:
+        """Call the Azure chat completions deployment and return the answer text
+        
+        Raises AIServiceError (with a user-facing message) if no answer was produced.
+        """
+        self._ensure_configured()
+        logger.info(f"Calling Azure AI deployment pool, {tier} tier ({label})")
+        
+        # Prepare request with enhanced context
+        headers, payload = self._build_request(system_prompt, question, max_tokens, history=history)
+        
+        started = time.perf_counter()
+        if estimated_prompt_tokens is None:
+            estimated_prompt_tokens = (
+                count_tokens(system_prompt) + count_tokens(question) + 2 * MESSAGE_OVERHEAD_TOKENS + self.history_tokens(history)
+            )
+        response, reservation, member = await self._send(
+            headers, payload, label, estimated_tokens=estimated_prompt_tokens + max_tokens, priority=priority, tier=tier
+        )
+        latency = time.perf_counter() - started
+        
+        data = response.json()
+        # Log only essential info, not full response
+        logger.info(f"Azure AI response received (status: {response.status_code}, latency: {latency:.2f}s)")
+        
+        # Handle different response formats
+        if "choices" in data and len(data["choices"]) > 0:
+            answer = data["choices"][0]["message"]["content"]
+        elif "answer" in data:
+            answer = data["answer"]
+        else:
+            logger.warning(f"Unexpected response format: {list(data.keys())}")
+            raise AIServiceError("No answer received from AI service.")
+        
+        usage = data.get("usage") or {}
+        self._record_usage(usage, reservation, member, estimated_prompt_tokens)
+        if stats is not None:
+            self._fill_stats(stats, usage, member, estimated_prompt_tokens)
+            stats.latency_seconds = latency
+        
+        logger.info(f"AI question answered successfully ({label})")
+        return answer
+    
+    def _record_usage(self, usage: Dict[str, Any], reservation: Reservation, member: DeploymentMember, estimated_prompt_tokens: int):
+        """Reconcile the member's rate limiter with the usage block of a response"""
+        if "total_tokens" in usage:
+            member.rate_limiter.reconcile(reservation, usage["total_tokens"])
+        if "prompt_tokens" in usage:
+            logger.info(f"Prompt tokens: estimated {estimated_prompt_tokens}, actual {usage['prompt_tokens']}")
+    
+    @staticmethod
+    def _fill_stats(stats: CompletionStats, usage: Dict[str, Any], member: DeploymentMember, estimated_prompt_tokens: int):
+        """Copy the usage block of a response into CompletionStats"""
+        stats.estimated_prompt_tokens = estimated_prompt_tokens
+        stats.prompt_tokens = usage.get("prompt_tokens")
+        stats.completion_tokens = usage.get("completion_tokens")
+        stats.deployment = member.name
+    
+    async def generate_answer(self, question: str, context: str, scope: str = "onboarding", mode: str = "global", max_tokens: int = 512,
+                              priority: Optional[int] = None, stats: Optional[CompletionStats] = None,
+                              tier: str = TIER_LARGE, prompt: Optional[RenderedPrompt] = None,
+                              history: Optional[Sequence[Dict[str, str]]] = None) -> str:
+        """Answer a question for a scope ('onboarding' or 'employee'), raising AIServiceError on failure
+        
+        Context beyond the prompt token budget (AI_PROMPT_TOKEN_BUDGET and
+        AI_CONTEXT_WINDOW minus max_tokens) is truncated before sending.
+        `stats`, if given, receives the reported token usage and latency.
+        `tier` selects the pool members preferred for the request. `prompt`
+        is the system prompt already rendered for `context` (see
+        context_snapshot); it is sent as is. `history` holds earlier messages of
+        the conversation (see conversation_store); the context budget shrinks
+        by their size.
+        """
+        system_prompt, label, estimated_prompt_tokens = self._prepare_prompt(question, context, scope, mode, max_tokens, prompt, history)
+        logger.info(f"Estimated prompt tokens: {estimated_prompt_tokens} ({label})")
+        
+        try:
+            return await self._request_completion(
+                system_prompt, question, max_tokens, label, estimated_prompt_tokens,
+                request_priority(scope, mode) if priority is None else priority, stats, tier, history
+            )
+        except AIServiceError:
+            raise
         except Exception as e:
             logger.error(f"Error calling Azure AI service: {str(e)}")
-            return "Error connecting to AI service. Please try again later."
+            raise AIServiceError("Error connecting to AI service. Please try again later.") from e
+    
+    async def stream_answer(self, question: str, context: str, scope: str = "onboarding", mode: str = "global", max_tokens: int = 512,
+                            priority: Optional[int] = None, stats: Optional[CompletionStats] = None,
+                            tier: str = TIER_LARGE, prompt: Optional[RenderedPrompt] = None,
+                            history: Optional[Sequence[Dict[str, str]]] = None) -> AsyncIterator[str]:
+        """Stream answer text deltas from the deployment (stream=true)
+        
+        Raises AIServiceError if the request fails before or while streaming.
+        Closing the generator (e.g. when the client disconnects) closes the
+        upstream response, which cancels the request at Azure. `stats`, if
+        given, receives the reported token usage and latency; `tier`, `prompt`
+        and `history` are as for generate_answer.
+        """
+        self._ensure_configured()
+        system_prompt, label, estimated_prompt_tokens = self._prepare_prompt(question, context, scope, mode, max_tokens, prompt, history)
+        headers, payload = self._build_request(system_prompt, question, max_tokens, stream=True, history=history)
+        logger.info(f"Streaming from Azure AI deployment pool, {tier} tier ({label})")
+        
+        started = time.perf_counter()
+        first_token_at = None
+        completed = False
+        streamed = []
+        try:
+            if stats is not None:
+                stats.estimated_prompt_tokens = estimated_prompt_tokens
+            response, reservation, member = await self._send(
+                headers, payload, label, stream=True,
+                estimated_tokens=estimated_prompt_tokens + max_tokens,
+                priority=request_priority(scope, mode) if priority is None else priority,
+                tier=tier
+            )
+            if stats is not None:
+                stats.deployment = member.name
+            try:
+                async for line in response.aiter_lines():
+                    if not line.startswith("data:"):
+                        continue
+                    data = line[5:].strip()
+                    if data == "[DONE]":
+                        break
+                    chunk = json.loads(data)
+                    if chunk.get("usage"):
+                        self._record_usage(chunk["usage"], reservation, member, estimated_prompt_tokens)
+                        if stats is not None:
+                            self._fill_stats(stats, chunk["usage"], member, estimated_prompt_tokens)
+                    for choice in chunk.get("choices") or []:
+                        delta = (choice.get("delta") or {}).get("content")
+                        if delta:
+                            if first_token_at is None:
+                                first_token_at = time.perf_counter()
+                                logger.info(f"Azure AI first token after {first_token_at - started:.2f}s ({label})")
+                            streamed.append(delta)
+                            yield delta
+                completed = True
+            finally:
+                await response.aclose()
+        except httpx.TimeoutException:
+            logger.error("Timeout while streaming from Azure AI service")
+            raise AIServiceError("AI service request timed out. Please try again.")
+        except (httpx.HTTPError, ValueError) as e:
+            logger.error(f"Error streaming from Azure AI service: {str(e)}")
+            raise AIServiceError("Error connecting to AI service. Please try again later.") from e
+        finally:
+            if stats is not None:
+                stats.latency_seconds = time.perf_counter() - started
+                stats.first_token_seconds = first_token_at - started if first_token_at is not None else None
+                if stats.completion_tokens is None and streamed:
+                    # No usage chunk (older API versions, or the client left early)
+                    stats.completion_tokens = count_tokens("".join(streamed))
+            if completed:
+                logger.info(f"Azure AI stream completed in {time.perf_counter() - started:.2f}s ({label})")
+            else:
+                logger.info(f"Azure AI stream closed early after {time.perf_counter() - started:.2f}s ({label})")
+    
+    def get_resilience_stats(self) -> Dict[str, Any]:
+        """Retry/failover counters and per-deployment health (latency, errors, breaker, rate limiter)"""
+        return {
+            **self.resilience_stats,
+            "deployments": [member.get_stats() for member in self.pool.members],
+            "retry_policy": {
+                "max_attempts": self.retry_policy.max_attempts,
+                "base_delay": self.retry_policy.base_delay,
+                "max_delay": self.retry_policy.max_delay,
+                "deadline_seconds": self.retry_policy.deadline_seconds,
+            },
+        }
+    
+    async def ask_ai(self, question: str, context: str = "", mode: str = "global", max_tokens: int = 512) -> str:
+        """Send question to Azure AI with policy context and return answer"""
+        try:
+            return await self.generate_answer(question, context, "onboarding", mode, max_tokens)
+        except AIServiceError as e:
+            return str(e)
+    
+    async def ask_policy_question(self, question: str, context: str, mode: str = "auto", max_tokens: int = 512) -> str:
+        """Specialized method for policy questions with context"""
+        return await self.ask_ai(question, context, mode, max_tokens)
+    
+    async def ask_helpdesk_question(self, question: str, context: str, max_tokens: int = 512) -> str:
+        """Specialized method for employee helpdesk questions with SOP context and company information"""
+        try:
+            return await self.generate_answer(question, context, "employee", max_tokens=max_tokens)
+        except AIServiceError as e:
+            return str(e)
     
     async def ask_onboarding_question(self, question: str, context: str, session_id: str, current_step: int, policy_id: str, max_tokens: int = 512) -> str:
         """Enhanced method for onboarding questions with session context"""
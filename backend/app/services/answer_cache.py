@@ -0,0 +1,150 @@
+"""
+Answer cache for /api/ask
+
+Keyed by scope, mode, section_id, the normalized question and a version of
+the context that was sent to the model. Entries are evicted LRU-first when
+the entry or byte budget is exceeded, expire after a TTL, and are dropped
+as soon as their corpus is written to.
+"""
+import hashlib
+import logging
+import re
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Dict, Optional
+
+from ..config import settings
+from .content_version import content_versions
+
+logger = logging.getLogger(__name__)
+
+WHITESPACE_PATTERN = re.compile(r"\s+")
+TRAILING_PUNCTUATION_PATTERN = re.compile(r"[\s?!.]+$")
+
+# Rough per-entry bookkeeping overhead (OrderedDict node, dataclass, key string)
+ENTRY_OVERHEAD_BYTES = 200
+
+
+def normalize_question(question: str) -> str:
+    """Case-fold, collapse whitespace and drop trailing punctuation"""
+    question = WHITESPACE_PATTERN.sub(" ", question.strip().lower())
+    return TRAILING_PUNCTUATION_PATTERN.sub("", question)
+
+
+def context_version(corpus: str, context: str) -> str:
+    """Version token for a context: corpus write version plus a hash of the text"""
+    digest = hashlib.sha1(context.encode("utf-8")).hexdigest()[:16]
+    return f"{corpus}:{content_versions.get(corpus)}:{digest}"
+
+
+def context_hash(version: str) -> str:
+    """The context text part of a context_version, the same in every worker"""
+    return version.rsplit(":", 1)[1]
+
+
+def corpus_version(version: str) -> str:
+    """The corpus write version part of a context_version ("<corpus>:<version>")"""
+    return version.rsplit(":", 1)[0]
+
+
+@dataclass
+class CacheEntry:
+    answer: str
+    corpus: str
+    expires_at: float
+    size: int
+
+
+class AnswerCache:
+    """In-process LRU + TTL cache bounded by entry count and approximate bytes"""
+
+    def __init__(self, max_entries: int = 1000, max_bytes: int = 8 * 1024 * 1024, ttl_seconds: float = 3600):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[str, CacheEntry]" = OrderedDict()
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    @staticmethod
+    def make_key(scope: str, mode: Optional[str], section_id: Optional[str], question: str, version: str) -> str:
+        return "|".join([scope, mode or "", section_id or "", version, normalize_question(question)])
+
+    def _drop(self, key: str):
+        entry = self._entries.pop(key)
+        self._bytes -= entry.size
+
+    def get(self, key: str) -> Optional[str]:
+        """Return a cached answer or None; counts a hit or miss"""
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        if entry.expires_at <= time.monotonic():
+            self._drop(key)
+            self.expirations += 1
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry.answer
+
+    def set(self, key: str, answer: str, corpus: str):
+        """Store an answer, evicting least recently used entries to stay within bounds"""
+        size = len(answer.encode("utf-8")) + len(key) + ENTRY_OVERHEAD_BYTES
+        if size > self.max_bytes:
+            return
+        if key in self._entries:
+            self._drop(key)
+
+        self._entries[key] = CacheEntry(answer, corpus, time.monotonic() + self.ttl_seconds, size)
+        self._bytes += size
+
+        while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+            oldest_key = next(iter(self._entries))
+            self._drop(oldest_key)
+            self.evictions += 1
+
+    def invalidate(self, corpus: str, version: Optional[int] = None):
+        """Drop every entry built from a corpus (content version listener)"""
+        stale = [key for key, entry in self._entries.items() if entry.corpus == corpus]
+        for key in stale:
+            self._drop(key)
+        self.invalidations += len(stale)
+        if stale:
+            logger.info(f"Invalidated {len(stale)} cached answers for {corpus} (version {version})")
+
+    def clear(self):
+        self._entries.clear()
+        self._bytes = 0
+
+    def get_stats(self) -> Dict:
+        """Counters for sizing the cache"""
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "bytes": self._bytes,
+            "max_entries": self.max_entries,
+            "max_bytes": self.max_bytes,
+            "ttl_seconds": self.ttl_seconds,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "invalidations": self.invalidations,
+        }
+
+
+# Global instance, invalidated on every policy / KB write
+answer_cache = AnswerCache(
+    max_entries=settings.ANSWER_CACHE_MAX_ENTRIES,
+    max_bytes=settings.ANSWER_CACHE_MAX_BYTES,
+    ttl_seconds=settings.ANSWER_CACHE_TTL_SECONDS
+)
+content_versions.add_listener(answer_cache.invalidate)
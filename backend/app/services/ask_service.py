@@ -0,0 +1,619 @@
+"""
+/api/ask orchestration
+
+Resolves the scope/mode of an EnhancedAskRequest, selects the context,
+serves repeated questions from the answer cache and otherwise calls the AI.
+When the AI cannot answer in time the most relevant policy / KB passages are
+quoted instead (see extractive_answer). Questions asked with an
+X-Chat-Session-ID are answered with the chat's earlier turns (see
+conversation_store).
+"""
+import asyncio
+import json
+import logging
+import time
+from contextlib import aclosing
+from dataclasses import dataclass
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+
+from ..config import settings
+from ..models.policy import AskDryRunResponse, BatchAskItemResult, EnhancedAskRequest, EnhancedAskResponse
+from .ai_connector import ai_connector, AIServiceError, CompletionStats, RenderedPrompt
+from .deployment_pool import TIER_FAST, TIER_LARGE
+from .answer_cache import answer_cache, context_hash, context_version, normalize_question
+from .content_version import SCOPE_CORPUS
+from .context_snapshot import context_snapshots
+from .conversation_store import ConversationHistory, conversation_store
+from .employee_kb_service import employee_kb_service
+from .extractive_answer import ExtractiveAnswer, extract_answer
+from .intent_router import intent_router
+from .model_router import RoutingDecision, model_router
+from .policy_service import policy_service
+from .rate_limiter import PRIORITY_BACKGROUND
+from .semantic_cache import semantic_cache
+from .shared_cache import answer_tiers
+from .single_flight import ask_single_flight
+from .usage_tracker import usage_tracker
+
+logger = logging.getLogger(__name__)
+
+# Completion tokens reserved for each answer
+ANSWER_MAX_TOKENS = 512
+
+EMPLOYEE_FALLBACK_ANSWER = "Employee Helpdesk Mode is active. Ask about insurance, payroll, holidays, IT, reimbursements, etc."
+
+EXTRACTIVE_FALLBACK_NOTICE = "The AI assistant is unavailable right now. These passages from the {source} look most relevant to your question:\n\n"
+
+EXTRACTIVE_SOURCES = {"onboarding": "onboarding policies", "employee": "employee knowledge base"}
+
+
+def sse_event(event: str, data: dict) -> str:
+    """Format one server-sent event"""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+def _consume_result(task: asyncio.Future):
+    """Retrieve the outcome of a completion nobody waits for any more"""
+    if not task.cancelled() and task.exception() is not None:
+        logger.info(f"Background AI completion failed: {str(task.exception())}")
+
+
+@dataclass
+class AskContext:
+    """Resolved scope, mode and context for a single question"""
+    scope: str
+    mode_used: Optional[str]
+    section_id: Optional[str]
+    context: str
+    corpus: str
+    version: str
+    prompt_tokens: Optional[int] = None
+    prompt: Optional[RenderedPrompt] = None
+    history: Optional[ConversationHistory] = None
+
+    @property
+    def history_messages(self) -> Optional[Tuple[Dict[str, str], ...]]:
+        return self.history.messages if self.history is not None else None
+
+
+@dataclass
+class AskAnswer:
+    """Answer text and where it came from"""
+    text: str
+    cached: bool = False
+    source: str = "ai"
+    references: Optional[List[str]] = None
+    # Error messages and canned replies are shown but not kept in the conversation
+    failed: bool = False
+
+
+class AskService:
+    """Answers EnhancedAskRequests for both onboarding and employee helpdesk scopes"""
+
+    @staticmethod
+    def resolve_mode(request: EnhancedAskRequest) -> str:
+        """Onboarding mode actually used: explicit mode, else guided with a section, else global"""
+        mode = request.mode or "global"
+        if mode == "auto":
+            return "guided" if request.section_id else "global"
+        return mode
+
+    @classmethod
+    def usage_key(cls, request: EnhancedAskRequest, ask_context: Optional[AskContext] = None) -> Tuple[str, Optional[str], Optional[str]]:
+        """(scope, mode, section) bucket for usage accounting; sections are tracked for guided questions"""
+        if request.scope == "employee":
+            return "employee", None, None
+        mode = ask_context.mode_used if ask_context is not None else cls.resolve_mode(request)
+        return "onboarding", mode, request.section_id if mode == "guided" else None
+
+    def record_ask(self, request: EnhancedAskRequest, ask_context: Optional[AskContext], result: AskAnswer):
+        """Account one answered question (context size, cache status, answer source)"""
+        source = result.source
+        if ask_context is None and source == "ai":
+            # The canned helpdesk answer sent when the KB could not be loaded
+            source = "unavailable"
+        context_chars = len(ask_context.context) if ask_context is not None and source == "ai" else 0
+        usage_tracker.record_ask(*self.usage_key(request, ask_context), context_chars, result.cached, source)
+
+    @staticmethod
+    def retrieval_question(request: EnhancedAskRequest, history: Optional[ConversationHistory]) -> str:
+        """Text used to select the context; a follow-up also matches the question before it"""
+        if history is None or not history.last_question:
+            return request.message
+        return f"{history.last_question} {request.message}"
+
+    async def snapshot_context(self, request: EnhancedAskRequest, history: Optional[ConversationHistory] = None) -> Optional[AskContext]:
+        """Context from the pre-rendered snapshot, if there is one and it fits the prompt budget"""
+        mode = None if request.scope == "employee" else self.resolve_mode(request)
+        snapshot = await context_snapshots.get(request.scope, mode, request.section_id)
+        if snapshot is None:
+            return None
+        prompt_mode = mode or "global"
+        messages = history.messages if history is not None else None
+        token_budget = ai_connector.context_token_budget(request.message, request.scope, prompt_mode, ANSWER_MAX_TOKENS, messages)
+        if snapshot.prompt.context_tokens > token_budget:
+            return None
+        section_id = request.section_id if request.scope == "onboarding" else None
+        ask_context = AskContext(
+            request.scope, mode, section_id, snapshot.context, snapshot.corpus, snapshot.cache_version,
+            prompt=snapshot.prompt, history=history
+        )
+        ask_context.prompt_tokens = ai_connector.estimate_prompt_tokens(
+            request.message, snapshot.context, request.scope, prompt_mode, snapshot.prompt.context_tokens, messages
+        )
+        return ask_context
+
+    async def build_context(self, request: EnhancedAskRequest, history: Optional[ConversationHistory] = None) -> AskContext:
+        """Select the AI context for a request (raises ValueError if it cannot be found)
+
+        With a conversation history the context budget shrinks by the size of
+        the history, so the prompt stays within AI_PROMPT_TOKEN_BUDGET.
+        """
+        ask_context = await self.snapshot_context(request, history)
+        if ask_context is not None:
+            return ask_context
+
+        corpus = SCOPE_CORPUS[request.scope]
+        messages = history.messages if history is not None else None
+        question = self.retrieval_question(request, history)
+        if request.scope == "employee":
+            token_budget = ai_connector.context_token_budget(request.message, "employee", "global", ANSWER_MAX_TOKENS, messages)
+            context = await employee_kb_service.get_all_documents_for_context(question=question, token_budget=token_budget)
+            ask_context = AskContext("employee", None, None, context, corpus, context_version(corpus, context), history=history)
+        else:
+            mode = self.resolve_mode(request)
+            token_budget = ai_connector.context_token_budget(request.message, "onboarding", mode, ANSWER_MAX_TOKENS, messages)
+            context = await policy_service.get_sections_for_context(
+                mode, request.section_id, question=question, token_budget=token_budget
+            )
+            ask_context = AskContext(
+                "onboarding", mode, request.section_id, context, corpus, context_version(corpus, context), history=history
+            )
+
+        ask_context.prompt_tokens = ai_connector.estimate_prompt_tokens(
+            request.message, context, ask_context.scope, ask_context.mode_used or "global", history=messages
+        )
+        return ask_context
+
+    async def dry_run(self, request: EnhancedAskRequest, session_id: Optional[str] = None) -> AskDryRunResponse:
+        """Size the prompt for a question without calling the model (raises ValueError if the context is missing)"""
+        ask_context = await self.build_context(request, await conversation_store.history(session_id))
+        prompt = ai_connector.describe_prompt(
+            request.message, ask_context.context, ask_context.scope, ask_context.mode_used or "global", ANSWER_MAX_TOKENS,
+            ask_context.history_messages
+        )
+        return AskDryRunResponse(
+            scope=ask_context.scope,
+            mode_used=ask_context.mode_used,
+            section_id=ask_context.section_id,
+            context_window=settings.AI_CONTEXT_WINDOW,
+            estimated_prompt_cost=round(prompt["prompt_tokens"] * settings.AI_PROMPT_COST_PER_1K_TOKENS / 1000, 6),
+            **prompt
+        )
+
+    @staticmethod
+    def shared_answer_key(request: EnhancedAskRequest, ask_context: AskContext) -> str:
+        """Answer cache key without this worker's content version, for the shared cache"""
+        return answer_cache.make_key(
+            ask_context.scope, ask_context.mode_used, ask_context.section_id, request.message, context_hash(ask_context.version)
+        )
+
+    async def cached_answer(self, request: EnhancedAskRequest, ask_context: AskContext, key: str) -> Optional[str]:
+        """Answer from the exact answer cache (in-process, then shared), else from a near-duplicate earlier question"""
+        answer = await answer_tiers.get(ask_context.corpus, key, self.shared_answer_key(request, ask_context))
+        if answer is None and settings.SEMANTIC_CACHE_ENABLED:
+            match = semantic_cache.get(
+                ask_context.scope, ask_context.mode_used, ask_context.section_id, ask_context.version, request.message
+            )
+            if match is not None:
+                answer = match.answer
+        return answer
+
+    async def cache_answer(self, request: EnhancedAskRequest, ask_context: AskContext, key: str, answer: str):
+        await answer_tiers.set(ask_context.corpus, key, answer, self.shared_answer_key(request, ask_context))
+        if settings.SEMANTIC_CACHE_ENABLED:
+            semantic_cache.add(
+                ask_context.scope, ask_context.mode_used, ask_context.section_id, ask_context.version,
+                ask_context.corpus, request.message, answer
+            )
+
+    async def complete(self, request: EnhancedAskRequest, ask_context: AskContext, priority: Optional[int] = None) -> Tuple[str, bool]:
+        """Return (answer, served_from_cache) for a resolved context, raising AIServiceError on failure
+
+        Identical questions that arrive while an answer is being generated
+        share that one upstream completion instead of starting their own.
+        Follow-up questions depend on their conversation and bypass both.
+        """
+        key = answer_cache.make_key(
+            ask_context.scope, ask_context.mode_used, ask_context.section_id, request.message, ask_context.version
+        )
+        use_cache = settings.ANSWER_CACHE_ENABLED and ask_context.history is None
+        if use_cache:
+            cached_answer = await self.cached_answer(request, ask_context, key)
+            if cached_answer is not None:
+                logger.info(f"Answer cache hit ({ask_context.scope}, {ask_context.mode_used})")
+                return cached_answer, True
+
+        async def complete() -> str:
+            stats = CompletionStats()
+            decision = await self.route_model(request, ask_context)
+            try:
+                answer = await ai_connector.generate_answer(
+                    question=request.message,
+                    context=ask_context.context,
+                    scope=ask_context.scope,
+                    mode=ask_context.mode_used or "global",
+                    max_tokens=ANSWER_MAX_TOKENS,
+                    priority=priority,
+                    stats=stats,
+                    tier=decision.tier if decision else TIER_LARGE,
+                    prompt=ask_context.prompt,
+                    history=ask_context.history_messages
+                )
+            except AIServiceError:
+                usage_tracker.record_completion(*self.usage_key(request, ask_context), stats, ok=False)
+                raise
+            usage_tracker.record_completion(*self.usage_key(request, ask_context), stats)
+            if decision is not None:
+                model_router.record_completion(decision, stats)
+            if use_cache:
+                await self.cache_answer(request, ask_context, key, answer)
+            return answer
+
+        if settings.AI_SINGLE_FLIGHT_ENABLED and ask_context.history is None:
+            answer, shared = await ask_single_flight.do(key, complete)
+            if shared:
+                logger.info(f"Coalesced with in-flight request ({ask_context.scope}, {ask_context.mode_used})")
+        else:
+            answer = await complete()
+        return answer, False
+
+    async def route_model(self, request: EnhancedAskRequest, ask_context: AskContext) -> Optional[RoutingDecision]:
+        """Deployment tier for a question; None when no fast tier is configured"""
+        if not settings.MODEL_ROUTER_ENABLED or not ai_connector.pool.has_tier(TIER_FAST):
+            return None
+
+        async def confidence() -> float:
+            result = await self.extract(request, ask_context.mode_used, 0.0)
+            return result.confidence if result is not None else 0.0
+
+        try:
+            return await model_router.route(
+                request.message, ask_context.scope, ask_context.mode_used, ask_context.prompt_tokens or 0, confidence
+            )
+        except Exception as e:
+            logger.warning(f"Model routing failed, using the large tier: {str(e)}")
+            return None
+
+    async def route_intent(self, request: EnhancedAskRequest) -> Optional[AskAnswer]:
+        """Answer navigational onboarding questions ("what is step 4") from the policies without the AI"""
+        if request.scope != "onboarding" or not settings.INTENT_ROUTER_ENABLED:
+            return None
+        try:
+            routed = await intent_router.route(request.message)
+        except Exception as e:
+            logger.warning(f"Intent routing failed, asking the AI: {str(e)}")
+            return None
+        if routed is None:
+            return None
+        return AskAnswer(routed.answer, source="intent", references=routed.references or None)
+
+    async def extract(self, request: EnhancedAskRequest, mode_used: Optional[str], min_confidence: float,
+                      refresh: bool = True) -> Optional[ExtractiveAnswer]:
+        """Extractive answer from the retrieval index of the request's scope
+
+        With refresh=False only an index that is already loaded is used, for
+        when the database itself is what failed.
+        """
+        service = employee_kb_service if request.scope == "employee" else policy_service
+        index = service.retrieval_index
+        if refresh:
+            try:
+                index = await service.get_retrieval_index()
+            except Exception as e:
+                logger.warning(f"Could not refresh the retrieval index for an extractive answer: {str(e)}")
+        if index.loaded_at is None:
+            return None
+
+        started = time.perf_counter()
+        doc_keys = {request.section_id} if mode_used == "guided" and request.section_id else None
+        result = extract_answer(index, request.message, doc_keys, settings.RETRIEVAL_TOP_K, min_confidence=min_confidence)
+        logger.info(
+            f"Extractive answer in {(time.perf_counter() - started) * 1000:.1f}ms "
+            f"(confidence {result.confidence if result else 0:.2f}, {request.scope}, {mode_used})"
+        )
+        return result
+
+    async def fast_path(self, request: EnhancedAskRequest, ask_context: AskContext) -> Optional[AskAnswer]:
+        """Quote the policies / KB without calling the AI when one passage clearly answers the question"""
+        if not settings.EXTRACTIVE_FAST_PATH_ENABLED or ask_context.history is not None:
+            # A follow-up can rarely be answered from its own words
+            return None
+        result = await self.extract(request, ask_context.mode_used, settings.EXTRACTIVE_FAST_PATH_CONFIDENCE)
+        if result is None:
+            return None
+        return AskAnswer(result.render(), source="extractive", references=result.references)
+
+    async def extractive_fallback(self, request: EnhancedAskRequest, mode_used: Optional[str], refresh: bool = True) -> Optional[AskAnswer]:
+        """Best matching passages to return instead of an AI failure, if any match well enough"""
+        if not settings.EXTRACTIVE_FALLBACK_ENABLED:
+            return None
+        result = await self.extract(request, mode_used, settings.EXTRACTIVE_MIN_CONFIDENCE, refresh)
+        if result is None:
+            return None
+        notice = EXTRACTIVE_FALLBACK_NOTICE.format(source=EXTRACTIVE_SOURCES[request.scope])
+        return AskAnswer(notice + result.render(), source="extractive", references=result.references)
+
+    async def generate(self, request: EnhancedAskRequest, ask_context: AskContext) -> AskAnswer:
+        """Answer from the fast path, the answer cache or the AI, falling back to an extractive answer
+
+        If the AI fails (circuit breaker open, rate limiter saturated, retries
+        exhausted) or has not answered within EXTRACTIVE_FALLBACK_AFTER_SECONDS,
+        the best matching passages are quoted instead; a late AI answer still
+        lands in the answer cache. Failures without a usable fallback are
+        returned as the answer text.
+        """
+        fast = await self.fast_path(request, ask_context)
+        if fast is not None:
+            return fast
+
+        completion = asyncio.ensure_future(self.complete(request, ask_context))
+        timeout = settings.EXTRACTIVE_FALLBACK_AFTER_SECONDS if settings.EXTRACTIVE_FALLBACK_ENABLED else 0
+        try:
+            await asyncio.wait({completion}, timeout=timeout or None)
+        except asyncio.CancelledError:
+            completion.cancel()
+            raise
+
+        error: Optional[AIServiceError] = None
+        if completion.done():
+            try:
+                answer, cached = completion.result()
+                return AskAnswer(answer, cached)
+            except AIServiceError as e:
+                error = e
+        else:
+            # Keep the completion running so its answer is cached for the next asker
+            completion.add_done_callback(_consume_result)
+            logger.warning(f"No AI answer after {timeout:g}s, trying an extractive answer ({ask_context.scope}, {ask_context.mode_used})")
+
+        fallback = await self.extractive_fallback(request, ask_context.mode_used)
+        if fallback is not None:
+            return fallback
+        if error is None:
+            try:
+                answer, cached = await completion
+                return AskAnswer(answer, cached)
+            except AIServiceError as e:
+                error = e
+        # Failures are returned to the user but never cached
+        return AskAnswer(str(error), failed=True)
+
+    async def context_or_fallback(self, request: EnhancedAskRequest, history: Optional[ConversationHistory] = None) -> Optional[AskContext]:
+        """Build the context; None means the employee helpdesk context was unavailable"""
+        if request.scope == "employee":
+            try:
+                return await self.build_context(request, history)
+            except Exception as e:
+                # Fallback to generic response if the helpdesk context is unavailable
+                logger.error(f"Failed to process employee question with AI: {str(e)}")
+                return None
+        return await self.build_context(request, history)
+
+    async def remember(self, session_id: Optional[str], request: EnhancedAskRequest, result: AskAnswer):
+        """Add an answered question to its conversation"""
+        if session_id and not result.failed:
+            await conversation_store.record(session_id, request.message, result.text)
+
+    def _answer_events(self, request: EnhancedAskRequest, ask_context: Optional[AskContext], result: AskAnswer,
+                       meta: Optional[Dict]) -> List[str]:
+        """Events for an answer that is complete up front: meta (if not sent yet), one delta and done"""
+        self.record_ask(request, ask_context, result)
+        done = {"cached": result.cached, "source": result.source}
+        if result.references:
+            done["references"] = result.references
+        events = [sse_event("meta", meta)] if meta is not None else []
+        return events + [sse_event("delta", {"text": result.text}), sse_event("done", done)]
+
+    async def stream(self, request: EnhancedAskRequest, ask_context: Optional[AskContext],
+                     session_id: Optional[str] = None) -> AsyncIterator[str]:
+        """Server-sent events for an answer: meta, one delta event per token, then done or error
+
+        The complete answer is cached (and added to the session's
+        conversation) once the stream finishes. If the client
+        disconnects the generator is closed, which closes the upstream request.
+        If the AI fails before sending anything an extractive answer is sent
+        instead, when one matches well enough.
+        """
+        routed = await self.route_intent(request)
+        if routed is not None:
+            meta = {"scope": "onboarding", "mode_used": self.resolve_mode(request), "cached": False}
+            await self.remember(session_id, request, routed)
+            for event in self._answer_events(request, None, routed, meta):
+                yield event
+            return
+
+        if ask_context is None:
+            result = await self.extractive_fallback(request, None, refresh=False) or AskAnswer(EMPLOYEE_FALLBACK_ANSWER, failed=True)
+            await self.remember(session_id, request, result)
+            for event in self._answer_events(request, None, result, {"scope": "employee", "mode_used": None, "cached": False}):
+                yield event
+            return
+
+        cache_key = None
+        if settings.ANSWER_CACHE_ENABLED and ask_context.history is None:
+            cache_key = answer_cache.make_key(
+                ask_context.scope, ask_context.mode_used, ask_context.section_id, request.message, ask_context.version
+            )
+            cached_answer = await self.cached_answer(request, ask_context, cache_key)
+            if cached_answer is not None:
+                logger.info(f"Answer cache hit ({ask_context.scope}, {ask_context.mode_used}, stream)")
+                meta = {
+                    "scope": ask_context.scope, "mode_used": ask_context.mode_used,
+                    "cached": True, "prompt_tokens": ask_context.prompt_tokens
+                }
+                result = AskAnswer(cached_answer, cached=True)
+                await self.remember(session_id, request, result)
+                for event in self._answer_events(request, ask_context, result, meta):
+                    yield event
+                return
+
+        fast = await self.fast_path(request, ask_context)
+        if fast is not None:
+            meta = {"scope": ask_context.scope, "mode_used": ask_context.mode_used, "cached": False, "prompt_tokens": None}
+            await self.remember(session_id, request, fast)
+            for event in self._answer_events(request, ask_context, fast, meta):
+                yield event
+            return
+
+        yield sse_event("meta", {
+            "scope": ask_context.scope, "mode_used": ask_context.mode_used,
+            "cached": False, "prompt_tokens": ask_context.prompt_tokens
+        })
+
+        started = time.perf_counter()
+        stats = CompletionStats()
+        decision = await self.route_model(request, ask_context)
+        parts = []
+        finished = False
+        failed = False
+        try:
+            deltas = ai_connector.stream_answer(
+                question=request.message,
+                context=ask_context.context,
+                scope=ask_context.scope,
+                mode=ask_context.mode_used or "global",
+                max_tokens=ANSWER_MAX_TOKENS,
+                stats=stats,
+                tier=decision.tier if decision else TIER_LARGE,
+                prompt=ask_context.prompt,
+                history=ask_context.history_messages
+            )
+            # aclosing() closes the upstream response as soon as this generator is closed
+            async with aclosing(deltas):
+                async for delta in deltas:
+                    parts.append(delta)
+                    yield sse_event("delta", {"text": delta})
+            finished = True
+        except AIServiceError as e:
+            failed = True
+            fallback = None if parts else await self.extractive_fallback(request, ask_context.mode_used)
+            if fallback is not None:
+                await self.remember(session_id, request, fallback)
+                for event in self._answer_events(request, ask_context, fallback, None):
+                    yield event
+                return
+            # Failures are reported to the client but never cached
+            self.record_ask(request, ask_context, AskAnswer(str(e)))
+            yield sse_event("error", {"message": str(e)})
+            return
+        finally:
+            # A stream the client abandoned still used (part of) its tokens
+            usage_tracker.record_completion(*self.usage_key(request, ask_context), stats, ok=not failed)
+            if decision is not None and not failed:
+                model_router.record_completion(decision, stats)
+            if not finished:
+                logger.info(f"Answer stream ended early after {time.perf_counter() - started:.2f}s ({len(parts)} deltas sent)")
+
+        answer = "".join(parts)
+        if cache_key is not None and answer:
+            await self.cache_answer(request, ask_context, cache_key, answer)
+        self.record_ask(request, ask_context, AskAnswer(answer))
+        await self.remember(session_id, request, AskAnswer(answer))
+        yield sse_event("done", {"cached": False, "source": "ai"})
+
+    @classmethod
+    def _batch_context_key(cls, request: EnhancedAskRequest) -> tuple:
+        """Requests with the same key get the same context"""
+        mode = None if request.scope == "employee" else cls.resolve_mode(request)
+        if mode == "guided" or not settings.RETRIEVAL_ENABLED:
+            # Context does not depend on the question
+            return (request.scope, mode, request.section_id)
+        return (request.scope, mode, request.section_id, normalize_question(request.message))
+
+    async def answer_batch(self, requests: List[EnhancedAskRequest], concurrency: int) -> List[BatchAskItemResult]:
+        """Answer many questions with at most `concurrency` in flight, results in request order
+
+        Each distinct context is built once and shared by every item that
+        needs it. Items go through the same answer cache, coalescing and rate
+        limiter as single asks, queued at background priority so interactive
+        questions are admitted first.
+        """
+        semaphore = asyncio.Semaphore(max(1, concurrency))
+        contexts: Dict[tuple, asyncio.Task] = {}
+
+        async def run(index: int, request: EnhancedAskRequest) -> BatchAskItemResult:
+            started = time.perf_counter()
+            result = BatchAskItemResult(index=index, status="ok", scope=request.scope)
+            async with semaphore:
+                try:
+                    key = self._batch_context_key(request)
+                    if key not in contexts:
+                        contexts[key] = asyncio.ensure_future(self.context_or_fallback(request))
+                    ask_context = await contexts[key]
+
+                    if ask_context is None:
+                        result.answer = EMPLOYEE_FALLBACK_ANSWER
+                    else:
+                        result.mode_used = ask_context.mode_used
+                        result.prompt_tokens = ask_context.prompt_tokens
+                        result.answer, result.cached = await self.complete(request, ask_context, PRIORITY_BACKGROUND)
+                    self.record_ask(request, ask_context, AskAnswer(result.answer, cached=result.cached))
+                except ValueError as e:
+                    result.status = "not_found"
+                    result.error = str(e)
+                except AIServiceError as e:
+                    result.status = "error"
+                    result.error = str(e)
+                except Exception as e:
+                    logger.error(f"Batch item {index} failed: {str(e)}")
+                    result.status = "error"
+                    result.error = "Failed to process request. Please try again."
+            result.latency_ms = round((time.perf_counter() - started) * 1000, 1)
+            return result
+
+        results = await asyncio.gather(*(run(index, request) for index, request in enumerate(requests)))
+        logger.info(f"Answered batch of {len(requests)} questions with {len(contexts)} distinct contexts")
+        return list(results)
+
+    async def answer(self, request: EnhancedAskRequest, session_id: Optional[str] = None) -> EnhancedAskResponse:
+        """Answer a question end to end, as a follow-up within the conversation of session_id if given"""
+        routed = await self.route_intent(request)
+        if routed is not None:
+            self.record_ask(request, None, routed)
+            await self.remember(session_id, request, routed)
+            return EnhancedAskResponse(
+                scope="onboarding",
+                mode_used=self.resolve_mode(request),
+                answer=routed.text,
+                source=routed.source,
+                references=routed.references
+            )
+
+        ask_context = await self.context_or_fallback(request, await conversation_store.history(session_id))
+        if ask_context is None:
+            # The helpdesk context could not be loaded; quote the index from the last load if there is one
+            fallback = await self.extractive_fallback(request, None, refresh=False)
+            if fallback is None:
+                self.record_ask(request, None, AskAnswer(EMPLOYEE_FALLBACK_ANSWER))
+                return EnhancedAskResponse(scope="employee", answer=EMPLOYEE_FALLBACK_ANSWER)
+            self.record_ask(request, None, fallback)
+            await self.remember(session_id, request, fallback)
+            return EnhancedAskResponse(scope="employee", answer=fallback.text, source=fallback.source, references=fallback.references)
+
+        result = await self.generate(request, ask_context)
+        self.record_ask(request, ask_context, result)
+        await self.remember(session_id, request, result)
+        return EnhancedAskResponse(
+            scope=ask_context.scope,
+            mode_used=ask_context.mode_used,
+            answer=result.text,
+            cached=result.cached,
+            prompt_tokens=ask_context.prompt_tokens if result.source == "ai" else None,
+            source=result.source,
+            references=result.references
+        )
+
+
+# Global instance
+ask_service = AskService()
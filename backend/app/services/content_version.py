@@ -0,0 +1,52 @@
+"""
+Content version tracking for policy sections and Employee KB documents
+
+Every write through PolicyService / EmployeeKBService bumps the version of
+its corpus. Anything derived from that content (answer cache, prompt
+snapshots, ...) keys on the version and/or listens for bumps to drop stale
+entries.
+"""
+import logging
+from collections import defaultdict
+from typing import Callable, Dict, List
+
+logger = logging.getLogger(__name__)
+
+POLICY_CORPUS = "policy"
+KB_CORPUS = "kb"
+
+SCOPE_CORPUS = {
+    "onboarding": POLICY_CORPUS,
+    "employee": KB_CORPUS,
+}
+
+
+class ContentVersions:
+    """Per-corpus monotonically increasing version counters"""
+
+    def __init__(self):
+        self._versions: Dict[str, int] = defaultdict(int)
+        self._listeners: List[Callable[[str, int], None]] = []
+
+    def get(self, corpus: str) -> int:
+        """Current version of a corpus"""
+        return self._versions[corpus]
+
+    def bump(self, corpus: str) -> int:
+        """Record a write to a corpus and notify listeners"""
+        self._versions[corpus] += 1
+        version = self._versions[corpus]
+        for listener in self._listeners:
+            try:
+                listener(corpus, version)
+            except Exception as e:
+                logger.warning(f"Content version listener failed for {corpus}: {str(e)}")
+        return version
+
+    def add_listener(self, listener: Callable[[str, int], None]):
+        """Register a callback invoked as listener(corpus, new_version) on every bump"""
+        self._listeners.append(listener)
+
+
+# Global instance
+content_versions = ContentVersions()
@@ -0,0 +1,159 @@
+"""
+Pre-rendered, versioned prompt prefixes for /api/ask
+
+Every question used to re-read its context (a MongoDB query for a guided
+section, the whole catalog for global mode), count its tokens, hash it for
+the answer cache and format the system prompt around it. A snapshot holds
+all of that for one scope / mode / section and is built once per content
+version: writes drop the snapshots of their corpus and the next question
+rebuilds them. Snapshots are immutable, so every question on the same
+content sends a byte-identical system prompt, which is also what lets
+Azure's prompt cache hit.
+
+Global contexts too large to send whole are still selected per question by
+retrieval (or built from digests) and have no snapshot.
+"""
+import asyncio
+import logging
+import time
+from dataclasses import dataclass
+from typing import Dict, Optional, Tuple
+
+from ..config import settings
+from .ai_connector import RenderedPrompt, ai_connector
+from .answer_cache import context_version
+from .content_version import SCOPE_CORPUS, content_versions
+from .digest import use_digests
+from .employee_kb_service import employee_kb_service
+from .policy_service import policy_service
+from .shared_cache import context_tiers, shared_cache
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class PromptSnapshot:
+    """Context and rendered system prompt for one scope / mode / section at one content version"""
+    scope: str
+    mode: str
+    section_id: Optional[str]
+    corpus: str
+    version: int
+    context: str
+    cache_version: str
+    prompt: RenderedPrompt
+    built_at: float
+
+
+class ContextSnapshots:
+    """Per-worker snapshots keyed by (scope, mode, section), rebuilt after writes"""
+
+    def __init__(self):
+        self._snapshots: Dict[Tuple[str, str, Optional[str]], PromptSnapshot] = {}
+        self._locks: Dict[Tuple[str, str, Optional[str]], asyncio.Lock] = {}
+        self.hits = 0
+        self.builds = 0
+        self.too_large = 0
+        self.invalidations = 0
+
+    def _is_stale(self, snapshot: Optional[PromptSnapshot]) -> bool:
+        if snapshot is None or snapshot.version != content_versions.get(snapshot.corpus):
+            return True
+        # Writes made by other workers are only seen after a refresh
+        refresh = settings.RETRIEVAL_INDEX_REFRESH_SECONDS
+        return refresh > 0 and time.monotonic() - snapshot.built_at > refresh
+
+    async def _render(self, scope: str, mode: str, section_id: Optional[str]) -> Optional[str]:
+        """The full context for a snapshot, or None if it has to be selected per question"""
+        if scope == "onboarding" and mode == "guided":
+            return await policy_service.get_sections_for_context("guided", section_id)
+
+        service = employee_kb_service if scope == "employee" else policy_service
+        if settings.RETRIEVAL_ENABLED:
+            index = await service.get_retrieval_index()
+            if index.document_count == 0:
+                # Let the regular path report the missing content
+                return None
+            if index.content_chars > settings.RETRIEVAL_CONTEXT_CHAR_BUDGET or use_digests(index, service.digests):
+                self.too_large += 1
+                return None
+            return index.render_documents()
+        if scope == "employee":
+            return await employee_kb_service.get_all_documents_for_context()
+        return await policy_service.get_sections_for_context("global")
+
+    async def _build(self, scope: str, mode: str, section_id: Optional[str]) -> Optional[PromptSnapshot]:
+        corpus = SCOPE_CORPUS[scope]
+        # Read the version first so a write during the build leaves the snapshot stale
+        version = content_versions.get(corpus)
+        # Likewise the shared generation, so a render that overlaps a write is not shared as current
+        generation = await shared_cache.generation(corpus)
+        # Another worker may already have rendered it at the current generation
+        shared_key = f"{scope}|{mode}|{section_id or ''}"
+        context = await context_tiers.get(corpus, shared_key)
+        if context is None:
+            context = await self._render(scope, mode, section_id)
+            if context is None:
+                return None
+            if generation is not None:
+                await context_tiers.set(corpus, shared_key, context, generation=generation)
+        self.builds += 1
+        logger.info(f"Built context snapshot ({scope}, {mode}, {section_id or '-'}): {len(context)} chars, version {version}")
+        return PromptSnapshot(
+            scope, mode, section_id, corpus, version, context,
+            context_version(corpus, context), ai_connector.render_prompt(context, scope, mode), time.monotonic()
+        )
+
+    async def get(self, scope: str, mode: Optional[str], section_id: Optional[str] = None) -> Optional[PromptSnapshot]:
+        """Snapshot for a question's scope / mode / section; None when the context is selected per question
+
+        Raises ValueError like PolicyService.get_sections_for_context when a
+        guided section does not exist.
+        """
+        if not settings.CONTEXT_SNAPSHOTS_ENABLED:
+            return None
+        mode = mode or "global"
+        if mode == "guided" and not section_id:
+            return None
+        key = (scope, mode, section_id if mode == "guided" else None)
+
+        snapshot = self._snapshots.get(key)
+        if not self._is_stale(snapshot):
+            self.hits += 1
+            return snapshot
+        lock = self._locks.setdefault(key, asyncio.Lock())
+        async with lock:
+            snapshot = self._snapshots.get(key)
+            if self._is_stale(snapshot):
+                self._snapshots.pop(key, None)
+                snapshot = await self._build(*key)
+                if snapshot is None:
+                    return None
+                self._snapshots[key] = snapshot
+            else:
+                self.hits += 1
+        return snapshot
+
+    def invalidate(self, corpus: str, version: int):
+        """Drop the snapshots of a corpus after a write (content version listener)"""
+        stale = [key for key, snapshot in self._snapshots.items() if snapshot.corpus == corpus]
+        for key in stale:
+            del self._snapshots[key]
+        if stale:
+            self.invalidations += len(stale)
+            logger.info(f"Dropped {len(stale)} context snapshot(s) for {corpus} version {version}")
+
+    def get_stats(self) -> Dict:
+        return {
+            "snapshots": len(self._snapshots),
+            "prompt_chars": sum(len(snapshot.prompt.system_prompt) for snapshot in self._snapshots.values()),
+            "hits": self.hits,
+            "builds": self.builds,
+            "too_large_for_snapshot": self.too_large,
+            "invalidations": self.invalidations,
+        }
+
+
+# Global instance, invalidated on every policy / KB write
+context_snapshots = ContextSnapshots()
+content_versions.add_listener(context_snapshots.invalidate)
@@ -0,0 +1,239 @@
+"""
+Server-side conversation memory for /api/ask
+
+Sessions are keyed by the X-Chat-Session-ID header, which a client sends only
+for questions asked within one chat. The onboarding X-Session-ID that the
+frontend attaches to every request is deliberately not used: it spans every
+guided step, and any history makes a question bypass the answer caches and
+the extractive fast path. Each session keeps a window of its most recent turns (at most
+CONVERSATION_WINDOW_TOKENS / CONVERSATION_MAX_TURNS); turns pushed out of
+the window are condensed to one line each in a rolling summary of at most
+CONVERSATION_SUMMARY_MAX_TOKENS, oldest lines dropping first. The history
+sent with a question is therefore bounded however long the conversation
+runs. Sessions expire CONVERSATION_TTL_SECONDS after their last turn and the
+least recently used are evicted beyond CONVERSATION_MAX_SESSIONS. With
+CONVERSATION_PERSIST the sessions are also written to MongoDB, so they
+survive restarts and follow the user across workers.
+"""
+import logging
+import time
+from collections import OrderedDict, deque
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from typing import Deque, Dict, List, Optional, Tuple
+
+from motor.motor_asyncio import AsyncIOMotorCollection
+
+from ..config import settings
+from .cosmos_connection import cosmos_connection
+from .digest import summarize
+from .token_budget import MESSAGE_OVERHEAD_TOKENS, count_tokens, truncate_to_tokens
+
+logger = logging.getLogger(__name__)
+
+# Longest X-Chat-Session-ID accepted; anything else is treated as no session
+MAX_SESSION_ID_LENGTH = 128
+
+# Each answer folded into the summary is condensed to about this many tokens
+SUMMARY_LINE_TOKENS = 40
+
+SUMMARY_PREFIX = "Summary of the earlier conversation (most recent last):\n"
+
+
+@dataclass(frozen=True)
+class ConversationHistory:
+    """Earlier turns of a session, as chat messages to send before the question"""
+    messages: Tuple[Dict[str, str], ...]
+    turns: int
+    last_question: Optional[str]
+
+
+@dataclass
+class Conversation:
+    """Rolling summary and recent turns of one session"""
+    session_id: str
+    summary: Deque[str] = field(default_factory=deque)
+    turns: Deque[Tuple[str, str, int]] = field(default_factory=deque)
+    turn_count: int = 0
+    updated_at: float = field(default_factory=time.time)
+
+    @property
+    def summary_tokens(self) -> int:
+        return count_tokens("\n".join(self.summary))
+
+    @property
+    def window_tokens(self) -> int:
+        return sum(tokens for _, _, tokens in self.turns)
+
+    def add(self, question: str, answer: str):
+        """Append a turn, folding the oldest turns into the summary once the window is full"""
+        window = settings.CONVERSATION_WINDOW_TOKENS
+        # A single long answer must not push every other turn out of the window
+        answer = truncate_to_tokens(answer, max(1, window // 2))
+        tokens = count_tokens(question) + count_tokens(answer) + 2 * MESSAGE_OVERHEAD_TOKENS
+        self.turns.append((question, answer, tokens))
+        self.turn_count += 1
+        self.updated_at = time.time()
+
+        used = self.window_tokens
+        while len(self.turns) > 1 and (used > window or len(self.turns) > settings.CONVERSATION_MAX_TURNS):
+            folded_question, folded_answer, folded_tokens = self.turns.popleft()
+            used -= folded_tokens
+            self.summary.append(f"- Q: {folded_question} A: {summarize(folded_answer, SUMMARY_LINE_TOKENS)}")
+        while len(self.summary) > 1 and self.summary_tokens > settings.CONVERSATION_SUMMARY_MAX_TOKENS:
+            self.summary.popleft()
+        if self.summary and self.summary_tokens > settings.CONVERSATION_SUMMARY_MAX_TOKENS:
+            self.summary[0] = truncate_to_tokens(self.summary[0], settings.CONVERSATION_SUMMARY_MAX_TOKENS)
+
+    def history(self) -> Optional[ConversationHistory]:
+        if not self.turns and not self.summary:
+            return None
+        messages: List[Dict[str, str]] = []
+        if self.summary:
+            messages.append({"role": "system", "content": SUMMARY_PREFIX + "\n".join(self.summary)})
+        for question, answer, _ in self.turns:
+            messages.append({"role": "user", "content": question})
+            messages.append({"role": "assistant", "content": answer})
+        return ConversationHistory(tuple(messages), self.turn_count, self.turns[-1][0] if self.turns else None)
+
+    def to_document(self) -> Dict:
+        return {
+            "_id": self.session_id,
+            "summary": list(self.summary),
+            "turns": [{"question": q, "answer": a, "tokens": t} for q, a, t in self.turns],
+            "turn_count": self.turn_count,
+            "updated_at": datetime.fromtimestamp(self.updated_at, timezone.utc),
+        }
+
+    @classmethod
+    def from_document(cls, doc: Dict) -> "Conversation":
+        updated_at = doc["updated_at"]
+        if updated_at.tzinfo is None:
+            updated_at = updated_at.replace(tzinfo=timezone.utc)
+        return cls(
+            doc["_id"],
+            deque(doc.get("summary") or []),
+            deque((turn["question"], turn["answer"], turn["tokens"]) for turn in doc.get("turns") or []),
+            doc.get("turn_count", 0),
+            updated_at.timestamp()
+        )
+
+
+class ConversationStore:
+    """In-memory LRU of sessions with TTL eviction and optional MongoDB persistence"""
+
+    def __init__(self):
+        self.collection_name = "conversations"
+        self.collection: Optional[AsyncIOMotorCollection] = None
+        self._sessions: "OrderedDict[str, Conversation]" = OrderedDict()
+        self.expired = 0
+        self.evicted = 0
+        self.loaded = 0
+        self.persist_failures = 0
+
+    async def _connect(self):
+        """Borrow the conversations collection; documents expire with the session TTL"""
+        collection = cosmos_connection.get_collection(self.collection_name)
+        try:
+            await collection.create_index("updated_at", expireAfterSeconds=settings.CONVERSATION_TTL_SECONDS)
+        except Exception as e:
+            # Expired documents are still ignored on load
+            logger.warning(f"Could not create the conversations TTL index: {str(e)}")
+        self.collection = collection
+
+    @staticmethod
+    def enabled(session_id: Optional[str]) -> bool:
+        return settings.CONVERSATIONS_ENABLED and bool(session_id) and len(session_id) <= MAX_SESSION_ID_LENGTH
+
+    def _expire(self, now: float):
+        """Drop sessions idle for longer than the TTL (the least recently used come first)"""
+        ttl = settings.CONVERSATION_TTL_SECONDS
+        while self._sessions:
+            session_id, conversation = next(iter(self._sessions.items()))
+            if now - conversation.updated_at <= ttl:
+                break
+            del self._sessions[session_id]
+            self.expired += 1
+
+    async def _get(self, session_id: str) -> Optional[Conversation]:
+        now = time.time()
+        self._expire(now)
+        conversation = self._sessions.get(session_id)
+        if conversation is not None and now - conversation.updated_at > settings.CONVERSATION_TTL_SECONDS:
+            del self._sessions[session_id]
+            self.expired += 1
+            conversation = None
+        if conversation is not None or not settings.CONVERSATION_PERSIST:
+            return conversation
+        try:
+            if self.collection is None:
+                await self._connect()
+            doc = await self.collection.find_one({"_id": session_id})
+        except Exception as e:
+            self.persist_failures += 1
+            logger.warning(f"Could not load conversation {session_id}: {str(e)}")
+            return None
+        if doc is None:
+            return None
+        conversation = Conversation.from_document(doc)
+        if now - conversation.updated_at > settings.CONVERSATION_TTL_SECONDS:
+            return None
+        self.loaded += 1
+        self._store(conversation)
+        return conversation
+
+    def _store(self, conversation: Conversation):
+        self._sessions[conversation.session_id] = conversation
+        self._sessions.move_to_end(conversation.session_id)
+        while len(self._sessions) > settings.CONVERSATION_MAX_SESSIONS:
+            self._sessions.popitem(last=False)
+            self.evicted += 1
+
+    async def history(self, session_id: Optional[str]) -> Optional[ConversationHistory]:
+        """Earlier turns of a session, or None for a new or unknown session"""
+        if not self.enabled(session_id):
+            return None
+        conversation = await self._get(session_id)
+        return conversation.history() if conversation is not None else None
+
+    async def record(self, session_id: Optional[str], question: str, answer: str):
+        """Append an answered question to a session"""
+        if not self.enabled(session_id) or not answer:
+            return
+        conversation = await self._get(session_id) or Conversation(session_id)
+        conversation.add(question, answer)
+        self._store(conversation)
+        if settings.CONVERSATION_PERSIST:
+            try:
+                if self.collection is None:
+                    await self._connect()
+                await self.collection.replace_one({"_id": session_id}, conversation.to_document(), upsert=True)
+            except Exception as e:
+                # The in-memory session still has the turn
+                self.persist_failures += 1
+                logger.warning(f"Could not persist conversation {session_id}: {str(e)}")
+
+    async def clear(self, session_id: str) -> bool:
+        """Forget a session; returns whether it existed"""
+        existed = self._sessions.pop(session_id, None) is not None
+        if settings.CONVERSATION_PERSIST:
+            if self.collection is None:
+                await self._connect()
+            result = await self.collection.delete_one({"_id": session_id})
+            existed = existed or result.deleted_count > 0
+        return existed
+
+    def get_stats(self) -> Dict:
+        self._expire(time.time())
+        return {
+            "sessions": len(self._sessions),
+            "turns_in_windows": sum(len(conversation.turns) for conversation in self._sessions.values()),
+            "expired": self.expired,
+            "evicted": self.evicted,
+            "loaded": self.loaded,
+            "persist_failures": self.persist_failures,
+        }
+
+
+# Global instance
+conversation_store = ConversationStore()
@@ -1,77 +1,93 @@
 """
-Cosmos DB connection service for Azure production deployment
+Shared Cosmos DB / MongoDB connection registry
+
+One AsyncIOMotorClient (and therefore one connection pool and one set of
+monitor threads) per worker process. The client is opened by the FastAPI
+lifespan hook and every service borrows its collections from here.
 """
-import os
 import logging
-from typing import Optional
-from pymongo import MongoClient
+from typing import Any, Dict, Optional
+from motor.motor_asyncio import AsyncIOMotorClient, AsyncIOMotorDatabase, AsyncIOMotorCollection
 from pymongo.errors import ConnectionFailure, ServerSelectionTimeoutError
 from ..config import settings
 
 logger = logging.getLogger(__name__)
 
 class CosmosConnection:
-    """Manages connection to Cosmos DB (MongoDB API)"""
-    
+    """Manages the single shared connection to Cosmos DB (MongoDB API)"""
+
     def __init__(self):
-        self.client: Optional[MongoClient] = None
-        self.database = None
-        self._connect()
-    
-    def _connect(self):
-        """Establish connection to Cosmos DB"""
-        try:
-            # Use Cosmos DB connection string if available, otherwise fallback to MongoDB
-            connection_string = settings.database_url
+        self.client: Optional[AsyncIOMotorClient] = None
+        self.database: Optional[AsyncIOMotorDatabase] = None
+
+    def _client_options(self) -> Dict[str, Any]:
+        """Build pool, timeout and retry options from settings"""
+        options = {
+            "maxPoolSize": settings.MONGO_MAX_POOL_SIZE,
+            "minPoolSize": settings.MONGO_MIN_POOL_SIZE,
+            "maxIdleTimeMS": settings.MONGO_MAX_IDLE_TIME_MS,
+            "waitQueueTimeoutMS": settings.MONGO_WAIT_QUEUE_TIMEOUT_MS,
+            "serverSelectionTimeoutMS": settings.MONGO_SERVER_SELECTION_TIMEOUT_MS,
+            "connectTimeoutMS": settings.MONGO_CONNECT_TIMEOUT_MS,
+            "socketTimeoutMS": settings.MONGO_SOCKET_TIMEOUT_MS,
+            "appname": settings.APP_NAME,
+        }
+        # Only override retry behaviour when explicitly configured so the
+        # connection string (e.g. Cosmos retrywrites=false) stays authoritative
+        if settings.MONGO_RETRY_WRITES is not None:
+            options["retryWrites"] = settings.MONGO_RETRY_WRITES
+        if settings.MONGO_RETRY_READS is not None:
+            options["retryReads"] = settings.MONGO_RETRY_READS
+        return options
+
+    def _ensure_client(self):
+        """Create the shared client if it does not exist yet (no network I/O)"""
+        if self.client is None:
             database_name = settings.database_name
-            
-            logger.info(f"Connecting to database: {database_name}")
-            
-            # Create MongoDB client with Cosmos DB specific settings
-            self.client = MongoClient(
-                connection_string,
-                serverSelectionTimeoutMS=5000,  # 5 second timeout
-                connectTimeoutMS=10000,         # 10 second connection timeout
-                socketTimeoutMS=20000,          # 20 second socket timeout
-                maxPoolSize=10,                 # Connection pool size
-                retryWrites=True,               # Enable retryable writes
-                retryReads=True                 # Enable retryable reads
-            )
-            
-            # Test the connection
-            self.client.admin.command('ping')
+            self.client = AsyncIOMotorClient(settings.database_url, **self._client_options())
             self.database = self.client[database_name]
-            
+            logger.info(
+                f"Created shared MongoDB client for database: {database_name} "
+                f"(maxPoolSize={settings.MONGO_MAX_POOL_SIZE})"
+            )
+
+    async def connect(self):
+        """Open the shared client and verify the server is reachable"""
+        try:
+            self._ensure_client()
+            await self.client.admin.command('ping')
             logger.info("Successfully connected to Cosmos DB")
-            
+
         except (ConnectionFailure, ServerSelectionTimeoutError) as e:
             logger.error(f"Failed to connect to Cosmos DB: {str(e)}")
             raise
         except Exception as e:
             logger.error(f"Unexpected error connecting to Cosmos DB: {str(e)}")
             raise
-    
-    def get_collection(self, collection_name: str):
-        """Get a collection from the database"""
-        if not self.database:
-            raise ConnectionError("Database connection not established")
+
+    def get_collection(self, collection_name: str) -> AsyncIOMotorCollection:
+        """Borrow a collection from the shared database handle"""
+        # Lazily create the client for callers outside the app lifespan (scripts)
+        self._ensure_client()
         return self.database[collection_name]
-    
+
     def close(self):
-        """Close the database connection"""
+        """Close the shared client and release every pooled socket"""
         if self.client:
             self.client.close()
+            self.client = None
+            self.database = None
             logger.info("Database connection closed")
-    
-    def health_check(self) -> bool:
+
+    async def health_check(self) -> bool:
         """Check if the database connection is healthy"""
         try:
             if self.client:
-                self.client.admin.command('ping')
+                await self.client.admin.command('ping')
                 return True
         except Exception as e:
             logger.error(f"Database health check failed: {str(e)}")
         return False
 
-# Global connection instance
+# Global connection registry (opened by the FastAPI lifespan hook, not at import)
 cosmos_connection = CosmosConnection()
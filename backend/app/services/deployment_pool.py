@@ -0,0 +1,243 @@
+"""
+Pool of Azure OpenAI deployments for AIConnector
+
+Members come from AZURE_AI_DEPLOYMENTS (a JSON list) or, when that is not
+set, from the single AZURE_AI_ENDPOINT / AZURE_AI_DEPLOYMENT pair. Each
+member has its own circuit breaker and rate limiter and tracks an EWMA of
+its latency and error rate. Requests are spread across healthy members in
+proportion to weight / latency, discounted by recent errors. Members belong
+to the `large` tier unless configured as `fast` (see model_router); requests
+go to their preferred tier first and fail over to the other.
+"""
+import json
+import logging
+import math
+import random
+import time
+from typing import Any, Dict, Iterable, List, Optional
+
+from ..config import settings
+from .rate_limiter import RateLimiter
+from .resilience import CircuitBreaker
+
+logger = logging.getLogger(__name__)
+
+API_VERSION = "2024-12-01-preview"
+
+# Latency assumed for members that have not answered yet
+DEFAULT_LATENCY_SECONDS = 1.0
+
+# Errors are forgotten with this half-life so a recovered member wins traffic back
+ERROR_RATE_HALF_LIFE_SECONDS = 30.0
+
+TIER_FAST = "fast"
+TIER_LARGE = "large"
+TIERS = (TIER_FAST, TIER_LARGE)
+
+
+def split_endpoint(endpoint: str) -> Optional[str]:
+    """scheme://host for an endpoint URL; plain http is only kept for local mock servers"""
+    resource = endpoint.replace("https://", "").replace("http://", "").split("/")[0]
+    if not resource:
+        return None
+    scheme = "http" if endpoint.startswith("http://") else "https"
+    return f"{scheme}://{resource}"
+
+
+class DeploymentMember:
+    """One deployment on one Azure OpenAI resource"""
+
+    def __init__(self, name: str, base_url: str, deployment: str, api_key: Optional[str], weight: float = 1.0,
+                 requests_per_minute: int = 0, tokens_per_minute: int = 0, ewma_alpha: float = 0.2, tier: str = TIER_LARGE):
+        self.name = name
+        self.base_url = base_url
+        self.resource = base_url.split("://", 1)[1]
+        self.deployment = deployment
+        self.api_key = api_key
+        self.weight = weight
+        self.tier = tier
+        self.endpoint = f"{base_url}/openai/deployments/{deployment}/chat/completions?api-version={API_VERSION}"
+        self.ewma_alpha = ewma_alpha
+
+        self.circuit_breaker = CircuitBreaker(
+            name,
+            failure_threshold=settings.AI_BREAKER_FAILURE_THRESHOLD,
+            recovery_timeout=settings.AI_BREAKER_RECOVERY_SECONDS,
+            half_open_max_calls=settings.AI_BREAKER_HALF_OPEN_CALLS
+        )
+        self.rate_limiter = RateLimiter(
+            requests_per_minute=requests_per_minute,
+            tokens_per_minute=tokens_per_minute,
+            max_wait_seconds=settings.AI_RATE_LIMIT_MAX_WAIT_SECONDS
+        )
+
+        self.ewma_latency: Optional[float] = None
+        self._error_rate = 0.0
+        self._error_updated = time.monotonic()
+        self.in_flight = 0
+        self.requests = 0
+        self.failures = 0
+
+    def error_rate(self, now: Optional[float] = None) -> float:
+        """EWMA of failed attempts, decayed since the last observation"""
+        now = time.monotonic() if now is None else now
+        return self._error_rate * 0.5 ** ((now - self._error_updated) / ERROR_RATE_HALF_LIFE_SECONDS)
+
+    def record(self, latency: Optional[float], ok: bool):
+        """Fold one attempt into the latency and error rate averages"""
+        now = time.monotonic()
+        self.requests += 1
+        if not ok:
+            self.failures += 1
+        if latency is not None:
+            if self.ewma_latency is None:
+                self.ewma_latency = latency
+            else:
+                self.ewma_latency += self.ewma_alpha * (latency - self.ewma_latency)
+        self._error_rate = self.error_rate(now) + self.ewma_alpha * ((0.0 if ok else 1.0) - self.error_rate(now))
+        self._error_updated = now
+
+    def score(self, now: float) -> float:
+        """Routing weight: faster, healthier, less busy members score higher"""
+        latency = self.ewma_latency or DEFAULT_LATENCY_SECONDS
+        health = max(0.05, 1.0 - self.error_rate(now))
+        return self.weight * health ** 2 / (max(latency, 0.01) * (1 + self.in_flight))
+
+    def available(self) -> bool:
+        return self.circuit_breaker.state != CircuitBreaker.OPEN
+
+    def get_stats(self) -> Dict[str, Any]:
+        now = time.monotonic()
+        return {
+            "name": self.name,
+            "resource": self.resource,
+            "deployment": self.deployment,
+            "tier": self.tier,
+            "weight": self.weight,
+            "ewma_latency": round(self.ewma_latency, 3) if self.ewma_latency is not None else None,
+            "error_rate": round(self.error_rate(now), 4),
+            "score": round(self.score(now), 4),
+            "in_flight": self.in_flight,
+            "requests": self.requests,
+            "failures": self.failures,
+            "circuit_breaker": self.circuit_breaker.get_stats(),
+            "rate_limiter": self.rate_limiter.get_stats(),
+        }
+
+
+class DeploymentPool:
+    """Weighted, latency- and error-aware selection across deployment members"""
+
+    def __init__(self, members: List[DeploymentMember]):
+        self.members = members
+
+    def __len__(self) -> int:
+        return len(self.members)
+
+    @property
+    def primary(self) -> Optional[DeploymentMember]:
+        return self.members[0] if self.members else None
+
+    def candidates(self, exclude: Iterable[DeploymentMember] = ()) -> List[DeploymentMember]:
+        excluded = set(id(member) for member in exclude)
+        return [m for m in self.members if id(m) not in excluded and m.available()]
+
+    def has_tier(self, tier: str) -> bool:
+        return any(member.tier == tier for member in self.members)
+
+    def choose(self, exclude: Iterable[DeploymentMember] = (), tier: str = TIER_LARGE) -> Optional[DeploymentMember]:
+        """Pick a member at random in proportion to its score, skipping open breakers
+
+        Members of `tier` are preferred; the other tier is only used when none
+        of them is available.
+        """
+        candidates = self.candidates(exclude)
+        if not candidates:
+            return None
+        preferred = [member for member in candidates if member.tier == tier]
+        candidates = preferred or candidates
+        if len(candidates) == 1:
+            return candidates[0]
+        now = time.monotonic()
+        return random.choices(candidates, weights=[member.score(now) for member in candidates])[0]
+
+    def retry_after(self) -> float:
+        """Seconds until any member's breaker lets a probe through"""
+        waits = [member.circuit_breaker.retry_after() for member in self.members]
+        return min(waits) if waits else 0.0
+
+
+def load_deployment_pool() -> DeploymentPool:
+    """Build the pool from AZURE_AI_DEPLOYMENTS, falling back to the single-deployment settings
+
+    AZURE_AI_DEPLOYMENTS is a JSON list of objects with `endpoint` and
+    optional `name`, `deployment`, `api_key`, `weight`, `rpm`, `tpm` and
+    `tier`; missing values default to AZURE_AI_DEPLOYMENT, AZURE_AI_API_KEY,
+    AI_RATE_LIMIT_RPM / AI_RATE_LIMIT_TPM and the large tier. Without it,
+    AZURE_AI_FAST_DEPLOYMENT adds a fast member on AZURE_AI_ENDPOINT.
+    """
+    default_deployment = settings.AZURE_AI_DEPLOYMENT
+    default_key = settings.AZURE_AI_API_KEY
+    alpha = settings.AI_POOL_EWMA_ALPHA
+    entries: List[Dict[str, Any]] = []
+
+    if settings.AZURE_AI_DEPLOYMENTS:
+        try:
+            entries = json.loads(settings.AZURE_AI_DEPLOYMENTS)
+            if not isinstance(entries, list):
+                raise ValueError("expected a JSON list")
+        except ValueError as e:
+            logger.error(f"Invalid AZURE_AI_DEPLOYMENTS, using AZURE_AI_ENDPOINT only: {str(e)}")
+            entries = []
+
+    members = []
+    for position, entry in enumerate(entries):
+        base_url = split_endpoint(str(entry.get("endpoint", "")))
+        weight = float(entry.get("weight", 1.0))
+        tier = entry.get("tier", TIER_LARGE)
+        if base_url is None or not math.isfinite(weight) or weight <= 0 or tier not in TIERS:
+            logger.error(f"Skipping AZURE_AI_DEPLOYMENTS entry {position}: missing endpoint, invalid weight or tier")
+            continue
+        deployment = entry.get("deployment", default_deployment)
+        members.append(DeploymentMember(
+            entry.get("name", f"{base_url.split('://', 1)[1]}/{deployment}"),
+            base_url,
+            deployment,
+            entry.get("api_key", default_key),
+            weight,
+            int(entry.get("rpm", settings.AI_RATE_LIMIT_RPM)),
+            int(entry.get("tpm", settings.AI_RATE_LIMIT_TPM)),
+            alpha,
+            tier
+        ))
+
+    if not members:
+        base_url = split_endpoint(settings.AZURE_AI_ENDPOINT or "")
+        if base_url is not None:
+            members.append(DeploymentMember(
+                default_deployment,
+                base_url,
+                default_deployment,
+                default_key,
+                1.0,
+                settings.AI_RATE_LIMIT_RPM,
+                settings.AI_RATE_LIMIT_TPM,
+                alpha
+            ))
+            if settings.AZURE_AI_FAST_DEPLOYMENT:
+                fast_deployment = settings.AZURE_AI_FAST_DEPLOYMENT
+                members.append(DeploymentMember(
+                    fast_deployment,
+                    base_url,
+                    fast_deployment,
+                    default_key,
+                    1.0,
+                    settings.AI_RATE_LIMIT_RPM,
+                    settings.AI_RATE_LIMIT_TPM,
+                    alpha,
+                    TIER_FAST
+                ))
+
+    if len(members) > 1:
+        logger.info(f"Azure AI deployment pool: {', '.join(f'{member.name} ({member.tier})' for member in members)}")
+    return DeploymentPool(members)
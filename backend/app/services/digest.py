@@ -0,0 +1,178 @@
+"""
+Compact digests of policy sections and KB documents for global-mode prompts
+
+A digest is a short extractive summary (the sentences that cover most of the
+document's recurring terms, in their original order) written to the
+document in the background after every create / update. Global-mode
+questions over a large corpus then send every digest plus the full text of
+only the few documents retrieval ranks as relevant, instead of every
+document in full. The summarizer runs locally, so digests cost no AI calls.
+"""
+import asyncio
+import hashlib
+import logging
+import math
+from collections import Counter
+from dataclasses import dataclass
+from typing import Awaitable, Callable, Dict, List, Optional, Set, Tuple
+
+from ..config import settings
+from .retrieval import SENTENCE_PATTERN, BM25Index, tokenize
+from .token_budget import ContextBlock, count_tokens, pack_blocks, truncate_to_tokens
+
+logger = logging.getLogger(__name__)
+
+# The opening sentence usually states what the document is about
+LEAD_SENTENCE_BOOST = 1.5
+
+SUMMARY_HEADER = "Summaries of all {noun}:"
+FULL_TEXT_HEADER = "Full text of the {noun} most relevant to the question:"
+
+
+@dataclass(frozen=True)
+class Digest:
+    """Stored digest of one document"""
+    text: str
+    tokens: int
+
+
+def content_hash(content: str) -> str:
+    """Identifies the content a digest was made from"""
+    return hashlib.sha1(content.encode("utf-8")).hexdigest()[:16]
+
+
+def summarize(content: str, max_tokens: int) -> str:
+    """Extractive digest of at most max_tokens: the most central sentences, in document order"""
+    flat = " ".join(content.split())
+    if count_tokens(flat) <= max_tokens:
+        return flat
+
+    term_counts = Counter(tokenize(content))
+    scored: List[Tuple[float, int, str]] = []
+    seen: Set[str] = set()
+    for position, sentence in enumerate(SENTENCE_PATTERN.split(content)):
+        sentence = " ".join(sentence.split())
+        terms = set(tokenize(sentence))
+        if not terms or sentence in seen:
+            continue
+        seen.add(sentence)
+        # Terms the document repeats are what it is about; long sentences should not win on length alone
+        score = sum(term_counts[term] - 1 for term in terms) / math.sqrt(len(terms))
+        if not scored:
+            score *= LEAD_SENTENCE_BOOST
+        scored.append((score, position, sentence))
+
+    chosen: List[Tuple[int, str]] = []
+    used = 0
+    for _, position, sentence in sorted(scored, key=lambda item: (-item[0], item[1])):
+        tokens = count_tokens(sentence) + 1
+        if used + tokens <= max_tokens:
+            chosen.append((position, sentence))
+            used += tokens
+    if not chosen:
+        return truncate_to_tokens(flat, max_tokens)
+    return " ".join(sentence for _, sentence in sorted(chosen))
+
+
+def use_digests(index: BM25Index, digests: Dict[str, Digest]) -> bool:
+    """Whether global-mode context for this corpus is built from digests"""
+    return settings.GLOBAL_DIGESTS_ENABLED and bool(digests) and index.document_tokens > settings.GLOBAL_DIGEST_MIN_TOKENS
+
+
+def build_digest_context(index: BM25Index, digests: Dict[str, Digest], question: str, noun: str,
+                         token_budget: Optional[int] = None) -> str:
+    """Every document's digest, then the full text of the documents most relevant to the question
+
+    The digest block comes first and does not depend on the question, so it
+    forms a stable prompt prefix. Documents without a current digest yet are
+    cut to GLOBAL_DIGEST_MAX_TOKENS in its place.
+    """
+    relevant: List[str] = []
+    for chunk, score in index.search(question, settings.RETRIEVAL_TOP_K):
+        if score > 0 and chunk.doc_key not in relevant:
+            relevant.append(chunk.doc_key)
+            if len(relevant) >= settings.GLOBAL_DIGEST_FULL_DOCUMENTS:
+                break
+
+    summaries = [SUMMARY_HEADER.format(noun=noun)]
+    full_text: Dict[str, ContextBlock] = {}
+    for doc_key, heading, content, tokens in index.documents():
+        digest = digests.get(doc_key)
+        summary = digest.text if digest is not None else truncate_to_tokens(content, settings.GLOBAL_DIGEST_MAX_TOKENS)
+        summaries.append(f"{heading}: {summary}")
+        if doc_key in relevant:
+            full_text[doc_key] = ContextBlock(f"{heading}\n{content}\n", tokens)
+
+    blocks = [ContextBlock("\n".join(summaries) + "\n")]
+    if full_text:
+        # Most relevant first so the budget drops the least relevant document
+        blocks.append(ContextBlock(FULL_TEXT_HEADER.format(noun=noun)))
+        blocks.extend(full_text[doc_key] for doc_key in relevant if doc_key in full_text)
+    packed = pack_blocks(blocks, token_budget)
+    logger.info(
+        f"Digest context: {len(summaries) - 1} summaries, {len(full_text)} full {noun}, "
+        f"~{packed.tokens} of {index.document_tokens} tokens"
+    )
+    return packed.text
+
+
+class DigestWorker:
+    """Background queue that writes digests for created / updated documents
+
+    Services register a refresh coroutine per corpus and schedule document
+    keys after their writes; the worker runs them one at a time.
+    """
+
+    def __init__(self):
+        self._handlers: Dict[str, Callable[[str], Awaitable[None]]] = {}
+        self._queue: asyncio.Queue = asyncio.Queue()
+        self._pending: Set[Tuple[str, str]] = set()
+        self._task: Optional[asyncio.Task] = None
+        self.completed = 0
+        self.failed = 0
+
+    def register(self, corpus: str, refresh: Callable[[str], Awaitable[None]]):
+        self._handlers[corpus] = refresh
+
+    def schedule(self, corpus: str, doc_key: str):
+        """Queue a document for a (re)digest; repeats of a queued document are dropped"""
+        if not settings.GLOBAL_DIGESTS_ENABLED or (corpus, doc_key) in self._pending:
+            return
+        self._pending.add((corpus, doc_key))
+        self._queue.put_nowait((corpus, doc_key))
+
+    def start(self):
+        if self._task is None and settings.GLOBAL_DIGESTS_ENABLED:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self):
+        while True:
+            corpus, doc_key = await self._queue.get()
+            self._pending.discard((corpus, doc_key))
+            try:
+                await self._handlers[corpus](doc_key)
+                self.completed += 1
+            except Exception as e:
+                self.failed += 1
+                logger.warning(f"Failed to write digest for {corpus} {doc_key}: {str(e)}")
+
+    def get_stats(self) -> Dict:
+        return {
+            "running": self._task is not None and not self._task.done(),
+            "queued": self._queue.qsize(),
+            "completed": self.completed,
+            "failed": self.failed,
+        }
+
+
+# Global instance, started with the app
+digest_worker = DigestWorker()
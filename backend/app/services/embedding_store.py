@@ -0,0 +1,363 @@
+"""
+Persistent embedding index for semantic retrieval
+
+Chunks of policy sections and Employee KB documents are embedded once and
+kept as a contiguous float32 matrix on disk. Each worker memory-maps the
+file, so gunicorn workers share the same pages instead of re-embedding, and
+top-k search is a single vectorized cosine scan.
+
+On-disk layout per store (under EMBEDDING_STORE_DIR):
+    <name>.json           metadata: provider, dimension, generation, chunk rows
+    <name>.<gen>.f32      row-major float32 vectors, one row per chunk
+    <name>.lock           cross-process write lock
+The metadata file is replaced atomically and points at an immutable vectors
+file, so readers never see a half-written matrix. Generations older than the
+current one are deleted after each write; one that another worker still has
+mapped cannot be deleted on Windows and is retried on the next write.
+"""
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import re
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import filelock
+import numpy as np
+
+from ..config import settings
+from .retrieval import chunk_text, tokenize
+
+logger = logging.getLogger(__name__)
+
+
+def _normalize_rows(matrix: np.ndarray) -> np.ndarray:
+    """L2-normalize each row so a dot product is a cosine similarity"""
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return np.ascontiguousarray(matrix / norms, dtype=np.float32)
+
+
+class EmbeddingProvider:
+    """Base class for embedding providers"""
+
+    name = "base"
+
+    def __init__(self, dimension: int):
+        self.dimension = dimension
+
+    async def embed(self, texts: List[str]) -> np.ndarray:
+        """Return an (len(texts), dimension) float32 matrix of unit vectors"""
+        raise NotImplementedError
+
+
+class HashingEmbedder(EmbeddingProvider):
+    """Deterministic feature-hashing embedder
+
+    Hashes unigrams and bigrams into a fixed number of signed buckets. It needs
+    no model or network access, so retrieval works (and is reproducible) offline.
+    """
+
+    name = "hashing"
+
+    def _embed_one(self, text: str) -> np.ndarray:
+        vector = np.zeros(self.dimension, dtype=np.float32)
+        tokens = tokenize(text)
+        features = tokens + [f"{first}_{second}" for first, second in zip(tokens, tokens[1:])]
+        for feature in features:
+            value = int.from_bytes(hashlib.blake2b(feature.encode("utf-8"), digest_size=8).digest(), "little")
+            vector[value % self.dimension] += 1.0 if value >> 63 else -1.0
+        # Sublinear term frequency
+        return np.sign(vector) * np.log1p(np.abs(vector))
+
+    async def embed(self, texts: List[str]) -> np.ndarray:
+        if not texts:
+            return np.zeros((0, self.dimension), dtype=np.float32)
+        return _normalize_rows(np.vstack([self._embed_one(text) for text in texts]))
+
+
+class AzureOpenAIEmbedder(EmbeddingProvider):
+    """Embeddings from an Azure OpenAI embeddings deployment"""
+
+    name = "azure"
+    batch_size = 16
+
+    async def embed(self, texts: List[str]) -> np.ndarray:
+        from .ai_connector import ai_connector
+
+        if not texts:
+            return np.zeros((0, self.dimension), dtype=np.float32)
+        if not ai_connector.azure_resource or not ai_connector.azure_api_key or not settings.AZURE_AI_EMBEDDING_DEPLOYMENT:
+            raise RuntimeError("Azure embeddings are not configured")
+
+        url = (
+            f"{ai_connector.azure_base_url}/openai/deployments/"
+            f"{settings.AZURE_AI_EMBEDDING_DEPLOYMENT}/embeddings?api-version={ai_connector.api_version}"
+        )
+        client = await ai_connector._get_client()
+        vectors = []
+        for start in range(0, len(texts), self.batch_size):
+            response = await client.post(
+                url,
+                json={"input": texts[start:start + self.batch_size]},
+                headers={"api-key": ai_connector.azure_api_key, "Content-Type": "application/json"}
+            )
+            response.raise_for_status()
+            data = sorted(response.json()["data"], key=lambda item: item["index"])
+            vectors.extend(item["embedding"] for item in data)
+
+        matrix = np.asarray(vectors, dtype=np.float32)
+        if matrix.shape[1] != self.dimension:
+            raise ValueError(f"Embedding dimension {matrix.shape[1]} does not match EMBEDDING_DIMENSION={self.dimension}")
+        return _normalize_rows(matrix)
+
+
+EMBEDDING_PROVIDERS = {
+    HashingEmbedder.name: HashingEmbedder,
+    AzureOpenAIEmbedder.name: AzureOpenAIEmbedder,
+}
+
+
+def create_embedding_provider(name: Optional[str] = None, dimension: Optional[int] = None) -> EmbeddingProvider:
+    """Instantiate a registered embedding provider (defaults from settings)"""
+    name = name or settings.EMBEDDING_PROVIDER
+    if name not in EMBEDDING_PROVIDERS:
+        raise ValueError(f"Unknown embedding provider '{name}'. Use one of: {', '.join(EMBEDDING_PROVIDERS)}")
+    return EMBEDDING_PROVIDERS[name](dimension or settings.EMBEDDING_DIMENSION)
+
+
+def _document_hash(heading: str, content: str) -> str:
+    return hashlib.sha1(f"{heading}\n{content}".encode("utf-8")).hexdigest()
+
+
+class EmbeddingStore:
+    """Memory-mapped embedding matrix for one corpus, kept in sync with MongoDB"""
+
+    def __init__(self, name: str, directory: str, provider: EmbeddingProvider, chunk_size: int = 1200, chunk_overlap: int = 200):
+        self.name = name
+        self.directory = Path(directory)
+        self.provider = provider
+        self.chunk_size = chunk_size
+        self.chunk_overlap = chunk_overlap
+        # (matrix, rows) is swapped as one tuple so readers always see a consistent pair
+        self._state: Tuple[np.ndarray, List[Dict[str, Any]]] = (
+            np.zeros((0, provider.dimension), dtype=np.float32), []
+        )
+        self._doc_hashes: Dict[str, str] = {}
+        self._generation = 0
+        self._meta_mtime: Optional[int] = None
+        self._write_lock = asyncio.Lock()
+        self.loaded = False
+
+    @property
+    def meta_path(self) -> Path:
+        return self.directory / f"{self.name}.json"
+
+    def _vectors_path(self, generation: int) -> Path:
+        return self.directory / f"{self.name}.{generation}.f32"
+
+    def __len__(self) -> int:
+        return len(self._state[1])
+
+    def load(self) -> bool:
+        """Memory-map the persisted matrix if it matches the current provider"""
+        self.loaded = True
+        try:
+            mtime = self.meta_path.stat().st_mtime_ns
+            meta = json.loads(self.meta_path.read_text(encoding="utf-8"))
+        except FileNotFoundError:
+            return False
+        except Exception as e:
+            logger.warning(f"Ignoring unreadable embedding metadata {self.meta_path}: {str(e)}")
+            return False
+
+        # Remember what we looked at so an incompatible file is not re-read on every search
+        self._meta_mtime = mtime
+        self._generation = meta.get("generation", 0)
+        if (
+            meta.get("provider") != self.provider.name
+            or meta.get("dimension") != self.provider.dimension
+            or meta.get("chunking") != [self.chunk_size, self.chunk_overlap]
+        ):
+            logger.info(f"Embedding store '{self.name}' was built with different settings; it will be rebuilt")
+            return False
+
+        rows = meta["rows"]
+        if rows:
+            try:
+                matrix = np.memmap(
+                    self._vectors_path(meta["generation"]),
+                    dtype=np.float32,
+                    mode="r",
+                    shape=(len(rows), self.provider.dimension)
+                )
+            except (OSError, ValueError) as e:
+                logger.warning(f"Embedding vectors for '{self.name}' are missing or truncated: {str(e)}")
+                return False
+        else:
+            matrix = np.zeros((0, self.provider.dimension), dtype=np.float32)
+
+        self._state = (matrix, rows)
+        self._doc_hashes = meta["doc_hashes"]
+        logger.info(f"Memory-mapped embedding store '{self.name}': {len(rows)} chunks")
+        return True
+
+    def _reload_if_changed(self):
+        """Pick up a newer matrix persisted by another worker"""
+        try:
+            mtime = self.meta_path.stat().st_mtime_ns
+        except FileNotFoundError:
+            return
+        if mtime != self._meta_mtime:
+            self.load()
+
+    def _persist(self, matrix: np.ndarray, rows: List[Dict[str, Any]], doc_hashes: Dict[str, str]):
+        """Write a new generation of the matrix and atomically point the metadata at it"""
+        generation = self._generation + 1
+        vectors_path = self._vectors_path(generation)
+        tmp_vectors = vectors_path.with_suffix(".tmp")
+        np.ascontiguousarray(matrix, dtype=np.float32).tofile(tmp_vectors)
+        os.replace(tmp_vectors, vectors_path)
+
+        meta = {
+            "provider": self.provider.name,
+            "dimension": self.provider.dimension,
+            "chunking": [self.chunk_size, self.chunk_overlap],
+            "generation": generation,
+            "rows": rows,
+            "doc_hashes": doc_hashes,
+        }
+        tmp_meta = self.meta_path.with_suffix(".tmp")
+        tmp_meta.write_text(json.dumps(meta), encoding="utf-8")
+        os.replace(tmp_meta, self.meta_path)
+
+    def _remove_old_generations(self):
+        """Delete vectors files older than the current generation; call with the write lock held
+
+        On POSIX a worker that still has an old file mapped keeps reading it
+        after the unlink. Windows refuses to delete a mapped file, so it is
+        left for the next write to retry once the other workers have moved on.
+        """
+        pattern = re.compile(rf"{re.escape(self.name)}\.(\d+)\.f32")
+        kept = 0
+        for path in self.directory.glob(f"{self.name}.*.f32"):
+            match = pattern.fullmatch(path.name)
+            if match is None or int(match.group(1)) >= self._generation:
+                continue
+            try:
+                path.unlink()
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                kept += 1
+                logger.debug(f"Could not delete old embedding vectors {path.name}: {str(e)}")
+        if kept:
+            logger.info(f"Embedding store '{self.name}' kept {kept} old generation(s) still in use; retrying on the next write")
+
+    def _apply(self, replacements: Dict[str, Tuple[np.ndarray, List[Dict[str, Any]], str]], removed: Iterable[str]):
+        """Replace/remove documents and persist; runs in a worker thread"""
+        removed = set(removed)
+        try:
+            self.directory.mkdir(parents=True, exist_ok=True)
+            lock = filelock.FileLock(str(self.directory / f"{self.name}.lock"), timeout=30)
+        except OSError as e:
+            logger.warning(f"Embedding store directory not writable, keeping vectors in memory only: {str(e)}")
+            lock = None
+
+        def merge():
+            matrix, rows = self._state
+            touched = removed | set(replacements)
+            keep = [i for i, row in enumerate(rows) if row["doc_key"] not in touched]
+            new_rows = [rows[i] for i in keep]
+            parts = [np.asarray(matrix[keep], dtype=np.float32)] if keep else []
+            doc_hashes = {key: value for key, value in self._doc_hashes.items() if key not in touched}
+            for doc_key, (vectors, doc_rows, doc_hash) in replacements.items():
+                parts.append(vectors)
+                new_rows.extend(doc_rows)
+                doc_hashes[doc_key] = doc_hash
+            new_matrix = np.vstack(parts) if parts else np.zeros((0, self.provider.dimension), dtype=np.float32)
+            return new_matrix, new_rows, doc_hashes
+
+        if lock is None:
+            new_matrix, new_rows, doc_hashes = merge()
+            self._state = (new_matrix, new_rows)
+            self._doc_hashes = doc_hashes
+            return
+
+        with lock:
+            # Merge on top of whatever another worker persisted last
+            self._reload_if_changed()
+            new_matrix, new_rows, doc_hashes = merge()
+            try:
+                self._persist(new_matrix, new_rows, doc_hashes)
+                # Map the new generation first so this worker no longer holds the old one
+                self.load()
+                self._remove_old_generations()
+            except OSError as e:
+                logger.warning(f"Failed to persist embedding store '{self.name}': {str(e)}")
+                self._state = (new_matrix, new_rows)
+                self._doc_hashes = doc_hashes
+
+    async def _refresh(self):
+        """Load the persisted matrix, or pick up a newer one, off the event loop"""
+        if not self.loaded:
+            await asyncio.to_thread(self.load)
+        else:
+            await asyncio.to_thread(self._reload_if_changed)
+
+    async def _embed_document(self, doc_key: str, heading: str, title: str, content: str, position: Any):
+        chunks = chunk_text(content, self.chunk_size, self.chunk_overlap)
+        vectors = await self.provider.embed([f"{title}\n{text}" for text in chunks])
+        rows = [
+            {"chunk_id": f"{doc_key}#{index}", "doc_key": doc_key, "position": position}
+            for index in range(len(chunks))
+        ]
+        return vectors, rows, _document_hash(heading, content)
+
+    async def sync(self, documents: Iterable[Tuple[str, str, str, str, Any]]):
+        """Bring the store in line with the given (doc_key, heading, title, content, position) tuples
+
+        Only new or changed documents are embedded; documents that no longer
+        exist are dropped.
+        """
+        documents = list(documents)
+        async with self._write_lock:
+            await self._refresh()
+
+            wanted = {doc[0] for doc in documents}
+            changed = [doc for doc in documents if self._doc_hashes.get(doc[0]) != _document_hash(doc[1], doc[3])]
+            removed = [key for key in self._doc_hashes if key not in wanted]
+            if not changed and not removed:
+                return
+
+            replacements = {doc[0]: await self._embed_document(*doc) for doc in changed}
+            await asyncio.to_thread(self._apply, replacements, removed)
+            logger.info(f"Synced embedding store '{self.name}': {len(changed)} embedded, {len(removed)} removed")
+
+    async def upsert_document(self, doc_key: str, heading: str, title: str, content: str, position: Any):
+        """Embed (or re-embed) a single document"""
+        async with self._write_lock:
+            replacement = await self._embed_document(doc_key, heading, title, content, position)
+            await asyncio.to_thread(self._apply, {doc_key: replacement}, [])
+
+    async def remove_document(self, doc_key: str):
+        """Drop a document's vectors"""
+        async with self._write_lock:
+            await asyncio.to_thread(self._apply, {}, [doc_key])
+
+    async def search(self, query: str, top_k: int) -> List[Tuple[str, float]]:
+        """Return (chunk_id, cosine similarity) for the top_k most similar chunks"""
+        await self._refresh()
+
+        matrix, rows = self._state
+        if not rows or top_k <= 0:
+            return []
+
+        query_vector = (await self.provider.embed([query]))[0]
+        scores = matrix @ query_vector
+        k = min(top_k, len(rows))
+        best = np.argpartition(-scores, k - 1)[:k]
+        best = best[np.argsort(-scores[best])]
+        return [(rows[i]["chunk_id"], float(scores[i])) for i in best if scores[i] > 0]
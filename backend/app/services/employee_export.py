@@ -0,0 +1,151 @@
+"""
+On-demand XLSX / CSV export of onboarded employees from MongoDB
+
+The workbook on local disk is per instance (and lives in /tmp on App
+Service), so it is not a reliable record of every onboarding. This export
+is generated from the employees collection instead, with the columns and
+Aadhaar / UAN / CTC formatting of ExcelWriter:
+
+- filters (date of joining range, designations) are part of the MongoDB
+  query, and only the exported fields are fetched;
+- documents are read with a batched cursor, EMPLOYEE_EXPORT_BATCH_SIZE at a
+  time, so memory does not grow with the number of employees;
+- CSV is streamed to the client batch by batch;
+- XLSX goes through an openpyxl write-only workbook, which spools rows to a
+  temporary file; the finished file is served from disk and deleted by a
+  background task of the response, whether or not the client stays connected.
+"""
+import asyncio
+import codecs
+import csv
+import io
+import logging
+import os
+import tempfile
+from datetime import date
+from typing import Any, AsyncIterator, Dict, List, Optional, Sequence
+
+from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles import Font
+from openpyxl.utils import get_column_letter
+from pymongo import ASCENDING
+
+from ..config import settings
+from .cosmos_connection import cosmos_connection
+from .excel_writer import excel_writer
+
+logger = logging.getLogger(__name__)
+
+EXPORT_FORMATS = ("xlsx", "csv")
+COLUMN_WIDTH = 20
+
+
+class EmployeeExporter:
+    """Streams the employees collection as an XLSX workbook or CSV"""
+
+    @staticmethod
+    def build_query(joined_from: Optional[date] = None, joined_to: Optional[date] = None,
+                    designations: Optional[Sequence[str]] = None) -> Dict:
+        """MongoDB filter; dates of joining are stored as YYYY-MM-DD strings, which compare in date order"""
+        query: Dict[str, Any] = {}
+        joined: Dict[str, str] = {}
+        if joined_from is not None:
+            joined["$gte"] = joined_from.isoformat()
+        if joined_to is not None:
+            joined["$lte"] = joined_to.isoformat()
+        if joined:
+            query["date_of_joining"] = joined
+        designations = [designation for designation in designations or [] if designation]
+        if len(designations) == 1:
+            query["designation"] = designations[0]
+        elif designations:
+            query["designation"] = {"$in": designations}
+        return query
+
+    async def batches(self, query: Dict) -> AsyncIterator[List[List[Any]]]:
+        """Formatted rows in onboarding order, one cursor batch at a time"""
+        batch_size = settings.EMPLOYEE_EXPORT_BATCH_SIZE
+        projection = {"_id": 0, **{col: 1 for col in excel_writer.COLUMN_ORDER}}
+        cursor = (
+            cosmos_connection.get_collection("employees")
+            .find(query, projection)
+            .sort("_id", ASCENDING)
+            .batch_size(batch_size)
+        )
+        rows: List[List[Any]] = []
+        async for doc in cursor:
+            rows.append(excel_writer.format_row(doc))
+            if len(rows) >= batch_size:
+                yield rows
+                rows = []
+        if rows:
+            yield rows
+
+    async def csv_chunks(self, query: Dict) -> AsyncIterator[bytes]:
+        """CSV with a header row, one encoded chunk per cursor batch"""
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(excel_writer.COLUMN_ORDER)
+        # The BOM makes Excel open the file as UTF-8
+        yield codecs.BOM_UTF8 + buffer.getvalue().encode("utf-8")
+        try:
+            async for rows in self.batches(query):
+                buffer.seek(0)
+                buffer.truncate()
+                writer.writerows(rows)
+                yield buffer.getvalue().encode("utf-8")
+        except Exception as e:
+            # The response has started; the client sees a truncated file
+            logger.error(f"Employee CSV export failed mid-stream: {str(e)}")
+            raise
+
+    def _append_rows(self, worksheet, rows: List[List[Any]], number_formats: List[Optional[str]]):
+        for row in rows:
+            cells = []
+            for value, number_format in zip(row, number_formats):
+                if number_format is None or value in (None, ""):
+                    cells.append(value)
+                    continue
+                cell = WriteOnlyCell(worksheet, value=value)
+                cell.number_format = number_format
+                cells.append(cell)
+            worksheet.append(cells)
+
+    async def write_xlsx(self, query: Dict) -> str:
+        """Write the workbook to a temporary file and return its path (the caller deletes it)"""
+        workbook = Workbook(write_only=True)
+        worksheet = workbook.create_sheet(excel_writer.SHEET_NAME)
+        for index in range(1, len(excel_writer.COLUMN_ORDER) + 1):
+            worksheet.column_dimensions[get_column_letter(index)].width = COLUMN_WIDTH
+        header = []
+        for col in excel_writer.COLUMN_ORDER:
+            cell = WriteOnlyCell(worksheet, value=col)
+            cell.font = Font(bold=True)
+            header.append(cell)
+        worksheet.append(header)
+        number_formats = [excel_writer.NUMBER_FORMATS.get(col) for col in excel_writer.COLUMN_ORDER]
+
+        fd, path = tempfile.mkstemp(prefix="employees-", suffix=".xlsx")
+        os.close(fd)
+        try:
+            async for rows in self.batches(query):
+                await asyncio.to_thread(self._append_rows, worksheet, rows, number_formats)
+            await asyncio.to_thread(workbook.save, path)
+        except BaseException:
+            # Also when the request is cancelled, so no file of personal data is left behind
+            self.remove_file(path)
+            raise
+        return path
+
+    @staticmethod
+    def remove_file(path: str):
+        """Delete a finished export file"""
+        try:
+            os.unlink(path)
+        except FileNotFoundError:
+            pass
+
+
+# Global instance
+employee_exporter = EmployeeExporter()
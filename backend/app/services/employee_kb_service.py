@@ -1,13 +1,19 @@
+import asyncio
 from datetime import datetime, timezone
 from typing import List, Optional, Dict, Any
 from bson import ObjectId
 import logging
-from pymongo import MongoClient
-from pymongo.database import Database
-from pymongo.collection import Collection
-from pymongo.cursor import Cursor
+from motor.motor_asyncio import AsyncIOMotorCollection
 
+from ..config import settings
 from ..models.policy import EmployeeKB, EmployeeKBCreate, EmployeeKBUpdate
+from .cosmos_connection import cosmos_connection
+from .retrieval import BM25Index, build_context
+from .embedding_store import EmbeddingStore, create_embedding_provider
+from .content_version import content_versions, KB_CORPUS
+from .digest import Digest, build_digest_context, content_hash, digest_worker, summarize, use_digests
+from .token_budget import ContextBlock, count_tokens, pack_blocks
+from .shared_cache import shared_cache
 
 logger = logging.getLogger(__name__)
 
@@ -16,34 +22,38 @@ class EmployeeKBService:
     
     def __init__(self):
         self.collection_name = "employee_kb_docs"
-        self.client: MongoClient = None
-        self.db: Database = None
-        self.collection: Collection = None
+        self.collection: AsyncIOMotorCollection = None
+        self.retrieval_index = BM25Index(settings.RETRIEVAL_CHUNK_SIZE, settings.RETRIEVAL_CHUNK_OVERLAP)
+        self._index_lock = asyncio.Lock()
+        self.digests: Dict[str, Digest] = {}
+        self.embedding_store: Optional[EmbeddingStore] = None
+        if settings.EMBEDDINGS_ENABLED:
+            self.embedding_store = EmbeddingStore(
+                self.collection_name,
+                settings.EMBEDDING_STORE_DIR,
+                create_embedding_provider(),
+                settings.RETRIEVAL_CHUNK_SIZE,
+                settings.RETRIEVAL_CHUNK_OVERLAP
+            )
         
-    def _connect(self):
-        """Establish connection to MongoDB"""
+    async def _connect(self):
+        """Borrow the KB collection from the shared connection registry"""
         try:
-            # Use the same connection logic as mongo_ops.py
-            from .mongo_ops import mongo_service
-            if mongo_service.db is None:
-                mongo_service.connect()
-            
-            self.client = mongo_service.client
-            self.db = mongo_service.db
-            self.collection = self.db[self.collection_name]
+            self.collection = cosmos_connection.get_collection(self.collection_name)
             
         except Exception as e:
             logger.error(f"Failed to connect to MongoDB: {str(e)}")
             raise
     
-    def create_document(self, kb_doc: EmployeeKBCreate) -> str:
+    async def create_document(self, kb_doc: EmployeeKBCreate) -> str:
         """Create a new Employee KB document"""
         try:
             if self.collection is None:
-                self._connect()
+                await self._connect()
             
             # Convert to dict and add timestamps
             doc_dict = kb_doc.model_dump()
+            doc_dict["token_count"] = count_tokens(kb_doc.content)
             doc_dict["created_at"] = datetime.now(timezone.utc)
             doc_dict["updated_at"] = datetime.now(timezone.utc)
             
@@ -54,8 +64,11 @@ class EmployeeKBService:
 
             
             # Insert into MongoDB
-            result = self.collection.insert_one(doc_dict)
+            result = await self.collection.insert_one(doc_dict)
             doc_id = str(result.inserted_id)
+            await self._index_document(doc_id, doc_dict["title"], doc_dict["content"])
+            self._track_digest(doc_id, doc_dict["content"])
+            content_versions.bump(KB_CORPUS)
             
             logger.info(f"Created Employee KB document: {doc_id}")
             return doc_id
@@ -64,11 +77,11 @@ class EmployeeKBService:
             logger.error(f"Failed to create Employee KB document: {str(e)}")
             raise
     
-    def get_document_by_id(self, doc_id: str) -> Optional[EmployeeKB]:
+    async def get_document_by_id(self, doc_id: str) -> Optional[EmployeeKB]:
         """Get an Employee KB document by ID"""
         try:
             if self.collection is None:
-                self._connect()
+                await self._connect()
             
             # Convert string ID to ObjectId
             try:
@@ -77,7 +90,7 @@ class EmployeeKBService:
                 logger.warning(f"Invalid ObjectId format: {doc_id}")
                 return None
             
-            doc = self.collection.find_one({"_id": object_id})
+            doc = await self.collection.find_one({"_id": object_id})
             if doc:
                 # Convert MongoDB ObjectId to string
                 doc["id"] = str(doc["_id"])
@@ -91,15 +104,15 @@ class EmployeeKBService:
     
 
     
-    def get_all_documents(self, limit: int = 100) -> List[EmployeeKB]:
+    async def get_all_documents(self, limit: int = 100) -> List[EmployeeKB]:
         """Get all Employee KB documents"""
         try:
             if self.collection is None:
-                self._connect()
+                await self._connect()
             
             query = {}
             cursor = self.collection.find(query).limit(limit)
-            docs = list(cursor)
+            docs = await cursor.to_list(length=None)
             
             result = []
             for doc in docs:
@@ -113,20 +126,22 @@ class EmployeeKBService:
             logger.error(f"Failed to get all Employee KB documents: {str(e)}")
             raise
     
-    def update_document(self, doc_id: str, updates: EmployeeKBUpdate) -> bool:
+    async def update_document(self, doc_id: str, updates: EmployeeKBUpdate) -> bool:
         """Update an Employee KB document"""
         try:
             if self.collection is None:
-                self._connect()
+                await self._connect()
             
             # Check if document exists
-            existing_doc = self.get_document_by_id(doc_id)
+            existing_doc = await self.get_document_by_id(doc_id)
             if not existing_doc:
                 logger.warning(f"Employee KB document {doc_id} not found for update")
                 return False
             
             # Prepare update data
             update_dict = updates.model_dump(exclude_unset=True)
+            if update_dict.get("content") is not None:
+                update_dict["token_count"] = count_tokens(update_dict["content"])
             update_dict["updated_at"] = datetime.now(timezone.utc)
             
             # Convert string ID to ObjectId
@@ -137,13 +152,21 @@ class EmployeeKBService:
                 return False
             
             # Update in MongoDB
-            result = self.collection.update_one(
+            result = await self.collection.update_one(
                 {"_id": object_id},
                 {"$set": update_dict}
             )
             
             success = result.modified_count > 0
             if success:
+                updated_doc = await self.get_document_by_id(doc_id)
+                if updated_doc:
+                    await self._index_document(doc_id, updated_doc.title, updated_doc.content)
+                    self._track_digest(
+                        doc_id, updated_doc.content, updated_doc.digest, updated_doc.digest_token_count, updated_doc.digest_hash
+                    )
+                # Bump once the index has the change so nothing is rebuilt from the old content under the new version
+                content_versions.bump(KB_CORPUS)
                 logger.info(f"Updated Employee KB document: {doc_id}")
             else:
                 logger.warning(f"No changes made to Employee KB document: {doc_id}")
@@ -154,11 +177,11 @@ class EmployeeKBService:
             logger.error(f"Failed to update Employee KB document {doc_id}: {str(e)}")
             raise
     
-    def delete_document(self, doc_id: str) -> bool:
+    async def delete_document(self, doc_id: str) -> bool:
         """Delete an Employee KB document"""
         try:
             if self.collection is None:
-                self._connect()
+                await self._connect()
             
             # Convert string ID to ObjectId
             try:
@@ -167,10 +190,12 @@ class EmployeeKBService:
                 logger.warning(f"Invalid ObjectId format: {doc_id}")
                 return False
             
-            result = self.collection.delete_one({"_id": object_id})
+            result = await self.collection.delete_one({"_id": object_id})
             
             success = result.deleted_count > 0
             if success:
+                await self._unindex_document(doc_id)
+                content_versions.bump(KB_CORPUS)
                 logger.info(f"Deleted Employee KB document: {doc_id}")
             else:
                 logger.warning(f"Employee KB document {doc_id} not found for deletion")
@@ -183,11 +208,11 @@ class EmployeeKBService:
     
 
     
-    def get_document_stats(self) -> Dict[str, Any]:
+    async def get_document_stats(self) -> Dict[str, Any]:
         """Get statistics about Employee KB documents"""
         try:
             if self.collection is None:
-                self._connect()
+                await self._connect()
             
             pipeline = [
                 {"$group": {
@@ -201,7 +226,7 @@ class EmployeeKBService:
             ]
             
             cursor = self.collection.aggregate(pipeline)
-            result = list(cursor)
+            result = await cursor.to_list(length=None)
             
             if result:
                 stats = result[0]
@@ -215,25 +240,128 @@ class EmployeeKBService:
             logger.error(f"Failed to get Employee KB stats: {str(e)}")
             raise
 
-    def get_all_documents_for_context(self) -> str:
-        """Get all Employee KB documents content for AI context (Global Mode)"""
+    def _track_digest(self, doc_id: str, content: str, digest: Optional[str] = None, digest_token_count: Optional[int] = None,
+                      digest_hash: Optional[str] = None):
+        """Keep the document's digest in memory if it matches the content, else queue a new one"""
+        if digest is not None and digest_hash == content_hash(content):
+            self.digests[doc_id] = Digest(digest, digest_token_count if digest_token_count is not None else count_tokens(digest))
+        else:
+            self.digests.pop(doc_id, None)
+            digest_worker.schedule(KB_CORPUS, doc_id)
+    
+    async def refresh_digest(self, doc_id: str):
+        """Write the digest of a document whose content changed since its last digest (digest worker)"""
+        doc = await self.get_document_by_id(doc_id)
+        if doc is None or (doc.digest is not None and doc.digest_hash == content_hash(doc.content)):
+            return
+        digest = summarize(doc.content, settings.GLOBAL_DIGEST_MAX_TOKENS)
+        tokens = count_tokens(digest)
+        # Only if the content is still what was summarized
+        result = await self.collection.update_one(
+            {"_id": ObjectId(doc_id), "content": doc.content},
+            {"$set": {"digest": digest, "digest_token_count": tokens, "digest_hash": content_hash(doc.content)}}
+        )
+        if result.modified_count > 0:
+            # No version bump: digest contexts are hashed into their answer cache key
+            self._track_digest(doc_id, doc.content, digest, tokens, content_hash(doc.content))
+            logger.info(f"Wrote digest for Employee KB document {doc_id} ({tokens} tokens)")
+    
+    async def _index_document(self, doc_id: str, title: str, content: str):
+        """Apply a single document write to the retrieval indexes if they are loaded"""
+        if self.retrieval_index.loaded_at is None:
+            return
+        entry = (doc_id, f"Document: {title}", title, content, title)
+        self.retrieval_index.upsert_document(*entry)
+        if self.embedding_store is not None:
+            try:
+                await self.embedding_store.upsert_document(*entry)
+            except Exception as e:
+                logger.warning(f"Failed to update embeddings for KB document {doc_id}: {str(e)}")
+    
+    async def _unindex_document(self, doc_id: str):
+        """Remove a deleted document from the retrieval indexes if they are loaded"""
+        self.digests.pop(doc_id, None)
+        if self.retrieval_index.loaded_at is None:
+            return
+        self.retrieval_index.remove_document(doc_id)
+        if self.embedding_store is not None:
+            try:
+                await self.embedding_store.remove_document(doc_id)
+            except Exception as e:
+                logger.warning(f"Failed to remove embeddings for KB document {doc_id}: {str(e)}")
+    
+    async def get_retrieval_index(self) -> BM25Index:
+        """Get the retrieval index, (re)building it from MongoDB when missing or stale"""
+        if self.retrieval_index.is_stale(settings.RETRIEVAL_INDEX_REFRESH_SECONDS):
+            if self.collection is None:
+                await self._connect()
+            async with self._index_lock:
+                if self.retrieval_index.is_stale(settings.RETRIEVAL_INDEX_REFRESH_SECONDS):
+                    projection = {"title": 1, "content": 1, "digest": 1, "digest_token_count": 1, "digest_hash": 1}
+                    docs = await self.collection.find({}, projection).to_list(length=None)
+                    entries = [
+                        (str(doc["_id"]), f"Document: {doc['title']}", doc["title"], doc["content"], doc["title"])
+                        for doc in docs
+                    ]
+                    self.retrieval_index.rebuild(entries)
+                    self.digests.clear()
+                    for doc in docs:
+                        self._track_digest(
+                            str(doc["_id"]), doc["content"], doc.get("digest"), doc.get("digest_token_count"), doc.get("digest_hash")
+                        )
+                    if self.embedding_store is not None:
+                        try:
+                            await self.embedding_store.sync(entries)
+                        except Exception as e:
+                            logger.warning(f"Failed to sync KB embeddings: {str(e)}")
+        return self.retrieval_index
+    
+    async def get_all_documents_for_context(self, question: Optional[str] = None, token_budget: Optional[int] = None) -> str:
+        """Get Employee KB documents content for AI context (Global Mode)
+        
+        With a question, only the most relevant chunks are returned
+        (see RETRIEVAL_* settings) instead of every document; a large KB is
+        sent as document digests plus the full text of the most relevant
+        documents (see GLOBAL_DIGEST_* settings). With a
+        token_budget the context is packed to fit, keeping documents in
+        relevance (or title) order.
+        """
         try:
             if self.collection is None:
-                self._connect()
+                await self._connect()
+            
+            if question and settings.RETRIEVAL_ENABLED:
+                index = await self.get_retrieval_index()
+                if index.document_count == 0:
+                    raise ValueError("No Employee KB documents found")
+                if use_digests(index, self.digests):
+                    return build_digest_context(index, self.digests, question, "documents", token_budget)
+                return await build_context(
+                    index,
+                    question,
+                    settings.RETRIEVAL_TOP_K,
+                    settings.RETRIEVAL_CONTEXT_CHAR_BUDGET,
+                    self.embedding_store,
+                    token_budget
+                )
             
             # Get all documents (like get_all_sections() in policy service)
             cursor = self.collection.find().sort("title", 1)
-            docs = list(cursor)
+            docs = await cursor.to_list(length=None)
             
             if not docs:
                 raise ValueError("No Employee KB documents found")
             
             # Build comprehensive context (like Global Mode does)
-            context_parts = []
+            blocks = []
             for doc in docs:
-                context_parts.append(f"Document: {doc['title']}\n{doc['content']}\n")
+                heading = f"Document: {doc['title']}"
+                tokens = doc.get("token_count")
+                if tokens is not None:
+                    tokens += count_tokens(heading) + 2
+                blocks.append(ContextBlock(f"{heading}\n{doc['content']}\n", tokens))
             
-            return "\n".join(context_parts)
+            return pack_blocks(blocks, token_budget).text
             
         except Exception as e:
             logger.error(f"Failed to get documents for context: {str(e)}")
@@ -241,3 +369,5 @@ class EmployeeKBService:
 
 # Global instance
 employee_kb_service = EmployeeKBService()
+digest_worker.register(KB_CORPUS, employee_kb_service.refresh_digest)
+shared_cache.on_remote_write(KB_CORPUS, employee_kb_service.retrieval_index.expire)
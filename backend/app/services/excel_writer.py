@@ -1,11 +1,13 @@
 import os
 import logging
-from typing import Dict
-import pandas as pd
+from typing import Any, Dict, List, Optional
+import openpyxl
 from pathlib import Path
 from dotenv import load_dotenv
 import filelock
 
+from .xlsx_append import AppendableSheet, NotAppendable
+
 # Load environment variables
 load_dotenv(encoding="utf-8", override=True)
 
@@ -14,13 +16,13 @@ logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 class ExcelWriter:
-    def __init__(self):
-        # Use EXCEL_FILE if set, else default to ./data/onboarded_employees.xlsx
+    def __init__(self, excel_file: Optional[str] = None):
+        # Use excel_file or EXCEL_FILE if set, else default to ./data/onboarded_employees.xlsx
         # Get the directory where this script is located and resolve to absolute path
         script_dir = Path(__file__).resolve().parent.parent.parent
         default_excel_path = script_dir / "data" / "onboarded_employees.xlsx"
         
-        self.excel_file = os.getenv("EXCEL_FILE", str(default_excel_path))
+        self.excel_file = excel_file or os.getenv("EXCEL_FILE", str(default_excel_path))
         self.excel_path = Path(self.excel_file).resolve()
         
         # Ensure data directory exists
@@ -44,6 +46,61 @@ class ExcelWriter:
             "emergency_contact_number",
             "created_at"
         ]
+        
+        # Text for Aadhaar / UAN (no scientific notation), Indian Rupee format for CTC
+        self.NUMBER_FORMATS = {
+            "aadhaar_number": "@",
+            "uan": "@",
+            "ctc_at_joining": "₹#,##0.00",
+        }
+        self.SHEET_NAME = "Employees"
+        self.sheet = AppendableSheet(self.SHEET_NAME, self.COLUMN_ORDER, self.NUMBER_FORMATS)
+    
+    def format_row(self, doc: Dict) -> List[Any]:
+        """Cell values of an employee document, in COLUMN_ORDER"""
+        excel_doc = {}
+        for key, value in doc.items():
+            if key in ['date_of_birth', 'date_of_joining', 'created_at']:
+                # Format dates as YYYY-MM-DD
+                if hasattr(value, 'strftime'):
+                    excel_doc[key] = value.strftime('%Y-%m-%d')
+                elif hasattr(value, 'isoformat'):
+                    excel_doc[key] = value.isoformat()[:10]
+                else:
+                    excel_doc[key] = str(value)
+            elif key in ['aadhaar_number', 'uan']:
+                # Format Aadhaar and UAN as text strings to prevent scientific notation
+                excel_doc[key] = f'"{str(value)}"' if value else '""'
+            elif key == 'ctc_at_joining':
+                # Format CTC as currency in rupees
+                excel_doc[key] = float(value) if value else 0.0
+            else:
+                excel_doc[key] = value
+        return [excel_doc.get(col, "") for col in self.COLUMN_ORDER]
+    
+    def _existing_rows(self) -> List[List[Any]]:
+        """Rows of a workbook written by an earlier version, to carry over into the appendable layout"""
+        try:
+            workbook = openpyxl.load_workbook(self.excel_path, read_only=True)
+        except Exception as e:
+            backup_path = self.excel_path.with_name(self.excel_path.name + ".bak")
+            logger.warning(f"Error reading existing Excel file: {str(e)}. Moved it to {backup_path.name}, creating new file.")
+            self.excel_path.replace(backup_path)
+            return []
+        try:
+            rows = workbook.worksheets[0].iter_rows(values_only=True)
+            header = [str(value) if value is not None else "" for value in next(rows, ())]
+            if not all(col in header for col in self.COLUMN_ORDER):
+                logger.warning("Existing Excel file has different columns. Recreating with correct structure.")
+                return []
+            positions = [header.index(col) for col in self.COLUMN_ORDER]
+            return [
+                [_cell_value(row[position]) if position < len(row) else "" for position in positions]
+                for row in rows
+                if any(value is not None for value in row)
+            ]
+        finally:
+            workbook.close()
     
     def append_employee_row(self, doc: Dict) -> str:
         """
@@ -55,10 +112,20 @@ class ExcelWriter:
         Returns:
             str: "ok" if successful, "failed" if failed
         """
-        logger.info(f"Starting Excel export for employee: {doc.get('employee_code', 'Unknown')}")
-        logger.info(f"Excel file path: {self.excel_path}")
-        logger.info(f"Excel file exists: {self.excel_path.exists()}")
-        logger.info(f"Data directory exists: {self.excel_path.parent.exists()}")
+        return self.append_employee_rows([doc])
+    
+    def append_employee_rows(self, docs: List[Dict]) -> str:
+        """
+        Append several employees to the Excel file in one write
+        
+        The workbook is grown in place (see xlsx_append), so the cost depends
+        on the number of new rows, not on the size of the file. A file in
+        any other layout is rewritten once, keeping its rows.
+        
+        Returns:
+            str: "ok" if successful, "failed" if failed
+        """
+        logger.info(f"Starting Excel export for {len(docs)} employee(s): {', '.join(str(doc.get('employee_code', 'Unknown')) for doc in docs)}")
         
         # Create lock file path for concurrent write safety
         lock_path = self.excel_path.with_suffix('.lock')
@@ -66,100 +133,19 @@ class ExcelWriter:
         try:
             # Use filelock to ensure thread-safe writes
             with filelock.FileLock(str(lock_path), timeout=30):
-                # Convert dates to YYYY-MM-DD format for Excel
-                excel_doc = {}
-                for key, value in doc.items():
-                    if key in ['date_of_birth', 'date_of_joining']:
-                        # Format dates as YYYY-MM-DD
-                        if hasattr(value, 'strftime'):
-                            excel_doc[key] = value.strftime('%Y-%m-%d')
-                        elif hasattr(value, 'isoformat'):
-                            # Handle ISO string dates
-                            excel_doc[key] = value.isoformat()[:10]  # Take YYYY-MM-DD part
-                        else:
-                            excel_doc[key] = str(value)
-                    elif key == 'created_at':
-                        # Format created_at as YYYY-MM-DD
-                        if hasattr(value, 'strftime'):
-                            excel_doc[key] = value.strftime('%Y-%m-%d')
-                        elif hasattr(value, 'isoformat'):
-                            excel_doc[key] = value.isoformat()[:10]
-                        else:
-                            excel_doc[key] = str(value)
-                    elif key in ['aadhaar_number', 'uan']:
-                        # Format Aadhaar and UAN as text strings to prevent scientific notation
-                        excel_doc[key] = f'"{str(value)}"' if value else '""'
-                    elif key == 'ctc_at_joining':
-                        # Format CTC as currency in rupees
-                        excel_doc[key] = float(value) if value else 0.0
-                    else:
-                        excel_doc[key] = value
-                
-                # Ensure all columns exist in the document
-                for col in self.COLUMN_ORDER:
-                    if col not in excel_doc:
-                        excel_doc[col] = ""
-                
-                # Create DataFrame with exact column order
-                df_new = pd.DataFrame([excel_doc])
-                df_new = df_new[self.COLUMN_ORDER]
-                
-                # Ensure Aadhaar and UAN columns are treated as text
-                if 'aadhaar_number' in df_new.columns:
-                    df_new['aadhaar_number'] = df_new['aadhaar_number'].astype(str)
-                if 'uan' in df_new.columns:
-                    df_new['uan'] = df_new['uan'].astype(str)
-                
+                rows = [self.format_row(doc) for doc in docs]
                 if self.excel_path.exists():
-                    # Read existing file
                     try:
-                        df_existing = pd.read_excel(self.excel_path)
-                        
-                        # Ensure existing file has correct columns
-                        if not all(col in df_existing.columns for col in self.COLUMN_ORDER):
-                            logger.warning("Existing Excel file has different columns. Recreating with correct structure.")
-                            df_existing = pd.DataFrame(columns=self.COLUMN_ORDER)
-                        
-                        # Ensure existing Aadhaar and UAN columns are treated as text
-                        if 'aadhaar_number' in df_existing.columns:
-                            df_existing['aadhaar_number'] = df_existing['aadhaar_number'].astype(str)
-                        if 'uan' in df_existing.columns:
-                            df_existing['uan'] = df_existing['uan'].astype(str)
-                        
-                        # Append new row
-                        df_combined = pd.concat([df_existing, df_new], ignore_index=True)
-                        
-                    except Exception as e:
-                        logger.warning(f"Error reading existing Excel file: {str(e)}. Creating new file.")
-                        df_combined = df_new
+                        self.sheet.append(self.excel_path, rows)
+                        logger.info(f"Employee data appended to Excel file: {self.excel_path}")
+                        return "ok"
+                    except NotAppendable as e:
+                        logger.info(f"Rewriting {self.excel_path.name} in the appendable layout: {str(e)}")
+                        rows = self._existing_rows() + rows
                 else:
-                    # Create new file
-                    df_combined = df_new
                     logger.info(f"Creating new Excel file: {self.excel_path}")
                 
-                # Save to Excel with exact column order and text formatting
-                df_combined = df_combined[self.COLUMN_ORDER]
-                
-                # Create Excel writer with specific formatting
-                with pd.ExcelWriter(self.excel_path, engine='openpyxl') as writer:
-                    df_combined.to_excel(writer, index=False, sheet_name='Employees')
-                    
-                    # Get the worksheet to apply text formatting
-                    worksheet = writer.sheets['Employees']
-                    
-                    # Format Aadhaar and UAN columns as text
-                    for col_num, col_name in enumerate(df_combined.columns, 1):
-                        if col_name in ['aadhaar_number', 'uan']:
-                            # Apply text format to entire column
-                            for row_num in range(2, len(df_combined) + 2):  # Start from row 2 (skip header)
-                                cell = worksheet.cell(row=row_num, column=col_num)
-                                cell.number_format = '@'  # Text format
-                        elif col_name == 'ctc_at_joining':
-                            # Apply currency format to CTC column (Indian Rupees)
-                            for row_num in range(2, len(df_combined) + 2):  # Start from row 2 (skip header)
-                                cell = worksheet.cell(row=row_num, column=col_num)
-                                cell.number_format = '₹#,##0.00'  # Indian Rupee format
-                
+                self.sheet.create(self.excel_path, rows)
                 logger.info(f"Employee data appended to Excel file: {self.excel_path}")
                 return "ok"
                 
@@ -175,5 +161,14 @@ class ExcelWriter:
                     pass
 
 
+def _cell_value(value: Any) -> Any:
+    """A cell read from an older workbook, as format_row would have written it"""
+    if value is None:
+        return ""
+    if hasattr(value, 'strftime'):
+        return value.strftime('%Y-%m-%d')
+    return value
+
+
 # Global instance
 excel_writer = ExcelWriter()
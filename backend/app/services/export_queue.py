@@ -0,0 +1,277 @@
+"""
+Durable queue for the Excel export of onboarded employees
+
+/api/onboard used to append to the workbook inside the request, holding the
+response (and a file lock for up to 30 s) on a disk write. Now the
+employee document is inserted with an `export_pending` marker (part of the
+same single-document write, so it cannot be lost), the request records an
+entry in the MongoDB `export_outbox` collection, and a background worker in
+each app process drains the outbox:
+
+- each pass first queues employees still carrying the marker, so an
+  employee whose outbox write failed, or whose process died right after the
+  insert, is exported anyway; the marker is removed once the entry exists;
+- entries are claimed in batches (oldest first) with an atomic update, so
+  several workers / instances never export the same entry concurrently;
+- each batch is one ExcelWriter.append_employee_rows call;
+- a failed batch is retried with jittered exponential backoff. A claim not
+  completed within EXPORT_CLAIM_TIMEOUT_SECONDS (a worker that crashed or
+  hung on the batch) counts as a failed attempt too, and entries that fail
+  EXPORT_MAX_ATTEMPTS times are marked failed;
+- the entry id is the employee id (the idempotency key), so queueing an
+  employee again is a no-op. A worker that dies between writing a batch and
+  marking it exported leaves it to be exported again after the claim
+  timeout; stop() waits for the current batch to avoid that on shutdown.
+
+Entries only reference the employee; the row is read from the employees
+collection at export time, so no personal data is copied into the outbox.
+Exported entries are deleted after EXPORT_RETENTION_DAYS.
+"""
+import asyncio
+import logging
+import uuid
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional
+
+from bson import ObjectId
+from motor.motor_asyncio import AsyncIOMotorCollection
+from pymongo import ASCENDING
+
+from ..config import settings
+from .cosmos_connection import cosmos_connection
+from .excel_writer import excel_writer
+from .resilience import RetryPolicy
+
+logger = logging.getLogger(__name__)
+
+STATUS_PENDING = "pending"
+STATUS_EXPORTING = "exporting"
+STATUS_EXPORTED = "exported"
+STATUS_FAILED = "failed"
+STATUSES = (STATUS_PENDING, STATUS_EXPORTING, STATUS_EXPORTED, STATUS_FAILED)
+
+# Field set on an employee document until its outbox entry exists
+PENDING_EXPORT_FIELD = "export_pending"
+
+# How long stop() lets a batch that is being written finish
+STOP_TIMEOUT_SECONDS = 30.0
+
+
+class ExportQueue:
+    """MongoDB outbox of pending Excel exports and the worker that drains it"""
+
+    def __init__(self):
+        self.collection_name = "export_outbox"
+        self.collection: Optional[AsyncIOMotorCollection] = None
+        self.retry_policy = RetryPolicy(
+            max_attempts=settings.EXPORT_MAX_ATTEMPTS,
+            base_delay=settings.EXPORT_RETRY_BASE_SECONDS,
+            max_delay=settings.EXPORT_RETRY_MAX_SECONDS
+        )
+        self._wake = asyncio.Event()
+        self._stopping = False
+        self._task: Optional[asyncio.Task] = None
+        self.batches = 0
+        self.exported = 0
+        self.failed_batches = 0
+        self.last_batch_size = 0
+        self.last_error: Optional[str] = None
+
+    async def _get_collection(self) -> AsyncIOMotorCollection:
+        if self.collection is None:
+            collection = cosmos_connection.get_collection(self.collection_name)
+            try:
+                await collection.create_index([("status", ASCENDING), ("next_attempt_at", ASCENDING)])
+                await collection.create_index(
+                    "exported_at", expireAfterSeconds=settings.EXPORT_RETENTION_DAYS * 24 * 3600
+                )
+                await cosmos_connection.get_collection("employees").create_index(PENDING_EXPORT_FIELD, sparse=True)
+            except Exception as e:
+                logger.warning(f"Could not create the export outbox indexes: {str(e)}")
+            self.collection = collection
+        return self.collection
+
+    async def enqueue(self, employee_id: str, employee_code: Optional[str] = None) -> str:
+        """Queue an employee for export (once per employee); returns the export status for the API"""
+        await self._insert_entry(employee_id, employee_code)
+        # Export soon rather than at the next poll; rows queued meanwhile join the batch
+        self._wake.set()
+        return "queued"
+
+    async def _insert_entry(self, employee_id: str, employee_code: Optional[str]):
+        collection = await self._get_collection()
+        now = datetime.now(timezone.utc)
+        await collection.update_one(
+            {"_id": employee_id},
+            {"$setOnInsert": {
+                "employee_code": employee_code,
+                "status": STATUS_PENDING,
+                "attempts": 0,
+                "created_at": now,
+                "next_attempt_at": now,
+            }},
+            upsert=True
+        )
+
+    async def _queue_marked(self) -> int:
+        """Queue employees whose export_pending marker is still set; returns how many"""
+        employees = cosmos_connection.get_collection("employees")
+        cursor = employees.find({PENDING_EXPORT_FIELD: True}, {"employee_code": 1}).limit(settings.EXPORT_BATCH_SIZE)
+        marked = [doc async for doc in cursor]
+        if not marked:
+            return 0
+        for doc in marked:
+            await self._insert_entry(str(doc["_id"]), doc.get("employee_code"))
+        # Entries are inserted first, so a crash in between only queues them again (a no-op)
+        await employees.update_many(
+            {"_id": {"$in": [doc["_id"] for doc in marked]}},
+            {"$unset": {PENDING_EXPORT_FIELD: ""}}
+        )
+        return len(marked)
+
+    async def get_entry(self, employee_id: str) -> Optional[Dict]:
+        """Export status of one employee, or None if it was never queued (or has expired)"""
+        collection = await self._get_collection()
+        entry = await collection.find_one({"_id": employee_id}, {"claimed_by": 0})
+        if entry is None:
+            return None
+        entry["employee_id"] = entry.pop("_id")
+        return entry
+
+    async def _release_stale_claims(self, now: datetime):
+        """Count claims older than EXPORT_CLAIM_TIMEOUT_SECONDS as failed attempts, making them due again"""
+        collection = await self._get_collection()
+        stale_before = now - timedelta(seconds=settings.EXPORT_CLAIM_TIMEOUT_SECONDS)
+        cursor = collection.find({"status": STATUS_EXPORTING, "claimed_at": {"$lte": stale_before}})
+        stale = [doc async for doc in cursor.limit(settings.EXPORT_BATCH_SIZE)]
+        if stale:
+            logger.warning(f"Taking over {len(stale)} export claim(s) not completed in time")
+            await self._record_failure(stale, "Export claim timed out", now)
+
+    async def _record_failure(self, entries: List[Dict], error: str, now: datetime):
+        """Retry claimed entries after a backoff, or mark them failed after EXPORT_MAX_ATTEMPTS"""
+        collection = await self._get_collection()
+        for entry in entries:
+            attempts = entry.get("attempts", 0) + 1
+            update = {"attempts": attempts, "last_error": error, "updated_at": now}
+            if attempts >= settings.EXPORT_MAX_ATTEMPTS:
+                update["status"] = STATUS_FAILED
+                logger.error(f"Giving up on the Excel export of {entry['_id']} after {attempts} attempts")
+            else:
+                update["status"] = STATUS_PENDING
+                update["next_attempt_at"] = now + timedelta(seconds=self.retry_policy.backoff(attempts))
+            # Only while the claim is still this one, so an attempt is never counted twice
+            await collection.update_one(
+                {"_id": entry["_id"], "status": STATUS_EXPORTING, "claimed_by": entry.get("claimed_by")},
+                {"$set": update, "$unset": {"claimed_by": ""}}
+            )
+
+    async def _claim(self) -> List[Dict]:
+        """Claim the oldest due entries, up to one batch"""
+        collection = await self._get_collection()
+        now = datetime.now(timezone.utc)
+        await self._release_stale_claims(now)
+        claimable = {"status": STATUS_PENDING, "next_attempt_at": {"$lte": now}}
+        cursor = collection.find(claimable, {"_id": 1}).sort("created_at", ASCENDING).limit(settings.EXPORT_BATCH_SIZE)
+        ids = [doc["_id"] async for doc in cursor]
+        if not ids:
+            return []
+        token = uuid.uuid4().hex
+        # Only entries still claimable are taken, so a concurrent worker's claims are left alone
+        await collection.update_many(
+            {"_id": {"$in": ids}, **claimable},
+            {"$set": {"status": STATUS_EXPORTING, "claimed_by": token, "claimed_at": now}}
+        )
+        cursor = collection.find({"claimed_by": token, "status": STATUS_EXPORTING}).sort("created_at", ASCENDING)
+        return [doc async for doc in cursor]
+
+    async def _load_employees(self, entries: List[Dict]) -> Dict[str, Dict]:
+        employees = cosmos_connection.get_collection("employees")
+        object_ids = [ObjectId(entry["_id"]) for entry in entries if ObjectId.is_valid(entry["_id"])]
+        cursor = employees.find({"_id": {"$in": object_ids}})
+        return {str(doc["_id"]): doc async for doc in cursor}
+
+    async def _export_batch(self) -> int:
+        """Export one claimed batch; returns how many entries were claimed"""
+        entries = await self._claim()
+        if not entries:
+            return 0
+        collection = await self._get_collection()
+        ids = [entry["_id"] for entry in entries]
+        employees = await self._load_employees(entries)
+        rows = [employees[entry["_id"]] for entry in entries if entry["_id"] in employees]
+        if len(rows) < len(entries):
+            logger.warning(f"{len(entries) - len(rows)} queued employee(s) no longer exist; skipping their export")
+
+        status = await asyncio.to_thread(excel_writer.append_employee_rows, rows) if rows else "ok"
+        now = datetime.now(timezone.utc)
+        self.batches += 1
+        self.last_batch_size = len(entries)
+        if status == "ok":
+            await collection.update_many(
+                {"_id": {"$in": ids}},
+                {"$set": {"status": STATUS_EXPORTED, "exported_at": now}, "$unset": {"claimed_by": "", "last_error": ""}}
+            )
+            self.exported += len(rows)
+            logger.info(f"Exported {len(rows)} employee(s) to Excel")
+            return len(entries)
+
+        self.failed_batches += 1
+        self.last_error = "Excel export failed"
+        await self._record_failure(entries, self.last_error, now)
+        return len(entries)
+
+    async def _run(self):
+        while not self._stopping:
+            try:
+                await self._queue_marked()
+                # Drain full batches back to back, then wait for a new entry or the next poll
+                while not self._stopping and await self._export_batch() >= settings.EXPORT_BATCH_SIZE:
+                    pass
+            except Exception as e:
+                self.last_error = str(e)
+                logger.warning(f"Export queue pass failed: {str(e)}")
+            if self._stopping:
+                break
+            try:
+                await asyncio.wait_for(self._wake.wait(), settings.EXPORT_POLL_SECONDS)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+
+    def start(self):
+        if self._task is None and settings.EXPORT_QUEUE_ENABLED:
+            self._stopping = False
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Let the batch being written finish (so it is not exported twice), then stop"""
+        if self._task is None:
+            return
+        self._stopping = True
+        self._wake.set()
+        try:
+            await asyncio.wait_for(self._task, STOP_TIMEOUT_SECONDS)
+        except asyncio.TimeoutError:
+            logger.warning("Export queue did not stop in time; its claimed batch will be retried")
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    async def get_stats(self) -> Dict:
+        collection = await self._get_collection()
+        counts = {status: await collection.count_documents({"status": status}) for status in STATUSES}
+        return {
+            "enabled": settings.EXPORT_QUEUE_ENABLED,
+            "running": self._task is not None and not self._task.done(),
+            "entries": counts,
+            "batches": self.batches,
+            "exported": self.exported,
+            "failed_batches": self.failed_batches,
+            "last_batch_size": self.last_batch_size,
+            "last_error": self.last_error,
+        }
+
+
+# Global instance, started with the app
+export_queue = ExportQueue()
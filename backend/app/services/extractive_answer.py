@@ -0,0 +1,125 @@
+"""
+Extractive answers from the retrieval indexes, without calling the AI
+
+Sentences from the best BM25 chunks are scored by how much of the question's
+IDF weight they cover (terms in the section / document heading count for
+half) and the best few are returned under the heading they came from. Used
+as the /api/ask fallback when Azure cannot answer and, optionally, as a fast
+path for questions a single sentence answers outright.
+"""
+import logging
+import math
+from dataclasses import dataclass
+from typing import Container, Dict, List, Optional
+
+from .retrieval import SENTENCE_PATTERN, BM25Index, tokenize
+
+logger = logging.getLogger(__name__)
+
+# Weight of a question term that only appears in the heading of a passage
+HEADING_TERM_WEIGHT = 0.5
+
+# Small bonus for sentences from chunks BM25 ranked higher
+CHUNK_RANK_WEIGHT = 0.1
+
+# Question phrasing that passages never repeat ("how many", "do I need to")
+QUESTION_WORDS = frozenset({"any", "could", "many", "much", "need", "often", "please", "should", "tell", "would"})
+
+# Sentences shorter than this many terms are mostly list headings and labels
+MIN_SENTENCE_TERMS = 3
+
+
+@dataclass
+class Excerpt:
+    """One sentence selected for an extractive answer"""
+    heading: str
+    text: str
+    coverage: float
+    position: tuple
+
+
+@dataclass
+class ExtractiveAnswer:
+    """Best-matching excerpts for a question and how well they cover it (0-1)"""
+    excerpts: List[Excerpt]
+    confidence: float
+
+    @property
+    def references(self) -> List[str]:
+        """Headings of the sections / documents the excerpts came from, best first"""
+        headings: List[str] = []
+        for excerpt in self.excerpts:
+            if excerpt.heading not in headings:
+                headings.append(excerpt.heading)
+        return headings
+
+    def render(self) -> str:
+        """Excerpts grouped under their heading, in document order within each heading"""
+        grouped: Dict[str, List[Excerpt]] = {}
+        for excerpt in self.excerpts:
+            grouped.setdefault(excerpt.heading, []).append(excerpt)
+        parts = []
+        for heading, excerpts in grouped.items():
+            body = " ".join(excerpt.text for excerpt in sorted(excerpts, key=lambda e: e.position))
+            parts.append(f"{heading}\n{body}")
+        return "\n\n".join(parts)
+
+
+def extract_answer(index: BM25Index, question: str, doc_keys: Optional[Container[str]] = None, top_k: int = 5,
+                   max_sentences: int = 3, max_chars: int = 800, min_confidence: float = 0.0) -> Optional[ExtractiveAnswer]:
+    """Pick the sentences that best answer `question`, or None if nothing covers it well enough
+
+    `doc_keys` restricts the search to some documents (the section of a
+    guided question). Confidence is the coverage of the best sentence.
+    """
+    # Terms the corpus never mentions count as rare ones so they lower the confidence
+    unseen_weight = math.log(1 + (len(index) + 0.5) / 0.5)
+    weights = {term: index.idf(term) or unseen_weight for term in set(tokenize(question)) - QUESTION_WORDS}
+    total_weight = sum(weights.values())
+    if total_weight <= 0:
+        return None
+
+    ranked = index.search(question, top_k, doc_keys)
+    if not ranked:
+        return None
+    best_chunk_score = ranked[0][1] or 1.0
+
+    candidates: List[tuple] = []
+    seen = set()
+    for chunk, chunk_score in ranked:
+        heading_terms = set(tokenize(chunk.heading)) & weights.keys()
+        for offset, sentence in enumerate(SENTENCE_PATTERN.split(chunk.text)):
+            sentence = sentence.strip()
+            sentence_terms = set(tokenize(sentence))
+            # Overlapping chunks repeat sentences; keep the first occurrence
+            if len(sentence_terms) < MIN_SENTENCE_TERMS or sentence in seen:
+                continue
+            seen.add(sentence)
+            matched = sentence_terms & weights.keys()
+            if not matched:
+                continue
+            covered = sum(weights[term] for term in matched)
+            covered += HEADING_TERM_WEIGHT * sum(weights[term] for term in heading_terms - matched)
+            coverage = min(1.0, covered / total_weight)
+            score = coverage + CHUNK_RANK_WEIGHT * chunk_score / best_chunk_score
+            position = (chunk.position, chunk.doc_key, chunk.index, offset)
+            candidates.append((score, Excerpt(chunk.heading, sentence, round(coverage, 3), position)))
+
+    if not candidates:
+        return None
+    candidates.sort(key=lambda item: item[0], reverse=True)
+    confidence = candidates[0][1].coverage
+    if confidence < min_confidence:
+        return None
+
+    excerpts: List[Excerpt] = []
+    used = 0
+    for _, excerpt in candidates:
+        # Supporting sentences must cover at least half as much as the best one
+        if excerpts and (excerpt.coverage < confidence / 2 or used + len(excerpt.text) > max_chars):
+            continue
+        excerpts.append(excerpt)
+        used += len(excerpt.text)
+        if len(excerpts) >= max_sentences:
+            break
+    return ExtractiveAnswer(excerpts, confidence)
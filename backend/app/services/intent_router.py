@@ -0,0 +1,223 @@
+"""
+Intent routing for navigational onboarding questions
+
+"What is step 4", "show me the leave policy section" and "how many steps are
+there" are answered straight from the policy sections instead of sending the
+catalog to the model. Patterns are compiled once and anchored to the whole
+message, so anything with a follow-up ("what is step 4 about overtime?")
+still goes to the AI. Titles are matched through a small in-memory index
+that is rebuilt whenever the policies change.
+"""
+import asyncio
+import logging
+import re
+import time
+from collections import Counter
+from dataclasses import dataclass, field
+from typing import Dict, FrozenSet, List, Optional, Tuple
+
+from ..config import settings
+from ..models.policy import PolicySection
+from .content_version import POLICY_CORPUS, content_versions
+from .policy_service import policy_service
+from .retrieval import tokenize
+
+logger = logging.getLogger(__name__)
+
+NUMBER_WORDS = {
+    "one": 1, "two": 2, "three": 3, "four": 4, "five": 5, "six": 6, "seven": 7, "eight": 8, "nine": 9, "ten": 10,
+    "eleven": 11, "twelve": 12, "thirteen": 13, "fourteen": 14, "fifteen": 15, "sixteen": 16, "seventeen": 17,
+    "eighteen": 18, "nineteen": 19, "twenty": 20,
+    "first": 1, "second": 2, "third": 3, "fourth": 4, "fifth": 5, "sixth": 6, "seventh": 7, "eighth": 8, "ninth": 9,
+    "tenth": 10, "eleventh": 11, "twelfth": 12, "thirteenth": 13, "fourteenth": 14, "fifteenth": 15,
+    "sixteenth": 16, "seventeenth": 17, "eighteenth": 18, "nineteenth": 19, "twentieth": 20,
+}
+
+_NUMBER = r"(?:\d{1,3}(?:st|nd|rd|th)?|" + "|".join(sorted(NUMBER_WORDS, key=len, reverse=True)) + r")"
+_UNIT = r"(?:onboarding\s+)?(?:steps?|sections?|polic(?:y|ies)|policy\s+sections?|topics?)"
+_LEAD = r"^(?:please\s+|can\s+you\s+|could\s+you\s+)?"
+_NAVIGATE = r"(?:show|open|display|view|read|go\s+to|take\s+me\s+to|jump\s+to|bring\s+up|find|give\s+me|tell\s+me)(?:\s+me)?"
+_TAIL = r"\s*(?:please)?\s*[?.!]*$"
+
+STEP_COUNT_PATTERN = re.compile(
+    _LEAD + r"(?:how\s+many|what(?:'s|\s+is)\s+the\s+(?:total\s+)?number\s+of)\s+" + _UNIT
+    + r"(?:\s+(?:are\s+there|do\s+(?:i|we)\s+have|are\s+in\s+(?:the\s+)?onboarding|in\s+total|total))?" + _TAIL,
+    re.IGNORECASE
+)
+LIST_PATTERN = re.compile(
+    _LEAD + r"(?:(?:list|" + _NAVIGATE + r")(?:\s+all)?(?:\s+(?:of\s+)?the)?|what\s+are(?:\s+all)?\s+the)\s+"
+    + _UNIT + r"(?:\s+(?:of|in)\s+(?:the\s+)?onboarding)?" + _TAIL
+    + r"|" + _LEAD + r"(?:show\s+(?:me\s+)?)?(?:the\s+)?table\s+of\s+contents" + _TAIL,
+    re.IGNORECASE
+)
+STEP_PATTERN = re.compile(
+    _LEAD + r"(?:(?:what(?:'s|\s+is)|" + _NAVIGATE + r")\s+)?(?:the\s+)?"
+    + r"(?:(?:step|section|policy)\s+(?:number\s+|no\.?\s*|#\s*)?(?P<number>" + _NUMBER + r")"
+    + r"|(?P<ordinal>" + _NUMBER + r")\s+(?:step|section|policy))"
+    + r"(?:\s+(?:about|of\s+(?:the\s+)?onboarding))?" + _TAIL,
+    re.IGNORECASE
+)
+TITLE_PATTERN = re.compile(
+    _LEAD + r"(?:" + _NAVIGATE + r"(?:\s+the)?\s+(?P<target>.+?)(?:\s+(?:section|step|page))?"
+    + r"|what\s+(?:does|is\s+in)\s+the\s+(?P<asked>.+?)\s+(?:section|step)(?:\s+say)?)" + _TAIL,
+    re.IGNORECASE
+)
+
+# Words that describe the catalog rather than a particular section
+GENERIC_TITLE_TERMS = frozenset({"policy", "section", "step", "page", "onboarding"})
+
+
+def parse_number(value: str) -> Optional[int]:
+    """'4', '4th', 'four' or 'fourth' -> 4"""
+    value = value.lower()
+    if value in NUMBER_WORDS:
+        return NUMBER_WORDS[value]
+    digits = re.match(r"\d+", value)
+    return int(digits.group()) if digits else None
+
+
+def title_terms(text: str) -> FrozenSet[str]:
+    return frozenset(tokenize(text)) - GENERIC_TITLE_TERMS
+
+
+@dataclass
+class TitleEntry:
+    section_id: str
+    order: int
+    title: str
+    terms: FrozenSet[str]
+
+
+@dataclass
+class RoutedAnswer:
+    """A navigational question answered without the AI"""
+    intent: str
+    answer: str
+    section_id: Optional[str] = None
+    references: List[str] = field(default_factory=list)
+
+
+class IntentRouter:
+    """Answers navigational onboarding questions from the policy sections"""
+
+    def __init__(self):
+        self._titles: List[TitleEntry] = []
+        self._version: Optional[int] = None
+        self._loaded_at: Optional[float] = None
+        self._lock = asyncio.Lock()
+        self.routed: Counter = Counter()
+        self.passed = 0
+
+    def classify(self, message: str) -> Optional[Tuple[str, Optional[str]]]:
+        """(intent, argument) for a navigational message, None for anything else"""
+        message = " ".join(message.split())
+        if STEP_COUNT_PATTERN.match(message):
+            return "step_count", None
+        if LIST_PATTERN.match(message):
+            return "list_steps", None
+        match = STEP_PATTERN.match(message)
+        if match:
+            return "step_by_order", match.group("number") or match.group("ordinal")
+        match = TITLE_PATTERN.match(message)
+        if match:
+            return "section_by_title", match.group("target") or match.group("asked")
+        return None
+
+    def _is_stale(self) -> bool:
+        if self._loaded_at is None or self._version != content_versions.get(POLICY_CORPUS):
+            return True
+        # Writes made by other workers are only seen after a refresh
+        refresh = settings.RETRIEVAL_INDEX_REFRESH_SECONDS
+        return refresh > 0 and time.monotonic() - self._loaded_at > refresh
+
+    async def _get_titles(self) -> List[TitleEntry]:
+        """The title index, rebuilt from MongoDB when the policies changed"""
+        if self._is_stale():
+            async with self._lock:
+                if self._is_stale():
+                    version = content_versions.get(POLICY_CORPUS)
+                    sections = await policy_service.get_all_sections()
+                    self._titles = [
+                        TitleEntry(section.section_id, section.order, section.title, title_terms(section.title))
+                        for section in sections
+                    ]
+                    self._version = version
+                    self._loaded_at = time.monotonic()
+        return self._titles
+
+    def match_title(self, target: str, titles: List[TitleEntry]) -> Optional[TitleEntry]:
+        """The one section whose title contains every term of `target`, or None if none or several do"""
+        terms = title_terms(target)
+        if not terms:
+            return None
+        matches = [entry for entry in titles if terms <= entry.terms]
+        if not matches:
+            return None
+        # Prefer the title with the fewest extra words; give up on a tie
+        matches.sort(key=lambda entry: len(entry.terms - terms))
+        if len(matches) > 1 and len(matches[0].terms - terms) == len(matches[1].terms - terms):
+            return None
+        return matches[0]
+
+    @staticmethod
+    def _render_section(intent: str, section: PolicySection, total: int) -> RoutedAnswer:
+        heading = f"Step {section.order} of {total}: {section.title}"
+        return RoutedAnswer(
+            intent, f"{heading}\n\n{section.content}", section.section_id, [f"Section {section.order}: {section.title}"]
+        )
+
+    @staticmethod
+    def _render_list(titles: List[TitleEntry]) -> str:
+        return "\n".join(f"{entry.order}. {entry.title}" for entry in titles)
+
+    async def route(self, message: str) -> Optional[RoutedAnswer]:
+        """Answer a navigational question, or None if it should go to the AI"""
+        intent = self.classify(message)
+        if intent is None:
+            self.passed += 1
+            return None
+        name, argument = intent
+
+        titles = await self._get_titles()
+        if not titles:
+            # Nothing to navigate; the regular path reports the missing policies
+            self.passed += 1
+            return None
+
+        total = len(titles)
+        routed: Optional[RoutedAnswer] = None
+        if name == "step_count":
+            routed = RoutedAnswer(name, f"There are {total} onboarding steps:\n{self._render_list(titles)}")
+        elif name == "list_steps":
+            routed = RoutedAnswer(name, f"The onboarding has {total} steps:\n{self._render_list(titles)}")
+        elif name == "step_by_order":
+            order = parse_number(argument)
+            section = await policy_service.get_section_by_order(order) if order is not None else None
+            if section is not None:
+                routed = self._render_section(name, section, total)
+            else:
+                routed = RoutedAnswer(name, f"There is no step {argument}. The onboarding has {total} steps:\n{self._render_list(titles)}")
+        elif name == "section_by_title":
+            entry = self.match_title(argument, titles)
+            section = await policy_service.get_section_by_id(entry.section_id) if entry is not None else None
+            if section is not None:
+                routed = self._render_section(name, section, total)
+
+        if routed is None:
+            self.passed += 1
+            return None
+        self.routed[name] += 1
+        logger.info(f"Answered navigational question without AI ({name})")
+        return routed
+
+    def get_stats(self) -> Dict:
+        return {
+            "routed": dict(self.routed),
+            "routed_total": sum(self.routed.values()),
+            "passed_to_ai": self.passed,
+            "titles_indexed": len(self._titles),
+        }
+
+
+# Global instance
+intent_router = IntentRouter()
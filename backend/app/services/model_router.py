@@ -0,0 +1,126 @@
+"""
+Routing /api/ask completions between a fast and a large deployment
+
+Questions are classified locally before the completion is sent: small talk
+("hi", "thanks") and short questions whose answer is clearly in the
+retrieved context go to the `fast` tier of the deployment pool, anything
+long, comparative or poorly covered by the context goes to the `large` tier.
+Every decision is logged with the features it was based on, and per-tier
+counts and latencies are kept so answer quality can be audited against the
+latency saved.
+"""
+import logging
+import re
+from collections import Counter
+from dataclasses import dataclass
+from typing import Awaitable, Callable, Dict, Optional
+
+from ..config import settings
+from .ai_connector import CompletionStats
+from .deployment_pool import TIER_FAST, TIER_LARGE, TIERS
+
+logger = logging.getLogger(__name__)
+
+SMALLTALK_PATTERN = re.compile(
+    r"^(?:hi|hello|hey|hiya|yo|good\s+(?:morning|afternoon|evening)|thanks?(?:\s+you)?(?:\s+(?:so|very)\s+much)?|thx|ty"
+    r"|ok(?:ay)?|cool|great|awesome|got\s+it|bye|goodbye|see\s+you|cheers)"
+    r"(?:\s+(?:there|again|a\s+lot|bot|all))?\s*[!.?]*$",
+    re.IGNORECASE
+)
+
+# Wording that asks for reasoning over several facts rather than looking one up
+COMPLEX_PATTERN = re.compile(
+    r"\b(?:why|compare[sd]?|comparison|difference|differ|versus|vs\.?|explain|calculate|pros\s+and\s+cons"
+    r"|what\s+if|scenario|exceptions?|eligib\w*|prorat\w*|conflicts?|both|summari[sz]e)\b",
+    re.IGNORECASE
+)
+
+REASON_SMALLTALK = "smalltalk"
+REASON_LONG_QUESTION = "long_question"
+REASON_COMPLEX = "complex"
+REASON_LONG_PROMPT = "long_prompt"
+REASON_IN_CONTEXT = "answer_in_context"
+REASON_LOW_CONFIDENCE = "low_confidence"
+
+
+@dataclass
+class RoutingDecision:
+    """Tier chosen for one question and what it was based on"""
+    tier: str
+    reason: str
+    words: int
+    prompt_tokens: int
+    confidence: Optional[float] = None
+
+
+class ModelRouter:
+    """Chooses the deployment tier for a question"""
+
+    def __init__(self):
+        self.decisions: Counter = Counter()
+        self.completions: Counter = Counter()
+        self.latency_seconds: Counter = Counter()
+        self.first_token_seconds: Counter = Counter()
+        self.streamed: Counter = Counter()
+
+    def classify(self, question: str, prompt_tokens: int) -> Optional[RoutingDecision]:
+        """Decision from the question alone, or None if retrieval confidence has to decide"""
+        question = " ".join(question.split())
+        words = len(question.split())
+        if SMALLTALK_PATTERN.match(question):
+            return RoutingDecision(TIER_FAST, REASON_SMALLTALK, words, prompt_tokens)
+        if words > settings.MODEL_ROUTER_FAST_MAX_WORDS:
+            return RoutingDecision(TIER_LARGE, REASON_LONG_QUESTION, words, prompt_tokens)
+        if COMPLEX_PATTERN.search(question) or question.count("?") > 1:
+            return RoutingDecision(TIER_LARGE, REASON_COMPLEX, words, prompt_tokens)
+        if prompt_tokens > settings.MODEL_ROUTER_FAST_MAX_PROMPT_TOKENS:
+            # Small models lose track of long contexts first
+            return RoutingDecision(TIER_LARGE, REASON_LONG_PROMPT, words, prompt_tokens)
+        return None
+
+    async def route(self, question: str, scope: str, mode: Optional[str], prompt_tokens: int,
+                    confidence: Callable[[], Awaitable[float]]) -> RoutingDecision:
+        """Tier for a question; `confidence` (0-1, how well the context covers it) is only awaited when needed"""
+        decision = self.classify(question, prompt_tokens)
+        if decision is None:
+            score = await confidence()
+            # A single guided section leaves less room for the wrong passage
+            threshold = settings.MODEL_ROUTER_MIN_CONFIDENCE / (2 if mode == "guided" else 1)
+            tier, reason = (TIER_FAST, REASON_IN_CONTEXT) if score >= threshold else (TIER_LARGE, REASON_LOW_CONFIDENCE)
+            decision = RoutingDecision(tier, reason, len(question.split()), prompt_tokens, round(score, 3))
+
+        self.decisions[(decision.tier, decision.reason)] += 1
+        confidence_label = f"{decision.confidence:.2f}" if decision.confidence is not None else "-"
+        logger.info(
+            f"Model route: {decision.tier} ({decision.reason}; {decision.words} words, ~{decision.prompt_tokens} prompt tokens, "
+            f"confidence {confidence_label}, {scope}/{mode or '-'})"
+        )
+        return decision
+
+    def record_completion(self, decision: RoutingDecision, stats: CompletionStats):
+        """Fold the upstream latency of a routed completion into its tier's averages"""
+        self.completions[decision.tier] += 1
+        self.latency_seconds[decision.tier] += stats.latency_seconds or 0.0
+        if stats.first_token_seconds is not None:
+            self.streamed[decision.tier] += 1
+            self.first_token_seconds[decision.tier] += stats.first_token_seconds
+
+    def get_stats(self) -> Dict:
+        tiers = {}
+        for tier in TIERS:
+            completions = self.completions[tier]
+            streamed = self.streamed[tier]
+            tiers[tier] = {
+                "routed": sum(count for (routed_tier, _), count in self.decisions.items() if routed_tier == tier),
+                "completions": completions,
+                "avg_latency_ms": round(self.latency_seconds[tier] / completions * 1000, 1) if completions else None,
+                "avg_first_token_ms": round(self.first_token_seconds[tier] / streamed * 1000, 1) if streamed else None,
+            }
+        return {
+            "tiers": tiers,
+            "reasons": {f"{tier}/{reason}": count for (tier, reason), count in self.decisions.items()},
+        }
+
+
+# Global instance
+model_router = ModelRouter()
@@ -1,13 +1,19 @@
-import os
+import asyncio
 import logging
 from datetime import datetime, timezone
 from typing import Dict, List, Optional
-from pymongo import MongoClient
-from pymongo.database import Database
-from pymongo.collection import Collection
+from motor.motor_asyncio import AsyncIOMotorCollection
 from dotenv import load_dotenv
 
+from ..config import settings
 from ..models.policy import PolicySection, PolicySectionCreate, PolicySectionUpdate
+from .cosmos_connection import cosmos_connection
+from .retrieval import BM25Index, build_context
+from .embedding_store import EmbeddingStore, create_embedding_provider
+from .content_version import content_versions, POLICY_CORPUS
+from .digest import Digest, build_digest_context, content_hash, digest_worker, summarize, use_digests
+from .token_budget import ContextBlock, count_tokens, pack_blocks
+from .shared_cache import shared_cache
 
 # Load environment variables
 load_dotenv(encoding="utf-8", override=True)
@@ -18,52 +24,54 @@ logger = logging.getLogger(__name__)
 
 class PolicyService:
     def __init__(self):
-        self.mongo_uri = os.getenv("MONGO_URI", "mongodb://localhost:27017")
-        self.db_name = os.getenv("MONGO_DB", "onboarding_bot")
-        self.client: MongoClient = None
-        self.db: Database = None
-        self.policy_collection: Collection = None
+        self.policy_collection: AsyncIOMotorCollection = None
+        self.retrieval_index = BM25Index(settings.RETRIEVAL_CHUNK_SIZE, settings.RETRIEVAL_CHUNK_OVERLAP)
+        self._index_lock = asyncio.Lock()
+        self.digests: Dict[str, Digest] = {}
+        self.embedding_store: Optional[EmbeddingStore] = None
+        if settings.EMBEDDINGS_ENABLED:
+            self.embedding_store = EmbeddingStore(
+                "policy_sections",
+                settings.EMBEDDING_STORE_DIR,
+                create_embedding_provider(),
+                settings.RETRIEVAL_CHUNK_SIZE,
+                settings.RETRIEVAL_CHUNK_OVERLAP
+            )
         
-    def connect(self):
-        """Establish connection to MongoDB"""
+    async def connect(self):
+        """Borrow the policy collection from the shared connection registry"""
         try:
-            if self.client is None:
-                self.client = MongoClient(self.mongo_uri)
-                self.db = self.client[self.db_name]
-                self.policy_collection = self.db.policy_sections
-                
-                # Test connection
-                self.client.admin.command('ping')
-                logger.info(f"Connected to MongoDB: {self.db_name}")
+            if self.policy_collection is None:
+                self.policy_collection = cosmos_connection.get_collection("policy_sections")
                 
                 # Ensure unique indexes exist
-                self._ensure_indexes()
+                await self._ensure_indexes()
                 
         except Exception as e:
             logger.error(f"Failed to connect to MongoDB: {str(e)}")
             raise
     
-    def _ensure_indexes(self):
+    async def _ensure_indexes(self):
         """Ensure unique indexes exist for section_id and order"""
         try:
             # Create unique index on section_id
-            self.policy_collection.create_index("section_id", unique=True)
+            await self.policy_collection.create_index("section_id", unique=True)
             logger.info("Created unique index on section_id")
             
             # Create unique index on order
-            self.policy_collection.create_index("order", unique=True)
+            await self.policy_collection.create_index("order", unique=True)
             logger.info("Created unique index on order")
             
         except Exception as e:
             logger.warning(f"Failed to create indexes (may already exist): {str(e)}")
     
-    def get_section_by_id(self, section_id: str) -> Optional[PolicySection]:
+    async def get_section_by_id(self, section_id: str) -> Optional[PolicySection]:
         """Get a policy section by its ID"""
         try:
             if self.policy_collection is None:
-                self.connect()
+                await self.connect()
                 
-            doc = self.policy_collection.find_one({"section_id": section_id})
+            doc = await self.policy_collection.find_one({"section_id": section_id})
             if doc:
                 return PolicySection(**doc)
             return None
@@ -72,13 +80,13 @@ class PolicyService:
             logger.error(f"Failed to get policy section {section_id}: {str(e)}")
             raise
     
-    def get_section_by_order(self, order: int) -> Optional[PolicySection]:
+    async def get_section_by_order(self, order: int) -> Optional[PolicySection]:
         """Get a policy section by its order number"""
         try:
             if self.policy_collection is None:
-                self.connect()
+                await self.connect()
                 
-            doc = self.policy_collection.find_one({"order": order})
+            doc = await self.policy_collection.find_one({"order": order})
             if doc:
                 return PolicySection(**doc)
             return None
@@ -87,15 +95,15 @@ class PolicyService:
             logger.error(f"Failed to get policy section with order {order}: {str(e)}")
             raise
     
-    def get_all_sections(self) -> List[PolicySection]:
+    async def get_all_sections(self) -> List[PolicySection]:
         """Get all policy sections ordered by their order field"""
         try:
             if self.policy_collection is None:
-                self.connect()
+                await self.connect()
                 
             cursor = self.policy_collection.find().sort("order", 1)
             sections = []
-            for doc in cursor:
+            async for doc in cursor:
                 sections.append(PolicySection(**doc))
             return sections
             
@@ -103,18 +111,21 @@ class PolicyService:
             logger.error(f"Failed to get all policy sections: {str(e)}")
             raise
     
-    def create_section(self, section: PolicySectionCreate) -> str:
+    async def create_section(self, section: PolicySectionCreate) -> str:
         """Create a new policy section"""
         try:
             if self.policy_collection is None:
-                self.connect()
+                await self.connect()
             
             # Create section document
             section_doc = section.model_dump()
+            section_doc["token_count"] = count_tokens(section.content)
             section_doc["updated_at"] = datetime.now(timezone.utc)
             
-            result = self.policy_collection.insert_one(section_doc)
+            result = await self.policy_collection.insert_one(section_doc)
             section_id = str(result.inserted_id)
+            await self._index_section(PolicySection(**section_doc))
+            content_versions.bump(POLICY_CORPUS)
             
             logger.info(f"Created policy section: {section.section_id}")
             return section_id
@@ -132,11 +143,11 @@ class PolicyService:
                 logger.error(f"Failed to create policy section: {str(e)}")
                 raise
     
-    def update_section(self, section_id: str, updates: PolicySectionUpdate) -> bool:
+    async def update_section(self, section_id: str, updates: PolicySectionUpdate) -> bool:
         """Update an existing policy section"""
         try:
             if self.policy_collection is None:
-                self.connect()
+                await self.connect()
             
             # Prepare update document
             update_doc = {}
@@ -144,17 +155,23 @@ class PolicyService:
                 update_doc["title"] = updates.title
             if updates.content is not None:
                 update_doc["content"] = updates.content
+                update_doc["token_count"] = count_tokens(updates.content)
             if updates.order is not None:
                 update_doc["order"] = updates.order
             
             update_doc["updated_at"] = datetime.now(timezone.utc)
             
-            result = self.policy_collection.update_one(
+            result = await self.policy_collection.update_one(
                 {"section_id": section_id},
                 {"$set": update_doc}
             )
             
             if result.modified_count > 0:
+                updated_section = await self.get_section_by_id(section_id)
+                if updated_section:
+                    await self._index_section(updated_section)
+                # Bump once the index has the change so nothing is rebuilt from the old content under the new version
+                content_versions.bump(POLICY_CORPUS)
                 logger.info(f"Updated policy section: {section_id}")
                 return True
             else:
@@ -172,15 +189,17 @@ class PolicyService:
                 logger.error(f"Failed to update policy section {section_id}: {str(e)}")
                 raise
     
-    def delete_section(self, section_id: str) -> bool:
+    async def delete_section(self, section_id: str) -> bool:
         """Delete a policy section"""
         try:
             if self.policy_collection is None:
-                self.connect()
+                await self.connect()
             
-            result = self.policy_collection.delete_one({"section_id": section_id})
+            result = await self.policy_collection.delete_one({"section_id": section_id})
             
             if result.deleted_count > 0:
+                await self._unindex_section(section_id)
+                content_versions.bump(POLICY_CORPUS)
                 logger.info(f"Deleted policy section: {section_id}")
                 return True
             else:
@@ -191,28 +210,129 @@ class PolicyService:
             logger.error(f"Failed to delete policy section {section_id}: {str(e)}")
             raise
     
-    def get_sections_for_context(self, mode: str, section_id: Optional[str] = None) -> str:
-        """Get policy sections content based on mode for AI context"""
+    @staticmethod
+    def _index_entry(section: PolicySection) -> tuple:
+        """(doc_key, heading, title, content, position) tuple used by the retrieval indexes"""
+        return (section.section_id, f"Section {section.order}: {section.title}", section.title, section.content, section.order)
+    
+    def _track_digest(self, section: PolicySection):
+        """Keep the section's digest in memory if it matches the content, else queue a new one"""
+        if section.digest is not None and section.digest_hash == content_hash(section.content):
+            tokens = section.digest_token_count if section.digest_token_count is not None else count_tokens(section.digest)
+            self.digests[section.section_id] = Digest(section.digest, tokens)
+        else:
+            self.digests.pop(section.section_id, None)
+            digest_worker.schedule(POLICY_CORPUS, section.section_id)
+    
+    async def refresh_digest(self, section_id: str):
+        """Write the digest of a section whose content changed since its last digest (digest worker)"""
+        section = await self.get_section_by_id(section_id)
+        if section is None or (section.digest is not None and section.digest_hash == content_hash(section.content)):
+            return
+        digest = summarize(section.content, settings.GLOBAL_DIGEST_MAX_TOKENS)
+        fields = {"digest": digest, "digest_token_count": count_tokens(digest), "digest_hash": content_hash(section.content)}
+        # Only if the content is still what was summarized
+        result = await self.policy_collection.update_one({"section_id": section_id, "content": section.content}, {"$set": fields})
+        if result.modified_count > 0:
+            # No version bump: digest contexts are hashed into their answer cache key
+            self._track_digest(section.model_copy(update=fields))
+            logger.info(f"Wrote digest for policy section {section_id} ({fields['digest_token_count']} tokens)")
+    
+    async def _index_section(self, section: PolicySection):
+        """Apply a single section write to the retrieval indexes if they are loaded"""
+        self._track_digest(section)
+        if self.retrieval_index.loaded_at is None:
+            return
+        entry = self._index_entry(section)
+        self.retrieval_index.upsert_document(*entry)
+        if self.embedding_store is not None:
+            try:
+                await self.embedding_store.upsert_document(*entry)
+            except Exception as e:
+                logger.warning(f"Failed to update embeddings for section {section.section_id}: {str(e)}")
+    
+    async def _unindex_section(self, section_id: str):
+        """Remove a deleted section from the retrieval indexes if they are loaded"""
+        self.digests.pop(section_id, None)
+        if self.retrieval_index.loaded_at is None:
+            return
+        self.retrieval_index.remove_document(section_id)
+        if self.embedding_store is not None:
+            try:
+                await self.embedding_store.remove_document(section_id)
+            except Exception as e:
+                logger.warning(f"Failed to remove embeddings for section {section_id}: {str(e)}")
+    
+    async def get_retrieval_index(self) -> BM25Index:
+        """Get the retrieval index, (re)building it from MongoDB when missing or stale"""
+        if self.retrieval_index.is_stale(settings.RETRIEVAL_INDEX_REFRESH_SECONDS):
+            async with self._index_lock:
+                if self.retrieval_index.is_stale(settings.RETRIEVAL_INDEX_REFRESH_SECONDS):
+                    sections = await self.get_all_sections()
+                    entries = [self._index_entry(s) for s in sections]
+                    self.retrieval_index.rebuild(entries)
+                    self.digests.clear()
+                    for section in sections:
+                        self._track_digest(section)
+                    if self.embedding_store is not None:
+                        try:
+                            await self.embedding_store.sync(entries)
+                        except Exception as e:
+                            logger.warning(f"Failed to sync policy embeddings: {str(e)}")
+        return self.retrieval_index
+    
+    @staticmethod
+    def _context_block(section: PolicySection, separator: str = "\n") -> ContextBlock:
+        """Render a section for the AI context, reusing its cached token count"""
+        heading = f"Section {section.order}: {section.title}"
+        tokens = None
+        if section.token_count is not None:
+            tokens = section.token_count + count_tokens(heading) + 2
+        return ContextBlock(f"{heading}{separator}{section.content}\n", tokens)
+    
+    async def get_sections_for_context(self, mode: str, section_id: Optional[str] = None, question: Optional[str] = None, token_budget: Optional[int] = None) -> str:
+        """Get policy sections content based on mode for AI context
+        
+        In global mode with a question, only the most relevant chunks are
+        returned (see RETRIEVAL_* settings) instead of the whole catalog; a
+        large catalog is sent as section digests plus the full text of the
+        most relevant sections (see GLOBAL_DIGEST_* settings).
+        With a token_budget the context is packed to fit: the guided section
+        is truncated if needed, otherwise the most relevant chunks or the
+        earliest sections are kept.
+        """
         try:
             if mode == "guided" and section_id:
                 # Get single section content
-                section = self.get_section_by_id(section_id)
+                section = await self.get_section_by_id(section_id)
                 if section:
-                    return f"Section {section.order}: {section.title}\n\n{section.content}"
+                    return pack_blocks([self._context_block(section, "\n\n")], token_budget).text.rstrip("\n")
                 else:
                     raise ValueError(f"Policy section '{section_id}' not found")
             
             elif mode == "global" or (mode == "auto" and not section_id):
+                if question and settings.RETRIEVAL_ENABLED:
+                    index = await self.get_retrieval_index()
+                    if index.document_count == 0:
+                        raise ValueError("No policy sections found")
+                    if use_digests(index, self.digests):
+                        return build_digest_context(index, self.digests, question, "sections", token_budget)
+                    return await build_context(
+                        index,
+                        question,
+                        settings.RETRIEVAL_TOP_K,
+                        settings.RETRIEVAL_CONTEXT_CHAR_BUDGET,
+                        self.embedding_store,
+                        token_budget
+                    )
+                
                 # Get all sections content
-                sections = self.get_all_sections()
+                sections = await self.get_all_sections()
                 if not sections:
                     raise ValueError("No policy sections found")
                 
-                context_parts = []
-                for section in sections:
-                    context_parts.append(f"Section {section.order}: {section.title}\n{section.content}\n")
-                
-                return "\n".join(context_parts)
+                # Sections are already in step order, which is also their priority
+                return pack_blocks([self._context_block(section) for section in sections], token_budget).text
             
             else:
                 raise ValueError(f"Invalid mode '{mode}' or missing section_id for guided mode")
@@ -221,34 +341,28 @@ class PolicyService:
             logger.error(f"Failed to get sections for context: {str(e)}")
             raise
     
-    def close(self):
-        """Close MongoDB connection"""
-        if self.client:
-            self.client.close()
-            logger.info("MongoDB connection closed")
-    
-    def get_used_orders(self) -> List[int]:
+    async def get_used_orders(self) -> List[int]:
         """Get list of used order numbers"""
         try:
             if self.policy_collection is None:
-                self.connect()
+                await self.connect()
             
             cursor = self.policy_collection.find({}, {"order": 1})
-            used_orders = [doc["order"] for doc in cursor]
+            used_orders = [doc["order"] async for doc in cursor]
             return sorted(used_orders)
             
         except Exception as e:
             logger.error(f"Failed to get used orders: {str(e)}")
             raise
     
-    def get_used_section_ids(self) -> List[str]:
+    async def get_used_section_ids(self) -> List[str]:
         """Get list of used section IDs"""
         try:
             if self.policy_collection is None:
-                self.connect()
+                await self.connect()
             
             cursor = self.policy_collection.find({}, {"section_id": 1})
-            used_ids = [doc["section_id"] for doc in cursor]
+            used_ids = [doc["section_id"] async for doc in cursor]
             return sorted(used_ids)
             
         except Exception as e:
@@ -258,3 +372,5 @@ class PolicyService:
 
 # Global instance
 policy_service = PolicyService()
+digest_worker.register(POLICY_CORPUS, policy_service.refresh_digest)
+shared_cache.on_remote_write(POLICY_CORPUS, policy_service.retrieval_index.expire)
@@ -0,0 +1,249 @@
+"""
+Client-side rate limiting for the Azure deployment's RPM/TPM quotas
+
+Every request reserves one request from an RPM bucket and its estimated
+prompt + completion tokens from a TPM bucket before it is sent. Once the
+response arrives the reservation is reconciled against the reported usage.
+Requests that cannot be admitted immediately wait in a priority queue (lower
+number first, FIFO within a priority) for at most a bounded time.
+"""
+import asyncio
+import heapq
+import itertools
+import logging
+import time
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Request priorities, most urgent first
+PRIORITY_GUIDED = 0
+PRIORITY_ONBOARDING = 1
+PRIORITY_HELPDESK = 2
+PRIORITY_BACKGROUND = 3
+
+
+def request_priority(scope: str, mode: Optional[str]) -> int:
+    """Queue priority for a question: guided onboarding > global onboarding > helpdesk"""
+    if scope == "employee":
+        return PRIORITY_HELPDESK
+    if mode == "guided":
+        return PRIORITY_GUIDED
+    return PRIORITY_ONBOARDING
+
+
+class RateLimitExceeded(Exception):
+    """Raised when a request could not be admitted within its maximum wait"""
+
+
+class TokenBucket:
+    """Continuously refilling bucket; the level may go negative to record debt"""
+
+    def __init__(self, per_minute: int):
+        self.capacity = float(per_minute)
+        self.rate = per_minute / 60.0
+        self.level = float(per_minute)
+        self._updated = time.monotonic()
+
+    def refill(self, now: float):
+        self.level = min(self.capacity, self.level + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def time_until(self, amount: float) -> float:
+        """Seconds until `amount` is available (0 if it already is)"""
+        missing = amount - self.level
+        return 0.0 if missing <= 0 else missing / self.rate
+
+
+@dataclass
+class Reservation:
+    """What was charged for one request, so it can be reconciled or refunded"""
+    tokens: int
+    priority: int
+    waited: float = 0.0
+
+
+@dataclass(order=True)
+class _Waiter:
+    priority: int
+    sequence: int
+    tokens: int = field(compare=False)
+    future: asyncio.Future = field(compare=False)
+
+
+class RateLimiter:
+    """Priority-queued admission against RPM and TPM token buckets"""
+
+    def __init__(self, requests_per_minute: int = 0, tokens_per_minute: int = 0, max_wait_seconds: float = 10.0):
+        self.requests = TokenBucket(requests_per_minute) if requests_per_minute > 0 else None
+        self.tokens = TokenBucket(tokens_per_minute) if tokens_per_minute > 0 else None
+        self.max_wait_seconds = max_wait_seconds
+        self._queue: List[_Waiter] = []
+        self._sequence = itertools.count()
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._paused_until = 0.0
+
+        self.admitted = 0
+        self.queued = 0
+        self.timed_out = 0
+        self.total_wait = 0.0
+        self.max_wait_seen = 0.0
+        self.reserved_tokens = 0
+        self.actual_tokens = 0
+        self.throttle_pauses = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.requests is not None or self.tokens is not None
+
+    def _cost(self, tokens: int) -> int:
+        # A single request can never need more than a full bucket
+        return min(tokens, int(self.tokens.capacity)) if self.tokens is not None else tokens
+
+    def _wait_time(self, tokens: int, now: float) -> float:
+        wait = max(0.0, self._paused_until - now)
+        if self.requests is not None:
+            self.requests.refill(now)
+            wait = max(wait, self.requests.time_until(1))
+        if self.tokens is not None:
+            self.tokens.refill(now)
+            wait = max(wait, self.tokens.time_until(tokens))
+        return wait
+
+    def _charge(self, tokens: int):
+        if self.requests is not None:
+            self.requests.level -= 1
+        if self.tokens is not None:
+            self.tokens.level -= tokens
+
+    def _pump(self):
+        """Admit queued requests in priority order while the buckets allow it"""
+        self._timer = None
+        while self._queue:
+            head = self._queue[0]
+            if head.future.done():
+                heapq.heappop(self._queue)
+                continue
+            wait = self._wait_time(head.tokens, time.monotonic())
+            if wait > 0:
+                self._timer = asyncio.get_running_loop().call_later(wait, self._pump)
+                return
+            heapq.heappop(self._queue)
+            self._charge(head.tokens)
+            head.future.set_result(None)
+
+    def _schedule(self):
+        if self._timer is not None:
+            self._timer.cancel()
+        self._pump()
+
+    async def acquire(self, tokens: int, priority: int = PRIORITY_ONBOARDING, max_wait: Optional[float] = None) -> Reservation:
+        """Reserve one request and `tokens` tokens, waiting in the priority queue if needed
+
+        Raises RateLimitExceeded if the request is not admitted within
+        max_wait (capped at max_wait_seconds).
+        """
+        tokens = self._cost(tokens)
+        if not self.enabled:
+            return self._admitted(Reservation(tokens, priority))
+
+        now = time.monotonic()
+        # Fast path: nothing queued ahead of us and both buckets have room
+        if not self._queue and self._wait_time(tokens, now) == 0:
+            self._charge(tokens)
+            return self._admitted(Reservation(tokens, priority))
+
+        waiter = _Waiter(priority, next(self._sequence), tokens, asyncio.get_running_loop().create_future())
+        heapq.heappush(self._queue, waiter)
+        self.queued += 1
+        self._schedule()
+
+        limit = self.max_wait_seconds if max_wait is None else min(max_wait, self.max_wait_seconds)
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter.future), timeout=max(0.0, limit))
+        except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+            if waiter.future.done() and not waiter.future.cancelled():
+                # Admitted just as we gave up: give the capacity back
+                self._uncharge(tokens)
+            waiter.future.cancel()
+            if self._queue:
+                self._schedule()
+            if isinstance(e, asyncio.CancelledError):
+                raise
+            self.timed_out += 1
+            logger.warning(f"Rate limiter: request not admitted within {limit:.1f}s (priority {priority}, {len(self._queue)} queued)")
+            raise RateLimitExceeded(f"Not admitted within {limit:.1f}s")
+
+        waited = time.monotonic() - now
+        self.total_wait += waited
+        self.max_wait_seen = max(self.max_wait_seen, waited)
+        return self._admitted(Reservation(tokens, priority, waited))
+
+    def _admitted(self, reservation: Reservation) -> Reservation:
+        self.admitted += 1
+        self.reserved_tokens += reservation.tokens
+        return reservation
+
+    def _uncharge(self, tokens: int):
+        if self.requests is not None:
+            self.requests.level += 1
+        if self.tokens is not None:
+            self.tokens.level += tokens
+
+    def reconcile(self, reservation: Reservation, actual_tokens: int):
+        """Correct the TPM bucket with the usage reported by the deployment"""
+        self.actual_tokens += actual_tokens
+        if self.tokens is not None:
+            self.tokens.level += reservation.tokens - actual_tokens
+            self._schedule()
+
+    def refund(self, reservation: Reservation):
+        """Return a reservation for a request that was never sent"""
+        self.reserved_tokens -= reservation.tokens
+        self._uncharge(reservation.tokens)
+        if self.enabled:
+            self._schedule()
+
+    def observe_remaining(self, remaining_requests: Optional[int], remaining_tokens: Optional[int]):
+        """Lower the buckets to the deployment's x-ratelimit-remaining-* headers"""
+        now = time.monotonic()
+        if self.requests is not None and remaining_requests is not None:
+            self.requests.refill(now)
+            self.requests.level = min(self.requests.level, float(remaining_requests))
+        if self.tokens is not None and remaining_tokens is not None:
+            self.tokens.refill(now)
+            self.tokens.level = min(self.tokens.level, float(remaining_tokens))
+
+    def throttled(self, retry_after: Optional[float]):
+        """Hold all queued requests after a 429 until the deployment's retry-after passes"""
+        if not self.enabled or not retry_after:
+            return
+        self._paused_until = max(self._paused_until, time.monotonic() + retry_after)
+        self.throttle_pauses += 1
+        self._schedule()
+
+    def get_stats(self) -> Dict:
+        now = time.monotonic()
+        stats = {
+            "enabled": self.enabled,
+            "queue_depth": sum(1 for waiter in self._queue if not waiter.future.done()),
+            "admitted": self.admitted,
+            "queued": self.queued,
+            "timed_out": self.timed_out,
+            "avg_wait_seconds": round(self.total_wait / self.queued, 3) if self.queued else 0.0,
+            "max_wait_seconds": round(self.max_wait_seen, 3),
+            "reserved_tokens": self.reserved_tokens,
+            "actual_tokens": self.actual_tokens,
+            "throttle_pauses": self.throttle_pauses,
+            "paused_for": round(max(0.0, self._paused_until - now), 2),
+        }
+        if self.requests is not None:
+            self.requests.refill(now)
+            stats["requests_available"] = round(self.requests.level, 2)
+            stats["requests_per_minute"] = int(self.requests.capacity)
+        if self.tokens is not None:
+            self.tokens.refill(now)
+            stats["tokens_available"] = round(self.tokens.level)
+            stats["tokens_per_minute"] = int(self.tokens.capacity)
+        return stats
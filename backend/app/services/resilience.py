@@ -0,0 +1,151 @@
+"""
+Retry and circuit breaker primitives for upstream AI calls
+
+RetryPolicy decides how long to wait between attempts (Retry-After first,
+otherwise exponential backoff with full jitter) within a per-request
+deadline. CircuitBreaker stops sending requests to a deployment after
+repeated failures and lets a limited number of probes through once the
+recovery timeout has passed.
+"""
+import logging
+import random
+import time
+from email.utils import parsedate_to_datetime
+from typing import Dict, Mapping, Optional
+
+logger = logging.getLogger(__name__)
+
+# Statuses worth retrying: request timeout, throttling and transient server errors
+RETRYABLE_STATUS_CODES = frozenset({408, 429, 500, 502, 503, 504})
+
+
+def parse_retry_after(headers: Mapping[str, str]) -> Optional[float]:
+    """Seconds to wait according to retry-after-ms / Retry-After, if present"""
+    value = headers.get("retry-after-ms")
+    if value:
+        try:
+            return max(0.0, float(value) / 1000)
+        except ValueError:
+            pass
+
+    value = headers.get("retry-after")
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+class RetryPolicy:
+    """Exponential backoff with full jitter, bounded by attempts and a deadline"""
+
+    def __init__(self, max_attempts: int = 3, base_delay: float = 0.5, max_delay: float = 8.0, deadline_seconds: float = 45.0):
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.deadline_seconds = deadline_seconds
+
+    def backoff(self, retry_number: int) -> float:
+        """Jittered delay before retry number `retry_number` (1-based)"""
+        return random.uniform(0, min(self.max_delay, self.base_delay * (2 ** (retry_number - 1))))
+
+    def next_delay(self, attempts_made: int, retry_after: Optional[float], deadline: float) -> Optional[float]:
+        """Delay before the next attempt, or None if no attempt should be made
+
+        A server supplied Retry-After is honoured as is; if waiting that long
+        would overrun the deadline the request is not retried.
+        """
+        if attempts_made >= self.max_attempts:
+            return None
+        delay = retry_after if retry_after is not None else self.backoff(attempts_made)
+        if time.monotonic() + delay >= deadline:
+            return None
+        return delay
+
+
+class CircuitBreaker:
+    """Closed -> open after consecutive failures -> half-open probes -> closed"""
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, name: str, failure_threshold: int = 5, recovery_timeout: float = 30.0, half_open_max_calls: int = 1):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout = recovery_timeout
+        self.half_open_max_calls = half_open_max_calls
+        self._state = self.CLOSED
+        self._consecutive_failures = 0
+        self._opened_at = 0.0
+        self._probes_in_flight = 0
+        self.times_opened = 0
+        self.rejected = 0
+
+    @property
+    def state(self) -> str:
+        if self._state == self.OPEN and time.monotonic() - self._opened_at >= self.recovery_timeout:
+            return self.HALF_OPEN
+        return self._state
+
+    def retry_after(self) -> float:
+        """Seconds until the breaker will let a probe through"""
+        if self._state != self.OPEN:
+            return 0.0
+        return max(0.0, self._opened_at + self.recovery_timeout - time.monotonic())
+
+    def allow_request(self) -> bool:
+        """Whether a request may be sent now (counts half-open probes)"""
+        if self.state == self.HALF_OPEN:
+            if self._state == self.OPEN:
+                self._state = self.HALF_OPEN
+                self._probes_in_flight = 0
+                logger.info(f"Circuit breaker '{self.name}' half-open: probing")
+            if self._probes_in_flight < self.half_open_max_calls:
+                self._probes_in_flight += 1
+                return True
+            self.rejected += 1
+            return False
+        if self._state == self.OPEN:
+            self.rejected += 1
+            return False
+        return True
+
+    def record_success(self):
+        if self._state == self.HALF_OPEN:
+            logger.info(f"Circuit breaker '{self.name}' closed: probe succeeded")
+        self._state = self.CLOSED
+        self._consecutive_failures = 0
+        self._probes_in_flight = 0
+
+    def record_failure(self):
+        self._consecutive_failures += 1
+        if self._state == self.HALF_OPEN or self._consecutive_failures >= self.failure_threshold:
+            if self._state != self.OPEN:
+                self.times_opened += 1
+                logger.warning(f"Circuit breaker '{self.name}' opened after {self._consecutive_failures} consecutive failures")
+            self._state = self.OPEN
+            self._opened_at = time.monotonic()
+            self._probes_in_flight = 0
+
+    def release(self):
+        """Give back a half-open probe slot whose request ended without an outcome (e.g. cancelled)"""
+        if self._state == self.HALF_OPEN and self._probes_in_flight > 0:
+            self._probes_in_flight -= 1
+
+    def get_stats(self) -> Dict:
+        return {
+            "name": self.name,
+            "state": self.state,
+            "consecutive_failures": self._consecutive_failures,
+            "failure_threshold": self.failure_threshold,
+            "recovery_timeout": self.recovery_timeout,
+            "retry_after": round(self.retry_after(), 2),
+            "times_opened": self.times_opened,
+            "rejected": self.rejected,
+        }
@@ -0,0 +1,334 @@
+"""
+Lexical retrieval for AI context selection
+
+Policy sections and Employee KB documents are split into chunks and kept in
+an in-memory BM25 inverted index, so /api/ask can send only the chunks that
+are relevant to the question instead of the whole catalog.
+"""
+import heapq
+import logging
+import math
+import re
+import time
+from collections import Counter, defaultdict
+from dataclasses import dataclass
+from typing import Any, Container, Dict, Iterable, List, Optional, Tuple
+
+from .token_budget import count_tokens
+
+logger = logging.getLogger(__name__)
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+")
+SENTENCE_PATTERN = re.compile(r"(?<=[.!?])\s+|\n+")
+
+STOPWORDS = frozenset({
+    "a", "about", "an", "and", "are", "as", "at", "be", "by", "can", "do", "does",
+    "for", "from", "get", "how", "i", "if", "in", "is", "it", "me", "my", "of", "on",
+    "or", "our", "the", "their", "there", "this", "to", "us", "was", "we", "what",
+    "when", "where", "which", "who", "why", "will", "with", "you", "your",
+})
+
+
+def normalize_term(term: str) -> str:
+    """Very light plural stemming so 'days' matches 'day'"""
+    if len(term) > 4 and term.endswith("ies"):
+        return term[:-3] + "y"
+    if len(term) > 3 and term.endswith("s") and not term.endswith("ss"):
+        return term[:-1]
+    return term
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercase, split on non-alphanumerics, drop stopwords and stem"""
+    return [
+        normalize_term(token)
+        for token in TOKEN_PATTERN.findall(text.lower())
+        if token not in STOPWORDS
+    ]
+
+
+def chunk_text(text: str, chunk_size: int = 1200, overlap: int = 200) -> List[str]:
+    """Split text into sentence-aligned chunks of at most ~chunk_size characters
+
+    Consecutive chunks share up to `overlap` characters of trailing sentences so
+    an answer spanning a chunk boundary is still retrievable.
+    """
+    text = text.strip()
+    if not text:
+        return []
+    if len(text) <= chunk_size:
+        return [text]
+
+    # Break into sentences, hard-splitting any sentence longer than a chunk
+    pieces = []
+    for unit in SENTENCE_PATTERN.split(text):
+        unit = unit.strip()
+        while len(unit) > chunk_size:
+            cut = unit.rfind(" ", 0, chunk_size)
+            if cut <= 0:
+                cut = chunk_size
+            pieces.append(unit[:cut].strip())
+            unit = unit[cut:].strip()
+        if unit:
+            pieces.append(unit)
+
+    chunks = []
+    current: List[str] = []
+    length = 0
+    for piece in pieces:
+        if current and length + len(piece) + 1 > chunk_size:
+            chunks.append(" ".join(current))
+
+            # Carry trailing sentences forward as overlap
+            carry: List[str] = []
+            carry_length = 0
+            for previous in reversed(current):
+                if carry_length + len(previous) + 1 > overlap:
+                    break
+                carry.insert(0, previous)
+                carry_length += len(previous) + 1
+            current = carry
+            length = carry_length
+
+        current.append(piece)
+        length += len(piece) + 1
+
+    if current:
+        chunks.append(" ".join(current))
+    return chunks
+
+
+@dataclass(frozen=True)
+class Chunk:
+    """A retrievable slice of a policy section or KB document"""
+    chunk_id: str
+    doc_key: str
+    heading: str
+    text: str
+    position: Any
+    index: int
+    tokens: int
+
+
+class BM25Index:
+    """Incrementally maintained BM25 inverted index over document chunks"""
+
+    def __init__(self, chunk_size: int = 1200, chunk_overlap: int = 200, k1: float = 1.5, b: float = 0.75):
+        self.chunk_size = chunk_size
+        self.chunk_overlap = chunk_overlap
+        self.k1 = k1
+        self.b = b
+        self.loaded_at: Optional[float] = None
+        self._expired = False
+        self._reset()
+
+    def _reset(self):
+        self._postings: Dict[str, Dict[str, int]] = defaultdict(dict)
+        self._chunks: Dict[str, Chunk] = {}
+        self._chunk_terms: Dict[str, Counter] = {}
+        self._lengths: Dict[str, int] = {}
+        self._doc_chunks: Dict[str, List[str]] = {}
+        self._documents: Dict[str, Tuple[str, str, Any, int]] = {}
+        self._total_length = 0
+        self._content_chars = 0
+        self._document_tokens = 0
+
+    def __len__(self) -> int:
+        return len(self._chunks)
+
+    @property
+    def document_count(self) -> int:
+        return len(self._documents)
+
+    @property
+    def content_chars(self) -> int:
+        """Total characters of all indexed document content"""
+        return self._content_chars
+
+    @property
+    def document_tokens(self) -> int:
+        """Estimated tokens of every document rendered in full (headings included)"""
+        return self._document_tokens
+
+    def is_stale(self, max_age_seconds: float) -> bool:
+        """True if the index was never loaded or is older than max_age_seconds"""
+        if self.loaded_at is None or self._expired:
+            return True
+        return max_age_seconds > 0 and time.monotonic() - self.loaded_at > max_age_seconds
+
+    def expire(self):
+        """Rebuild on next use (e.g. after another worker wrote); until then the current contents stay usable"""
+        self._expired = True
+
+    def rebuild(self, documents: Iterable[Tuple[str, str, str, str, Any]]):
+        """Replace the index contents with (doc_key, heading, title, content, position) tuples"""
+        self._reset()
+        for doc_key, heading, title, content, position in documents:
+            self.upsert_document(doc_key, heading, title, content, position)
+        self.loaded_at = time.monotonic()
+        self._expired = False
+        logger.info(f"Built retrieval index: {len(self._doc_chunks)} documents, {len(self._chunks)} chunks")
+
+    def upsert_document(self, doc_key: str, heading: str, title: str, content: str, position: Any):
+        """Index (or re-index) a single document"""
+        self.remove_document(doc_key)
+        tokens = count_tokens(f"{heading}\n{content}\n")
+        self._documents[doc_key] = (heading, content, position, tokens)
+        self._content_chars += len(content)
+        self._document_tokens += tokens
+
+        title_terms = tokenize(title)
+        chunk_ids = []
+        for index, text in enumerate(chunk_text(content, self.chunk_size, self.chunk_overlap)):
+            chunk_id = f"{doc_key}#{index}"
+            # Title terms are counted in every chunk so headings stay searchable
+            terms = Counter(title_terms + tokenize(text))
+            for term, frequency in terms.items():
+                self._postings[term][chunk_id] = frequency
+            length = sum(terms.values())
+
+            self._chunks[chunk_id] = Chunk(chunk_id, doc_key, heading, text, position, index, count_tokens(text))
+            self._chunk_terms[chunk_id] = terms
+            self._lengths[chunk_id] = length
+            self._total_length += length
+            chunk_ids.append(chunk_id)
+
+        self._doc_chunks[doc_key] = chunk_ids
+
+    def remove_document(self, doc_key: str):
+        """Drop every chunk belonging to a document"""
+        document = self._documents.pop(doc_key, None)
+        if document is not None:
+            self._content_chars -= len(document[1])
+            self._document_tokens -= document[3]
+        for chunk_id in self._doc_chunks.pop(doc_key, []):
+            for term in self._chunk_terms.pop(chunk_id):
+                postings = self._postings[term]
+                postings.pop(chunk_id, None)
+                if not postings:
+                    del self._postings[term]
+            self._total_length -= self._lengths.pop(chunk_id)
+            del self._chunks[chunk_id]
+
+    def idf(self, term: str) -> float:
+        """BM25 inverse document frequency of a (tokenized) term; 0 if it is not indexed"""
+        postings = self._postings.get(term)
+        if not postings:
+            return 0.0
+        document_frequency = len(postings)
+        return math.log(1 + (len(self._chunks) - document_frequency + 0.5) / (document_frequency + 0.5))
+
+    def search(self, query: str, top_k: int, doc_keys: Optional[Container[str]] = None) -> List[Tuple[Chunk, float]]:
+        """Return the top_k chunks by BM25 score, optionally only from the given documents"""
+        if not self._chunks:
+            return []
+
+        total_chunks = len(self._chunks)
+        average_length = self._total_length / total_chunks or 1.0
+        scores: Dict[str, float] = defaultdict(float)
+
+        for term in set(tokenize(query)):
+            postings = self._postings.get(term)
+            if not postings:
+                continue
+            idf = self.idf(term)
+            for chunk_id, frequency in postings.items():
+                if doc_keys is not None and self._chunks[chunk_id].doc_key not in doc_keys:
+                    continue
+                norm = self.k1 * (1 - self.b + self.b * self._lengths[chunk_id] / average_length)
+                scores[chunk_id] += idf * frequency * (self.k1 + 1) / (frequency + norm)
+
+        best = heapq.nlargest(top_k, scores.items(), key=lambda item: item[1])
+        return [(self._chunks[chunk_id], score) for chunk_id, score in best]
+
+    def all_chunks(self) -> List[Chunk]:
+        """Every chunk in document order"""
+        return sorted(self._chunks.values(), key=lambda chunk: (chunk.position, chunk.doc_key, chunk.index))
+
+    def documents(self) -> List[Tuple[str, str, str, int]]:
+        """(doc_key, heading, content, tokens) of every document, in document order"""
+        documents = sorted(self._documents.items(), key=lambda item: (item[1][2], item[0]))
+        return [(doc_key, heading, content, tokens) for doc_key, (heading, content, _, tokens) in documents]
+
+    def render_documents(self) -> str:
+        """Render every document in full, in document order"""
+        return "\n".join(f"{heading}\n{content}\n" for _, heading, content, _ in self.documents())
+
+    def retrieve(self, query: str, top_k: int, char_budget: int, semantic_ranking: Optional[List[str]] = None, token_budget: Optional[int] = None) -> List[Chunk]:
+        """Select the best-scoring chunks for a question within a character (and token) budget
+
+        When a semantic ranking (chunk ids, best first) is given it is fused
+        with the BM25 ranking. Questions with no match fall back to chunks in
+        document order.
+        """
+        lexical_ranking = [chunk.chunk_id for chunk, _ in self.search(query, top_k)]
+        if semantic_ranking:
+            fused = reciprocal_rank_fusion([lexical_ranking, semantic_ranking])
+            ranked = [self._chunks[chunk_id] for chunk_id in fused if chunk_id in self._chunks]
+        else:
+            ranked = [self._chunks[chunk_id] for chunk_id in lexical_ranking]
+        if not ranked:
+            ranked = self.all_chunks()
+
+        selected = []
+        used = 0
+        used_tokens = 0
+        for chunk in ranked:
+            if used + len(chunk.text) > char_budget:
+                continue
+            if token_budget is not None and used_tokens + chunk.tokens > token_budget:
+                continue
+            selected.append(chunk)
+            used += len(chunk.text)
+            used_tokens += chunk.tokens
+            if len(selected) >= top_k:
+                break
+        return selected
+
+
+def reciprocal_rank_fusion(rankings: List[List[str]], k: int = 60) -> List[str]:
+    """Merge several best-first id rankings with reciprocal rank fusion"""
+    scores: Dict[str, float] = defaultdict(float)
+    for ranking in rankings:
+        for rank, item in enumerate(ranking):
+            scores[item] += 1.0 / (k + rank + 1)
+    return sorted(scores, key=lambda item: scores[item], reverse=True)
+
+
+async def build_context(index: BM25Index, query: str, top_k: int, char_budget: int, embedding_store=None, token_budget: Optional[int] = None) -> str:
+    """Context string for a question: the full corpus if it fits, else top-k chunks
+
+    `embedding_store` (an EmbeddingStore) adds semantic matches to the ranking.
+    `token_budget` additionally caps the estimated prompt tokens of the context.
+    """
+    if index.content_chars <= char_budget and (token_budget is None or index.document_tokens <= token_budget):
+        return index.render_documents()
+
+    semantic_ranking = None
+    if embedding_store is not None:
+        try:
+            semantic_ranking = [chunk_id for chunk_id, _ in await embedding_store.search(query, top_k)]
+        except Exception as e:
+            logger.warning(f"Semantic retrieval failed, using BM25 only: {str(e)}")
+
+    # Headings and separators are repeated per document; keep a margin for them
+    chunk_token_budget = None if token_budget is None else int(token_budget * 0.9)
+    chunks = index.retrieve(query, top_k, char_budget, semantic_ranking, chunk_token_budget)
+    logger.info(
+        f"Retrieved {len(chunks)} of {len(index)} chunks "
+        f"({sum(len(c.text) for c in chunks)} of {index.content_chars} chars)"
+    )
+    return render_chunks(chunks)
+
+
+def render_chunks(chunks: List[Chunk]) -> str:
+    """Render selected chunks grouped under their document heading, in document order"""
+    grouped: Dict[str, List[Chunk]] = {}
+    for chunk in sorted(chunks, key=lambda c: (c.position, c.doc_key, c.index)):
+        grouped.setdefault(chunk.doc_key, []).append(chunk)
+
+    context_parts = []
+    for doc_chunks in grouped.values():
+        body = "\n...\n".join(chunk.text for chunk in doc_chunks)
+        context_parts.append(f"{doc_chunks[0].heading}\n{body}\n")
+    return "\n".join(context_parts)
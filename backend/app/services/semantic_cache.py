@@ -0,0 +1,252 @@
+"""
+Near-duplicate question cache for /api/ask
+
+The exact answer cache only matches questions that normalize to the same
+text. This cache also matches rephrasings ("how many PTO days do I get" /
+"how many paid leave days per year"): each question is reduced to a set of
+content terms (stopwords and question filler dropped, light stemming, a
+small HR synonym map), signed with MinHash and indexed by LSH bands, so a
+lookup only compares against the few questions that share a band. A
+candidate is a hit when the Jaccard similarity of the term sets reaches
+SEMANTIC_CACHE_THRESHOLD and numbers and negations agree.
+
+Entries are partitioned by scope, mode, section and the write version of
+the corpus (not the exact context, which retrieval selects per question),
+so an answer is never reused after its policies / KB changed.
+Use evaluate_semantic_cache.py to measure hit and false-hit rates on a
+question log before enabling it or changing the threshold.
+"""
+import hashlib
+import logging
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Dict, FrozenSet, Iterable, List, Optional, Set, Tuple
+
+import numpy as np
+
+from ..config import settings
+from .answer_cache import corpus_version
+from .content_version import content_versions
+from .retrieval import tokenize
+
+logger = logging.getLogger(__name__)
+
+# 16 bands of 4 rows: pairs with Jaccard ~0.5 collide in at least one band about half the time, ~0.75 almost always
+LSH_BANDS = 16
+LSH_ROWS = 4
+NUM_PERMUTATIONS = LSH_BANDS * LSH_ROWS
+
+MERSENNE_PRIME = (1 << 61) - 1
+_rng = np.random.default_rng(20240611)
+# Fixed seed: signatures must agree across workers and with the evaluation script
+_PERM_A = _rng.integers(1, 1 << 30, size=NUM_PERMUTATIONS, dtype=np.uint64)
+_PERM_B = _rng.integers(0, 1 << 30, size=NUM_PERMUTATIONS, dtype=np.uint64)
+
+# Words that carry no meaning in a question on top of retrieval.STOPWORDS
+QUESTION_FILLER = frozenset({
+    "any", "could", "give", "go", "got", "ha", "have", "know", "many", "much", "need", "per",
+    "please", "should", "tell", "want", "would",
+})
+
+# HR vocabulary with more than one common name, mapped to canonical terms
+SYNONYMS: Dict[str, Tuple[str, ...]] = {
+    "pto": ("paid", "leave"),
+    "vacation": ("leave",),
+    "salary": ("pay",),
+    "paycheck": ("pay",),
+    "payday": ("pay", "day"),
+    "wfh": ("remote", "work"),
+    "medical": ("health",),
+    "reimbursement": ("expense",),
+    "reimburse": ("expense",),
+    "notebook": ("laptop",),
+}
+
+# A question and its negation share almost every term
+NEGATIONS = frozenset({"not", "no", "t", "never", "cannot", "without"})
+
+
+def question_terms(question: str) -> FrozenSet[str]:
+    """Content terms of a question, after filler removal and synonym mapping"""
+    terms: Set[str] = set()
+    for term in tokenize(question):
+        if term in QUESTION_FILLER:
+            continue
+        terms.update(SYNONYMS.get(term, (term,)))
+    return frozenset(terms)
+
+
+def jaccard(first: FrozenSet[str], second: FrozenSet[str]) -> float:
+    if not first or not second:
+        return 0.0
+    return len(first & second) / len(first | second)
+
+
+def compatible(first: FrozenSet[str], second: FrozenSet[str]) -> bool:
+    """Numbers ("step 4" / "step 5") and negations must be identical for a hit"""
+    return (
+        {term for term in first if term.isdigit()} == {term for term in second if term.isdigit()}
+        and bool(first & NEGATIONS) == bool(second & NEGATIONS)
+    )
+
+
+def minhash(terms: Iterable[str]) -> np.ndarray:
+    """MinHash signature (NUM_PERMUTATIONS values) of a term set"""
+    hashes = np.array(
+        # 33-bit term hashes keep a * x + b below 2^64
+        [int.from_bytes(hashlib.blake2b(term.encode("utf-8"), digest_size=8).digest(), "little") >> 31 for term in terms],
+        dtype=np.uint64
+    )
+    if hashes.size == 0:
+        return np.full(NUM_PERMUTATIONS, MERSENNE_PRIME, dtype=np.uint64)
+    return ((_PERM_A[:, None] * hashes[None, :] + _PERM_B[:, None]) % MERSENNE_PRIME).min(axis=1)
+
+
+def band_hashes(signature: np.ndarray) -> List[int]:
+    rows = signature.reshape(LSH_BANDS, LSH_ROWS)
+    return [hash(row.tobytes()) for row in rows]
+
+
+Partition = Tuple[str, str, str, str]
+
+
+@dataclass
+class SemanticEntry:
+    question: str
+    terms: FrozenSet[str]
+    answer: str
+    corpus: str
+    partition: Partition
+    buckets: Tuple[tuple, ...]
+    expires_at: float
+
+
+@dataclass
+class SemanticMatch:
+    """Cached answer for a similar earlier question"""
+    answer: str
+    question: str
+    similarity: float
+
+
+class SemanticAnswerCache:
+    """MinHash / LSH index of recent questions and their answers, LRU + TTL bounded"""
+
+    def __init__(self, threshold: float = 0.7, max_entries: int = 2000, ttl_seconds: float = 3600):
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[int, SemanticEntry]" = OrderedDict()
+        self._buckets: Dict[tuple, Set[int]] = {}
+        self._next_id = 0
+        self.hits = 0
+        self.misses = 0
+        self.candidates_checked = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    @staticmethod
+    def partition(scope: str, mode: Optional[str], section_id: Optional[str], version: str) -> Partition:
+        """Entries are only compared within a partition; `version` is an answer_cache.context_version"""
+        return (scope, mode or "", section_id or "", corpus_version(version))
+
+    def _drop(self, entry_id: int):
+        entry = self._entries.pop(entry_id)
+        for bucket in entry.buckets:
+            members = self._buckets.get(bucket)
+            if members is not None:
+                members.discard(entry_id)
+                if not members:
+                    del self._buckets[bucket]
+
+    def _best(self, partition: Partition, terms: FrozenSet[str]) -> Tuple[Optional[int], float]:
+        """Most similar live entry sharing an LSH band with the terms"""
+        now = time.monotonic()
+        candidates: Set[int] = set()
+        for band, value in enumerate(band_hashes(minhash(terms))):
+            candidates |= self._buckets.get((partition, band, value), set())
+
+        best_id, best_similarity = None, 0.0
+        for entry_id in candidates:
+            entry = self._entries[entry_id]
+            if entry.expires_at <= now:
+                self._drop(entry_id)
+                continue
+            self.candidates_checked += 1
+            similarity = jaccard(terms, entry.terms)
+            if similarity > best_similarity and compatible(terms, entry.terms):
+                best_id, best_similarity = entry_id, similarity
+        return best_id, best_similarity
+
+    def get(self, scope: str, mode: Optional[str], section_id: Optional[str], version: str, question: str) -> Optional[SemanticMatch]:
+        """Answer of the most similar earlier question at the current content version, if similar enough"""
+        terms = question_terms(question)
+        if not terms:
+            self.misses += 1
+            return None
+        entry_id, similarity = self._best(self.partition(scope, mode, section_id, version), terms)
+        if entry_id is None or similarity < self.threshold:
+            self.misses += 1
+            return None
+        self._entries.move_to_end(entry_id)
+        self.hits += 1
+        entry = self._entries[entry_id]
+        logger.info(f"Semantic cache hit ({similarity:.2f}): {question!r} ~ {entry.question!r}")
+        return SemanticMatch(entry.answer, entry.question, round(similarity, 3))
+
+    def add(self, scope: str, mode: Optional[str], section_id: Optional[str], version: str, corpus: str, question: str, answer: str):
+        """Index an answered question, replacing an entry with the same terms"""
+        terms = question_terms(question)
+        if not terms:
+            return
+        partition = self.partition(scope, mode, section_id, version)
+        entry_id, similarity = self._best(partition, terms)
+        if entry_id is not None and similarity == 1.0:
+            self._drop(entry_id)
+
+        buckets = tuple((partition, band, value) for band, value in enumerate(band_hashes(minhash(terms))))
+        entry_id = self._next_id
+        self._next_id += 1
+        self._entries[entry_id] = SemanticEntry(question, terms, answer, corpus, partition, buckets, time.monotonic() + self.ttl_seconds)
+        for bucket in buckets:
+            self._buckets.setdefault(bucket, set()).add(entry_id)
+
+        while len(self._entries) > self.max_entries:
+            self._drop(next(iter(self._entries)))
+            self.evictions += 1
+
+    def invalidate(self, corpus: str, version: Optional[int] = None):
+        """Drop every entry answered from a corpus (content version listener)"""
+        stale = [entry_id for entry_id, entry in self._entries.items() if entry.corpus == corpus]
+        for entry_id in stale:
+            self._drop(entry_id)
+        self.invalidations += len(stale)
+
+    def clear(self):
+        self._entries.clear()
+        self._buckets.clear()
+
+    def get_stats(self) -> Dict:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "buckets": len(self._buckets),
+            "threshold": self.threshold,
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "candidates_checked": self.candidates_checked,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations,
+        }
+
+
+# Global instance, invalidated on every policy / KB write
+semantic_cache = SemanticAnswerCache(
+    threshold=settings.SEMANTIC_CACHE_THRESHOLD,
+    max_entries=settings.SEMANTIC_CACHE_MAX_ENTRIES,
+    ttl_seconds=settings.SEMANTIC_CACHE_TTL_SECONDS
+)
+content_versions.add_listener(semantic_cache.invalidate)
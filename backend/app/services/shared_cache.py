@@ -0,0 +1,339 @@
+"""
+Shared L2 cache for answers and contexts across workers and instances
+
+Every gunicorn worker on every App Service instance keeps its own
+in-process caches, so each worker warms them separately and only the worker
+that handled a policy / KB write drops its stale entries. With REDIS_URL
+set, a Redis-protocol store sits behind them:
+
+- TwoTierCache looks a value up in the in-process L1 first, then in L2, and
+  writes through to both. L2 keys embed the corpus generation, a counter in
+  L2 that every policy / KB write increments, so one write makes every older
+  key of that corpus unreachable (they expire by TTL).
+- Writes are announced on a pub/sub channel. The other workers bump their
+  local content version, which drops their L1 answers, snapshots and
+  semantic cache entries, and rebuild their retrieval index on next use,
+  instead of waiting for RETRIEVAL_INDEX_REFRESH_SECONDS.
+
+Redis is optional. Without REDIS_URL (or the `redis` package, which startup
+warns about), or while the store is unreachable (a circuit breaker stops
+calling it), everything runs on the in-process caches alone. REDIS_URL=fakeredis:// uses an in-process
+fakeredis server for local runs.
+"""
+import asyncio
+import hashlib
+import json
+import logging
+import uuid
+from collections import defaultdict
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set, Tuple
+
+from ..config import settings
+from .answer_cache import AnswerCache, answer_cache
+from .content_version import content_versions
+from .resilience import CircuitBreaker
+
+logger = logging.getLogger(__name__)
+
+try:
+    import redis.asyncio as redis_asyncio
+except ImportError:  # optional dependency
+    redis_asyncio = None
+
+INVALIDATION_CHANNEL = "invalidate"
+
+# Consecutive L2 failures before it is skipped, and for how long
+BREAKER_FAILURE_THRESHOLD = 3
+BREAKER_RECOVERY_SECONDS = 30.0
+
+# Pause before resubscribing after the pub/sub connection dropped
+SUBSCRIBE_RETRY_SECONDS = 5.0
+
+
+def _connect(url: str):
+    """Redis client for a URL; fakeredis:// is an in-process stand-in"""
+    if url.startswith("fakeredis://"):
+        import fakeredis
+        return fakeredis.FakeAsyncRedis(decode_responses=True)
+    return redis_asyncio.from_url(
+        url,
+        decode_responses=True,
+        socket_timeout=settings.REDIS_TIMEOUT_SECONDS,
+        socket_connect_timeout=settings.REDIS_TIMEOUT_SECONDS
+    )
+
+
+class SharedCache:
+    """Connection to the L2 store: guarded commands, corpus generations and write announcements"""
+
+    def __init__(self):
+        self._client = None
+        # Identifies this worker's own announcements on the channel
+        self.origin = uuid.uuid4().hex
+        self.breaker = CircuitBreaker(
+            "shared-cache", failure_threshold=BREAKER_FAILURE_THRESHOLD, recovery_timeout=BREAKER_RECOVERY_SECONDS
+        )
+        self._generations: Dict[str, int] = {}
+        # Local writes whose new generation is not known yet; L2 is skipped for those corpora
+        self._pending: Dict[str, int] = defaultdict(int)
+        self._unannounced: Set[str] = set()
+        self._remote_handlers: Dict[str, List[Callable[[], None]]] = defaultdict(list)
+        self._applying_remote = False
+        self._tasks: Set[asyncio.Task] = set()
+        self._listener: Optional[asyncio.Task] = None
+        self.subscribed = False
+        self.errors = 0
+        self.skipped = 0
+        self.announced = 0
+        self.remote_invalidations = 0
+
+    @property
+    def enabled(self) -> bool:
+        if not settings.REDIS_URL:
+            return False
+        return redis_asyncio is not None or settings.REDIS_URL.startswith("fakeredis://")
+
+    def key(self, *parts: Any) -> str:
+        return ":".join([settings.REDIS_KEY_PREFIX, *(str(part) for part in parts)])
+
+    def _get_client(self):
+        if self._client is None:
+            self._client = _connect(settings.REDIS_URL)
+        return self._client
+
+    async def call(self, operation: str, command: Callable[[Any], Awaitable[Any]]) -> Tuple[bool, Any]:
+        """Run one L2 command: (True, result), or (False, None) when L2 is off, unreachable or skipped"""
+        if not self.enabled:
+            return False, None
+        if not self.breaker.allow_request():
+            self.skipped += 1
+            return False, None
+        try:
+            result = await asyncio.wait_for(command(self._get_client()), settings.REDIS_TIMEOUT_SECONDS)
+        except asyncio.CancelledError:
+            self.breaker.release()
+            raise
+        except Exception as e:
+            self.errors += 1
+            self.breaker.record_failure()
+            logger.warning(f"Shared cache {operation} failed, using in-process caches only: {str(e)}")
+            return False, None
+        self.breaker.record_success()
+        return True, result
+
+    async def generation(self, corpus: str) -> Optional[int]:
+        """Current L2 generation of a corpus; None while it is unknown, in which case L2 is skipped"""
+        if self._pending[corpus]:
+            return None
+        if corpus in self._unannounced:
+            # A write happened while L2 was unreachable
+            await self._announce(corpus)
+            return self._generations.get(corpus)
+        if corpus not in self._generations:
+            ok, value = await self.call("get", lambda client: client.get(self.key("generation", corpus)))
+            if not ok:
+                return None
+            self._generations[corpus] = int(value or 0)
+        return self._generations[corpus]
+
+    def on_remote_write(self, corpus: str, handler: Callable[[], None]):
+        """Run handler when another worker announces a write to a corpus"""
+        self._remote_handlers[corpus].append(handler)
+
+    def on_local_write(self, corpus: str, version: int):
+        """Announce a write made by this worker (content version listener)"""
+        if self._applying_remote or not self.enabled:
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            # Outside the app (scripts); other workers catch up on their index refresh
+            return
+        self._pending[corpus] += 1
+        task = loop.create_task(self._announce(corpus, pending=True))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _announce(self, corpus: str, pending: bool = False):
+        """Increment the corpus generation in L2 and publish it"""
+        try:
+            ok, generation = await self.call("incr", lambda client: client.incr(self.key("generation", corpus)))
+            if not ok:
+                self._unannounced.add(corpus)
+                self._generations.pop(corpus, None)
+                return
+            self._unannounced.discard(corpus)
+            self._generations[corpus] = max(generation, self._generations.get(corpus, 0))
+            message = json.dumps({"corpus": corpus, "generation": generation, "origin": self.origin})
+            ok, _ = await self.call("publish", lambda client: client.publish(self.key(INVALIDATION_CHANNEL), message))
+            if ok:
+                self.announced += 1
+        finally:
+            if pending:
+                self._pending[corpus] -= 1
+
+    def _apply_remote(self, corpus: str, generation: int):
+        """Drop this worker's state derived from a corpus another worker wrote to"""
+        known = self._generations.get(corpus)
+        if known is not None and generation <= known:
+            return
+        self._generations[corpus] = generation
+        self.remote_invalidations += 1
+        for handler in self._remote_handlers[corpus]:
+            handler()
+        self._applying_remote = True
+        try:
+            content_versions.bump(corpus)
+        finally:
+            self._applying_remote = False
+        logger.info(f"Applied remote write to {corpus} (generation {generation})")
+
+    async def _resync(self):
+        """After (re)subscribing, catch up on announcements missed while disconnected"""
+        for corpus, known in list(self._generations.items()):
+            ok, value = await self.call("get", lambda client: client.get(self.key("generation", corpus)))
+            if ok and int(value or 0) != known:
+                self._generations.pop(corpus, None)
+                self._apply_remote(corpus, int(value or 0))
+
+    async def _listen(self):
+        channel = self.key(INVALIDATION_CHANNEL)
+        while True:
+            pubsub = None
+            try:
+                pubsub = self._get_client().pubsub()
+                await pubsub.subscribe(channel)
+                self.subscribed = True
+                await self._resync()
+                async for message in pubsub.listen():
+                    if message.get("type") != "message":
+                        continue
+                    payload = json.loads(message["data"])
+                    if payload.get("origin") != self.origin:
+                        self._apply_remote(payload["corpus"], int(payload["generation"]))
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"Shared cache subscription lost, retrying in {SUBSCRIBE_RETRY_SECONDS:g}s: {str(e)}")
+            finally:
+                self.subscribed = False
+                if pubsub is not None:
+                    try:
+                        await pubsub.aclose()
+                    except Exception:
+                        pass
+            await asyncio.sleep(SUBSCRIBE_RETRY_SECONDS)
+
+    def start(self):
+        if settings.REDIS_URL and not self.enabled:
+            logger.warning(
+                "REDIS_URL is set but the redis package is not installed; "
+                "running without the shared cache and cross-worker invalidation"
+            )
+            return
+        if self.enabled and self._listener is None:
+            self._listener = asyncio.create_task(self._listen())
+            logger.info(f"Shared cache enabled ({settings.REDIS_KEY_PREFIX})")
+
+    async def stop(self):
+        if self._listener is not None:
+            self._listener.cancel()
+            try:
+                await self._listener
+            except asyncio.CancelledError:
+                pass
+            self._listener = None
+        if self._client is not None:
+            try:
+                await self._client.aclose()
+            except Exception as e:
+                logger.warning(f"Failed to close the shared cache connection: {str(e)}")
+            self._client = None
+
+    def get_stats(self) -> Dict:
+        return {
+            "enabled": self.enabled,
+            "subscribed": self.subscribed,
+            "generations": dict(self._generations),
+            "announced": self.announced,
+            "remote_invalidations": self.remote_invalidations,
+            "errors": self.errors,
+            "skipped": self.skipped,
+            "circuit_breaker": self.breaker.get_stats(),
+        }
+
+
+class TwoTierCache:
+    """In-process L1 in front of the shared L2 for one kind of value
+
+    `l1` is None for callers that keep their own in-process copy (context
+    snapshots). `shared_key` is the worker-independent form of `key` (no
+    local content version in it); it defaults to `key`. A shared key that
+    does not pin the content (no context hash in it) must be written with the
+    generation read before the value was computed, so a value rendered from
+    content that changed meanwhile is not stored under the new generation.
+    """
+
+    def __init__(self, namespace: str, l1: Optional[AnswerCache], ttl_seconds: int):
+        self.namespace = namespace
+        self.l1 = l1
+        self.ttl_seconds = ttl_seconds
+        self.l2_hits = 0
+        self.l2_misses = 0
+        self.l2_stale_writes = 0
+
+    def _l2_key(self, corpus: str, generation: int, key: str) -> str:
+        digest = hashlib.sha1(key.encode("utf-8")).hexdigest()
+        return shared_cache.key(self.namespace, corpus, generation, digest)
+
+    async def get(self, corpus: str, key: str, shared_key: Optional[str] = None) -> Optional[str]:
+        if self.l1 is not None:
+            value = self.l1.get(key)
+            if value is not None:
+                return value
+        generation = await shared_cache.generation(corpus)
+        if generation is None:
+            return None
+        l2_key = self._l2_key(corpus, generation, shared_key or key)
+        ok, value = await shared_cache.call("get", lambda client: client.get(l2_key))
+        if not ok:
+            return None
+        if value is None:
+            self.l2_misses += 1
+            return None
+        self.l2_hits += 1
+        if self.l1 is not None:
+            self.l1.set(key, value, corpus)
+        return value
+
+    async def set(self, corpus: str, key: str, value: str, shared_key: Optional[str] = None,
+                  generation: Optional[int] = None):
+        """Store a value; with `generation`, L2 is only written if the corpus is still at it"""
+        if self.l1 is not None:
+            self.l1.set(key, value, corpus)
+        current = await shared_cache.generation(corpus)
+        if current is None:
+            return
+        if generation is not None and generation != current:
+            self.l2_stale_writes += 1
+            return
+        generation = current
+        l2_key = self._l2_key(corpus, generation, shared_key or key)
+        await shared_cache.call("set", lambda client: client.set(l2_key, value, ex=self.ttl_seconds))
+
+    def get_stats(self) -> Dict:
+        lookups = self.l2_hits + self.l2_misses
+        return {
+            "l2_hits": self.l2_hits,
+            "l2_misses": self.l2_misses,
+            "l2_stale_writes": self.l2_stale_writes,
+            "l2_hit_rate": round(self.l2_hits / lookups, 4) if lookups else 0.0,
+            "ttl_seconds": self.ttl_seconds,
+        }
+
+
+# Global instances; every local policy / KB write is announced to the other workers
+shared_cache = SharedCache()
+content_versions.add_listener(shared_cache.on_local_write)
+answer_tiers = TwoTierCache("answer", answer_cache, settings.ANSWER_CACHE_TTL_SECONDS)
+context_tiers = TwoTierCache("context", None, settings.REDIS_CONTEXT_TTL_SECONDS)
@@ -0,0 +1,84 @@
+"""
+Single-flight request coalescing
+
+Concurrent callers asking for the same key share one upstream call instead
+of each starting their own. The call runs as a task owned by the group, so
+one caller being cancelled does not cancel it for the others; the task is
+only cancelled once every caller waiting on it has gone away. Results and
+exceptions are delivered to every waiter.
+"""
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Dict, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class _Call:
+    """One in-flight upstream call and the number of callers awaiting it"""
+
+    def __init__(self, task: asyncio.Task):
+        self.task = task
+        self.waiters = 0
+
+
+class SingleFlight:
+    """Deduplicates concurrent async calls by key"""
+
+    def __init__(self):
+        self._calls: Dict[str, _Call] = {}
+        self.leaders = 0
+        self.coalesced = 0
+        self.cancelled = 0
+
+    def _forget(self, key: str, call: _Call):
+        if self._calls.get(key) is call:
+            del self._calls[key]
+
+    async def do(self, key: str, factory: Callable[[], Awaitable[Any]]) -> Tuple[Any, bool]:
+        """Run factory() once per key among concurrent callers
+
+        Returns (result, shared) where shared is True if this caller joined a
+        call started by another request.
+        """
+        call = self._calls.get(key)
+        shared = call is not None
+        if call is None:
+            call = _Call(asyncio.create_task(factory()))
+            self._calls[key] = call
+            call.task.add_done_callback(lambda _: self._forget(key, call))
+            self.leaders += 1
+        else:
+            self.coalesced += 1
+
+        call.waiters += 1
+        try:
+            return await asyncio.shield(call.task), shared
+        except asyncio.CancelledError:
+            if not call.task.done() and call.waiters == 1:
+                # Last interested caller left: stop the upstream call and let
+                # the next request for this key start a fresh one
+                self._forget(key, call)
+                call.task.cancel()
+                self.cancelled += 1
+                logger.info("Cancelled in-flight AI request: no callers left")
+            raise
+        finally:
+            call.waiters -= 1
+
+    @property
+    def in_flight(self) -> int:
+        return len(self._calls)
+
+    def get_stats(self) -> Dict:
+        """Counters for the coalescing layer"""
+        return {
+            "in_flight": self.in_flight,
+            "leaders": self.leaders,
+            "coalesced": self.coalesced,
+            "cancelled": self.cancelled,
+        }
+
+
+# Global instance for /api/ask completions
+ask_single_flight = SingleFlight()
@@ -0,0 +1,151 @@
+"""
+Prompt token budgeting
+
+Estimates prompt tokens locally and packs context blocks into a token
+budget. `tiktoken` is used when it is installed; otherwise a regex based
+estimate that errs slightly high for English prose is used, so a context
+that fits locally also fits the deployment.
+"""
+import logging
+import re
+from dataclasses import dataclass
+from typing import List, Optional
+
+from ..config import settings
+
+logger = logging.getLogger(__name__)
+
+try:
+    import tiktoken
+except ImportError:  # optional dependency
+    tiktoken = None
+
+# Words, digit runs and single punctuation marks, each with any leading whitespace
+PIECE_PATTERN = re.compile(r"\s*(?:[A-Za-z]+|\d+|[^\sA-Za-z\d])|\s+")
+
+# Per-message framing added by the chat completions format
+MESSAGE_OVERHEAD_TOKENS = 4
+
+TRUNCATION_MARKER = "\n[...]"
+
+# A block is only truncated into the remaining budget if at least this much is left
+MIN_TRUNCATED_BLOCK_TOKENS = 32
+
+_encoding = None
+if tiktoken is not None:
+    try:
+        _encoding = tiktoken.get_encoding(settings.AI_TOKENIZER_ENCODING)
+    except Exception as e:
+        logger.warning(f"tiktoken encoding '{settings.AI_TOKENIZER_ENCODING}' unavailable, using local estimate: {str(e)}")
+
+
+def _piece_tokens(piece: str) -> int:
+    word = piece.strip()
+    if not word:
+        return 1 if len(piece) > 1 else 0
+    if word.isdigit():
+        return (len(word) + 2) // 3
+    if word.isalpha():
+        return (len(word) + 4) // 5
+    return 1
+
+
+def count_tokens(text: str) -> int:
+    """Estimated number of tokens in text"""
+    if not text:
+        return 0
+    if _encoding is not None:
+        return len(_encoding.encode(text, disallowed_special=()))
+    return sum(_piece_tokens(piece) for piece in PIECE_PATTERN.findall(text))
+
+
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    """Cut text to at most max_tokens (marker included), preferring a line or sentence boundary"""
+    if count_tokens(text) <= max_tokens:
+        return text
+    limit = max_tokens - count_tokens(TRUNCATION_MARKER)
+    if limit <= 0:
+        return ""
+
+    if _encoding is not None:
+        cut = _encoding.decode(_encoding.encode(text, disallowed_special=())[:limit])
+    else:
+        used = 0
+        end = 0
+        for match in PIECE_PATTERN.finditer(text):
+            used += _piece_tokens(match.group())
+            if used > limit:
+                break
+            end = match.end()
+        cut = text[:end]
+
+    # Back off to the last line/sentence break if it keeps most of the text
+    boundary = max(cut.rfind("\n"), cut.rfind(". "))
+    if boundary > len(cut) * 0.8:
+        cut = cut[:boundary + 1]
+    return cut.rstrip() + TRUNCATION_MARKER
+
+
+@dataclass
+class ContextBlock:
+    """A piece of context (a section, document or chunk) with its cached token count"""
+    text: str
+    tokens: Optional[int] = None
+
+    def token_count(self) -> int:
+        if self.tokens is None:
+            self.tokens = count_tokens(self.text)
+        return self.tokens
+
+
+@dataclass
+class PackedContext:
+    text: str
+    tokens: int
+    included: int
+    truncated: int
+    dropped: int
+
+
+def pack_blocks(blocks: List[ContextBlock], budget: Optional[int], separator: str = "\n") -> PackedContext:
+    """Join blocks, given in priority order, into at most `budget` tokens
+
+    Blocks that fit are kept whole. The first block that does not fit is
+    truncated into the remaining budget (if enough is left); lower priority
+    blocks that still fit after it are kept, the rest are dropped. The result
+    is deterministic for the same blocks and budget.
+    """
+    if budget is None:
+        text = separator.join(block.text for block in blocks)
+        return PackedContext(text, sum(block.token_count() for block in blocks), len(blocks), 0, 0)
+
+    separator_tokens = count_tokens(separator)
+    parts: List[str] = []
+    used = 0
+    truncated = 0
+    dropped = 0
+    for block in blocks:
+        cost = block.token_count() + (separator_tokens if parts else 0)
+        if used + cost <= budget:
+            parts.append(block.text)
+            used += cost
+            continue
+
+        remaining = budget - used - (separator_tokens if parts else 0)
+        if not truncated and remaining >= MIN_TRUNCATED_BLOCK_TOKENS:
+            cut = truncate_to_tokens(block.text, remaining)
+            if cut:
+                parts.append(cut)
+                used += count_tokens(cut) + (separator_tokens if len(parts) > 1 else 0)
+                truncated += 1
+                continue
+        dropped += 1
+
+    if truncated or dropped:
+        logger.info(f"Packed context into {used}/{budget} tokens: {len(parts)} blocks kept, {truncated} truncated, {dropped} dropped")
+    return PackedContext(separator.join(parts), used, len(parts), truncated, dropped)
+
+
+def prompt_token_budget(max_tokens: int) -> int:
+    """Tokens available for the whole prompt given the reserved completion tokens"""
+    return max(0, min(settings.AI_PROMPT_TOKEN_BUDGET, settings.AI_CONTEXT_WINDOW - max_tokens))
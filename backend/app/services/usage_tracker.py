@@ -0,0 +1,149 @@
+"""
+Token, latency and cost accounting for /api/ask
+
+Every answered question is recorded under its scope, mode and section
+(section only for guided questions) with its context size, cache status and
+answer source. Upstream completions add the prompt / completion tokens from
+the response `usage` block and the upstream latency. Aggregates are kept
+per worker process and served by GET /api/ai/usage.
+"""
+import logging
+from collections import Counter
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Tuple
+
+from ..config import settings
+from .ai_connector import CompletionStats
+
+logger = logging.getLogger(__name__)
+
+# Bounds the number of (scope, mode, section) buckets; further sections share one
+MAX_BUCKETS = 500
+OTHER_SECTION = "(other)"
+
+SORT_FIELDS = ("prompt_tokens", "completion_tokens", "total_tokens", "cost", "asks", "avg_prompt_tokens",
+               "avg_context_chars", "avg_upstream_ms", "max_upstream_ms")
+
+
+@dataclass
+class UsageBucket:
+    """Running totals for one scope / mode / section"""
+    asks: int = 0
+    cache_hits: int = 0
+    sources: Counter = field(default_factory=Counter)
+    context_chars: int = 0
+    completions: int = 0
+    failed_completions: int = 0
+    estimated_prompt_tokens: int = 0
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    upstream_seconds: float = 0.0
+    max_upstream_seconds: float = 0.0
+    first_token_seconds: float = 0.0
+    streamed: int = 0
+
+    def cost(self) -> float:
+        return (self.prompt_tokens * settings.AI_PROMPT_COST_PER_1K_TOKENS
+                + self.completion_tokens * settings.AI_COMPLETION_COST_PER_1K_TOKENS) / 1000
+
+    def to_dict(self) -> Dict[str, Any]:
+        answered = self.completions or 1
+        return {
+            "asks": self.asks,
+            "cache_hits": self.cache_hits,
+            "cache_hit_rate": round(self.cache_hits / self.asks, 4) if self.asks else 0.0,
+            "sources": dict(self.sources),
+            "completions": self.completions,
+            "failed_completions": self.failed_completions,
+            "prompt_tokens": self.prompt_tokens,
+            "completion_tokens": self.completion_tokens,
+            "total_tokens": self.prompt_tokens + self.completion_tokens,
+            "estimated_prompt_tokens": self.estimated_prompt_tokens,
+            "avg_prompt_tokens": round(self.prompt_tokens / answered, 1),
+            "avg_completion_tokens": round(self.completion_tokens / answered, 1),
+            "avg_context_chars": round(self.context_chars / self.asks, 1) if self.asks else 0.0,
+            "avg_upstream_ms": round(self.upstream_seconds / answered * 1000, 1),
+            "max_upstream_ms": round(self.max_upstream_seconds * 1000, 1),
+            "avg_first_token_ms": round(self.first_token_seconds / self.streamed * 1000, 1) if self.streamed else None,
+            "cost": round(self.cost(), 6),
+        }
+
+
+class UsageTracker:
+    """In-process aggregates of /api/ask usage keyed by (scope, mode, section)"""
+
+    def __init__(self):
+        self._buckets: Dict[Tuple[str, str, str], UsageBucket] = {}
+        self.since = datetime.now(timezone.utc)
+
+    def _bucket(self, scope: str, mode: Optional[str], section_id: Optional[str]) -> UsageBucket:
+        key = (scope, mode or "-", section_id or "-")
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            if len(self._buckets) >= MAX_BUCKETS:
+                key = (scope, mode or "-", OTHER_SECTION)
+                bucket = self._buckets.get(key)
+            if bucket is None:
+                bucket = self._buckets[key] = UsageBucket()
+        return bucket
+
+    def record_ask(self, scope: str, mode: Optional[str], section_id: Optional[str], context_chars: int = 0,
+                   cached: bool = False, source: str = "ai"):
+        """Record one answered question"""
+        bucket = self._bucket(scope, mode, section_id)
+        bucket.asks += 1
+        bucket.context_chars += context_chars
+        bucket.sources[source] += 1
+        if cached:
+            bucket.cache_hits += 1
+
+    def record_completion(self, scope: str, mode: Optional[str], section_id: Optional[str], stats: CompletionStats, ok: bool = True):
+        """Record one upstream completion (not cache hits or coalesced followers)"""
+        bucket = self._bucket(scope, mode, section_id)
+        if not ok:
+            bucket.failed_completions += 1
+            return
+        bucket.completions += 1
+        bucket.estimated_prompt_tokens += stats.estimated_prompt_tokens
+        # Fall back to the estimate if the deployment did not report usage
+        bucket.prompt_tokens += stats.prompt_tokens if stats.prompt_tokens is not None else stats.estimated_prompt_tokens
+        bucket.completion_tokens += stats.completion_tokens or 0
+        if stats.latency_seconds is not None:
+            bucket.upstream_seconds += stats.latency_seconds
+            bucket.max_upstream_seconds = max(bucket.max_upstream_seconds, stats.latency_seconds)
+        if stats.first_token_seconds is not None:
+            bucket.streamed += 1
+            bucket.first_token_seconds += stats.first_token_seconds
+
+    def get_report(self, sort_by: str = "prompt_tokens", limit: int = 50) -> Dict[str, Any]:
+        """Totals plus the top `limit` scope / mode / section rows ordered by `sort_by`"""
+        if sort_by not in SORT_FIELDS:
+            raise ValueError(f"sort_by must be one of: {', '.join(SORT_FIELDS)}")
+
+        totals = UsageBucket()
+        rows: List[Dict[str, Any]] = []
+        for (scope, mode, section_id), bucket in self._buckets.items():
+            rows.append({"scope": scope, "mode": mode, "section_id": section_id, **bucket.to_dict()})
+            for name in ("asks", "cache_hits", "context_chars", "completions", "failed_completions", "estimated_prompt_tokens",
+                         "prompt_tokens", "completion_tokens", "upstream_seconds", "first_token_seconds", "streamed"):
+                setattr(totals, name, getattr(totals, name) + getattr(bucket, name))
+            totals.sources.update(bucket.sources)
+            totals.max_upstream_seconds = max(totals.max_upstream_seconds, bucket.max_upstream_seconds)
+
+        rows.sort(key=lambda row: row[sort_by] or 0, reverse=True)
+        return {
+            "since": self.since.isoformat(),
+            "totals": totals.to_dict(),
+            "rows": rows[:limit],
+            "row_count": len(rows),
+            "sort_by": sort_by,
+        }
+
+    def reset(self):
+        self._buckets.clear()
+        self.since = datetime.now(timezone.utc)
+
+
+# Global instance
+usage_tracker = UsageTracker()
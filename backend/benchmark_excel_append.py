@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+"""
+Benchmark for appending onboarded employees to the Excel export
+
+For each workbook size, fills a temporary workbook with that many employees
+and then times single-row appends through ExcelWriter.append_employee_row,
+the call /api/onboard makes. Latency should stay flat as the workbook grows.
+With --rewrite-max-rows the same sizes (up to that many rows) are also timed
+with a full openpyxl load / append / save, the cost of rewriting the
+workbook on every onboarding.
+
+Usage:
+    python benchmark_excel_append.py --sizes 100,1000,10000,100000 --appends 50
+"""
+
+import argparse
+import json
+import statistics
+import tempfile
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Dict, List
+
+import openpyxl
+
+from app.services.excel_writer import ExcelWriter
+
+
+def employee(index: int) -> Dict:
+    return {
+        "employee_code": f"EMP{index:06d}",
+        "employee_name": f"Employee {index}",
+        "gender": "Female" if index % 2 else "Male",
+        "date_of_birth": "1990-01-01",
+        "date_of_joining": "2024-01-15",
+        "designation": "Software Engineer",
+        "ctc_at_joining": 750000 + index,
+        "aadhaar_number": f"{123456789012 + index}",
+        "uan": f"{100000000000 + index}",
+        "personal_email_id": f"employee{index}@email.com",
+        "official_email_id": f"employee{index}@company.com",
+        "contact_number": "+91-9876543210",
+        "emergency_contact_name": "Jane Doe",
+        "emergency_contact_number": "+91-9876543211",
+        "created_at": datetime.now(timezone.utc),
+    }
+
+
+def percentile(values: List[float], fraction: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def time_appends(writer: ExcelWriter, start: int, appends: int) -> List[float]:
+    latencies = []
+    for index in range(start, start + appends):
+        began = time.perf_counter()
+        if writer.append_employee_row(employee(index)) != "ok":
+            raise RuntimeError("Append failed")
+        latencies.append((time.perf_counter() - began) * 1000)
+    return latencies
+
+
+def time_rewrites(writer: ExcelWriter, start: int, appends: int) -> List[float]:
+    latencies = []
+    for index in range(start, start + appends):
+        began = time.perf_counter()
+        workbook = openpyxl.load_workbook(writer.excel_path)
+        workbook.active.append(writer.format_row(employee(index)))
+        workbook.save(writer.excel_path)
+        latencies.append((time.perf_counter() - began) * 1000)
+    return latencies
+
+
+def benchmark(size: int, appends: int, rewrite: bool) -> Dict:
+    with tempfile.TemporaryDirectory() as directory:
+        writer = ExcelWriter(str(Path(directory) / "employees.xlsx"))
+        writer.sheet.create(writer.excel_path, (writer.format_row(employee(index)) for index in range(size)))
+        latencies = time_appends(writer, size, appends)
+        result = {
+            "rows": size,
+            "file_mb": round(writer.excel_path.stat().st_size / 1_000_000, 2),
+            "append_p50_ms": round(statistics.median(latencies), 3),
+            "append_p95_ms": round(percentile(latencies, 0.95), 3),
+        }
+        if rewrite:
+            rewrites = time_rewrites(writer, size + appends, min(appends, 3))
+            result["rewrite_p50_ms"] = round(statistics.median(rewrites), 1)
+        return result
+
+
+def print_report(results: List[Dict]):
+    print(f"{'rows':>8}  {'file MB':>8}  {'append p50':>10}  {'append p95':>10}  {'rewrite p50':>11}")
+    for result in results:
+        rewrite = f"{result['rewrite_p50_ms']:.1f} ms" if "rewrite_p50_ms" in result else "-"
+        print(
+            f"{result['rows']:>8}  {result['file_mb']:>8.2f}  {result['append_p50_ms']:>7.3f} ms"
+            f"  {result['append_p95_ms']:>7.3f} ms  {rewrite:>11}"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark Excel export appends against workbook size")
+    parser.add_argument("--sizes", default="100,1000,10000,100000", help="Comma-separated workbook sizes (rows)")
+    parser.add_argument("--appends", type=int, default=50, help="Single-row appends timed per size")
+    parser.add_argument("--rewrite-max-rows", type=int, default=0,
+                        help="Also time full load/save rewrites for sizes up to this many rows")
+    parser.add_argument("--json", action="store_true", help="Print the report as JSON")
+    args = parser.parse_args()
+
+    reports = [
+        benchmark(int(value), args.appends, int(value) <= args.rewrite_max_rows)
+        for value in args.sizes.split(",") if value.strip()
+    ]
+    if args.json:
+        print(json.dumps(reports, indent=2))
+    else:
+        print_report(reports)
@@ -0,0 +1,148 @@
+#!/usr/bin/env python3
+"""
+Offline evaluation of the semantic answer cache
+
+Replays a question log through SemanticAnswerCache in arrival order: each
+question is looked up first and, on a miss, added as if the AI had answered
+it. With labels (questions with the same label have the same answer) every
+hit is checked, so the report shows the hit rate, the false-hit rate (hits
+that returned the answer to a different question) and the recall over the
+questions that could have hit. Run it on a real log before enabling
+SEMANTIC_CACHE_ENABLED or changing SEMANTIC_CACHE_THRESHOLD.
+
+The log is JSON lines ({"question": ..., "label": ..., "scope": ...}, label
+and scope optional) or plain text with one question per line, optionally
+followed by a tab and a label. Without a log a small built-in sample is used.
+
+Usage:
+    python evaluate_semantic_cache.py questions.jsonl --thresholds 0.5,0.6,0.7 --show 5
+"""
+
+import argparse
+import json
+from typing import Dict, List, Optional
+
+from app.services.semantic_cache import SemanticAnswerCache
+
+SAMPLE_LOG = [
+    ("How many PTO days do I get?", "pto_allowance"),
+    ("How many paid leave days per year?", "pto_allowance"),
+    ("how many vacation days do I get", "pto_allowance"),
+    ("How many sick days do I get?", "sick_allowance"),
+    ("What is the sick leave allowance?", "sick_allowance"),
+    ("When is payday?", "payday"),
+    ("When do I get my salary?", "payday"),
+    ("What day is payday?", "payday"),
+    ("How do I reset my password?", "password_reset"),
+    ("How can I reset my password", "password_reset"),
+    ("What is step 4?", "step_4"),
+    ("What is step 5?", "step_5"),
+    ("Can I work from home?", "remote_work"),
+    ("Is WFH allowed?", "remote_work"),
+    ("Can I not work from home on Fridays?", "remote_work_fridays"),
+    ("How do I submit a travel expense?", "travel_expense"),
+    ("How do I get reimbursed for travel?", "travel_expense"),
+    ("How do I claim travel reimbursement?", "travel_expense"),
+    ("Who do I contact about my laptop?", "laptop_contact"),
+    ("Who should I contact about my laptop", "laptop_contact"),
+    ("What is the dress code?", "dress_code"),
+    ("What is the dress code on Fridays?", "dress_code_fridays"),
+    ("How do I enroll in health insurance?", "health_enroll"),
+    ("How do I enroll in medical insurance?", "health_enroll"),
+    ("How many PTO days carry over to next year?", "pto_carry_over"),
+    ("Can unused PTO carry over to next year?", "pto_carry_over"),
+]
+
+
+def load_log(path: Optional[str]) -> List[Dict[str, Optional[str]]]:
+    """Questions in order, with their label and scope when the log has them"""
+    if path is None:
+        return [{"question": question, "label": label, "scope": "onboarding"} for question, label in SAMPLE_LOG]
+    records = []
+    with open(path, encoding="utf-8") as log:
+        for line in log:
+            line = line.strip()
+            if not line:
+                continue
+            if line.startswith("{"):
+                record = json.loads(line)
+                records.append({
+                    "question": record["question"],
+                    "label": record.get("label"),
+                    "scope": record.get("scope", "onboarding"),
+                })
+            else:
+                question, _, label = line.partition("\t")
+                records.append({"question": question, "label": label or None, "scope": "onboarding"})
+    return records
+
+
+def replay(records: List[Dict[str, Optional[str]]], threshold: float, max_entries: int) -> Dict:
+    """Hit / false-hit counts for one threshold"""
+    cache = SemanticAnswerCache(threshold=threshold, max_entries=max_entries, ttl_seconds=float("inf"))
+    seen_labels = set()
+    hits = false_hits = reachable = 0
+    false_examples = []
+    for record in records:
+        label = record["label"]
+        scope = record["scope"]
+        # The answer stored for a question is its label, so a hit can be checked
+        answer = label if label is not None else record["question"]
+        if label is not None and (scope, label) in seen_labels:
+            reachable += 1
+        match = cache.get(scope, None, None, "eval:0", record["question"])
+        if match is None:
+            cache.add(scope, None, None, "eval:0", "eval", record["question"], answer)
+        else:
+            hits += 1
+            if label is not None and match.answer != label:
+                false_hits += 1
+                false_examples.append({"question": record["question"], "matched": match.question, "similarity": match.similarity})
+        if label is not None:
+            seen_labels.add((scope, label))
+
+    labelled = any(record["label"] is not None for record in records)
+    true_hits = hits - false_hits
+    return {
+        "threshold": threshold,
+        "questions": len(records),
+        "hits": hits,
+        "hit_rate": round(hits / len(records), 4) if records else 0.0,
+        "false_hits": false_hits if labelled else None,
+        "false_hit_rate": round(false_hits / hits, 4) if labelled and hits else (0.0 if labelled else None),
+        "reachable": reachable if labelled else None,
+        "recall": round(true_hits / reachable, 4) if labelled and reachable else None,
+        "candidates_checked": cache.candidates_checked,
+        "false_examples": false_examples,
+    }
+
+
+def print_report(results: List[Dict], show: int):
+    print(f"{'threshold':>9}  {'hit rate':>8}  {'false hits':>10}  {'false-hit rate':>14}  {'recall':>6}")
+    for result in results:
+        false_hits = "-" if result["false_hits"] is None else result["false_hits"]
+        false_rate = "-" if result["false_hit_rate"] is None else f"{result['false_hit_rate']:.1%}"
+        recall = "-" if result["recall"] is None else f"{result['recall']:.1%}"
+        print(f"{result['threshold']:>9.2f}  {result['hit_rate']:>8.1%}  {false_hits:>10}  {false_rate:>14}  {recall:>6}")
+    if results:
+        print(f"\n{results[0]['questions']} questions, {results[0]['reachable'] or 0} could have hit an earlier question")
+    for result in results:
+        for example in result["false_examples"][:show]:
+            print(f"  false hit at {result['threshold']:.2f}: {example['question']!r} ~ {example['matched']!r} ({example['similarity']:.2f})")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Replay a question log through the semantic answer cache")
+    parser.add_argument("log", nargs="?", help="Question log (JSON lines or text); the built-in sample if omitted")
+    parser.add_argument("--thresholds", default="0.5,0.6,0.7,0.8", help="Comma-separated similarity thresholds to compare")
+    parser.add_argument("--max-entries", type=int, default=2000, help="Cache capacity (SEMANTIC_CACHE_MAX_ENTRIES)")
+    parser.add_argument("--show", type=int, default=3, help="False hits to print per threshold")
+    parser.add_argument("--json", action="store_true", help="Print the report as JSON")
+    args = parser.parse_args()
+
+    log_records = load_log(args.log)
+    reports = [replay(log_records, float(value), args.max_entries) for value in args.thresholds.split(",") if value.strip()]
+    if args.json:
+        print(json.dumps(reports, indent=2))
+    else:
+        print_report(reports, args.show)
@@ -0,0 +1,245 @@
+#!/usr/bin/env python3
+"""
+Load generator for /api/ask
+
+Sends questions at a fixed arrival rate (open loop, so a slow server builds
+up a backlog instead of slowing the generator down) with a mix of guided and
+global onboarding questions and employee helpdesk questions, then reports
+latency percentiles, throughput and error rates.
+
+Usage:
+    python mock_azure_openai.py --port 8001 &
+    AZURE_AI_ENDPOINT=http://127.0.0.1:8001 AZURE_AI_API_KEY=mock uvicorn app.main:app --port 8000 &
+    python load_test.py --base-url http://127.0.0.1:8000 --rps 20 --duration 60 --employee-ratio 0.3
+"""
+
+import argparse
+import asyncio
+import json
+import random
+import statistics
+import time
+from collections import Counter
+from typing import Dict, List, Optional
+
+import httpx
+
+ONBOARDING_QUESTIONS = [
+    "How many vacation days do I get?",
+    "What should I bring on my first day?",
+    "When is payday?",
+    "How do I enroll in health insurance?",
+    "What is the dress code?",
+    "Who do I contact about my laptop?",
+    "What are the working hours?",
+    "How does the probation period work?",
+]
+
+EMPLOYEE_QUESTIONS = [
+    "How do I reset my password?",
+    "How much notice do I need to give for PTO?",
+    "How do I submit a travel expense?",
+    "What is the IT helpdesk phone number?",
+    "Can unused PTO carry over to next year?",
+    "How do I request a new monitor?",
+]
+
+# Prefixes of the AI failure messages /api/ask returns with a 200 status
+AI_ERROR_PREFIXES = ("AI service", "AI is not configured", "Error connecting to AI", "No answer received")
+
+
+def percentile(values: List[float], pct: float) -> float:
+    """Nearest-rank percentile of an already sorted list"""
+    if not values:
+        return 0.0
+    rank = max(0, min(len(values) - 1, int(round(pct / 100 * len(values) + 0.5)) - 1))
+    return values[rank]
+
+
+class LoadTest:
+    """Open-loop request generator and result collector"""
+
+    def __init__(self, args: argparse.Namespace, section_ids: List[str]):
+        self.args = args
+        self.section_ids = section_ids
+        self.latencies: List[float] = []
+        self.first_token: List[float] = []
+        self.by_scope: Dict[str, List[float]] = {}
+        self.statuses: Counter = Counter()
+        self.ai_errors = 0
+        self.cached = 0
+        self.sent = 0
+        self.dropped = 0
+        self.in_flight = 0
+
+    def next_payload(self) -> Dict:
+        roll = random.random()
+        if roll < self.args.employee_ratio:
+            payload = {"scope": "employee", "message": random.choice(EMPLOYEE_QUESTIONS)}
+        elif self.section_ids and roll < self.args.employee_ratio + self.args.guided_ratio:
+            payload = {"scope": "onboarding", "mode": "guided", "section_id": random.choice(self.section_ids),
+                       "message": random.choice(ONBOARDING_QUESTIONS)}
+        else:
+            payload = {"scope": "onboarding", "mode": "global", "message": random.choice(ONBOARDING_QUESTIONS)}
+        if self.args.unique:
+            # Distinct wording so every request misses the answer cache
+            payload["message"] += f" (request {self.sent})"
+        return payload
+
+    async def send(self, client: httpx.AsyncClient, payload: Dict):
+        label = payload["scope"] if payload["scope"] == "employee" else f"onboarding/{payload['mode']}"
+        started = time.perf_counter()
+        self.in_flight += 1
+        try:
+            if self.args.stream:
+                await self._send_stream(client, payload, started)
+            else:
+                response = await client.post("/api/ask", json=payload)
+                self.statuses[response.status_code] += 1
+                if response.status_code == 200:
+                    body = response.json()
+                    if str(body.get("answer", "")).startswith(AI_ERROR_PREFIXES):
+                        self.ai_errors += 1
+                    if body.get("cached"):
+                        self.cached += 1
+        except httpx.TimeoutException:
+            self.statuses["timeout"] += 1
+        except httpx.HTTPError as e:
+            self.statuses[type(e).__name__] += 1
+        finally:
+            self.in_flight -= 1
+        elapsed = time.perf_counter() - started
+        self.latencies.append(elapsed)
+        self.by_scope.setdefault(label, []).append(elapsed)
+
+    async def _send_stream(self, client: httpx.AsyncClient, payload: Dict, started: float):
+        async with client.stream("POST", "/api/ask/stream", json=payload) as response:
+            self.statuses[response.status_code] += 1
+            event = None
+            first_token_seen = False
+            async for line in response.aiter_lines():
+                if line.startswith("event:"):
+                    event = line[6:].strip()
+                elif line.startswith("data:"):
+                    if event == "delta" and not first_token_seen:
+                        self.first_token.append(time.perf_counter() - started)
+                        first_token_seen = True
+                    elif event == "error":
+                        self.ai_errors += 1
+                    elif event == "meta" and json.loads(line[5:]).get("cached"):
+                        self.cached += 1
+
+    async def run(self) -> float:
+        limits = httpx.Limits(max_connections=self.args.max_in_flight, max_keepalive_connections=self.args.max_in_flight)
+        timeout = httpx.Timeout(self.args.timeout)
+        tasks = set()
+        async with httpx.AsyncClient(base_url=self.args.base_url, limits=limits, timeout=timeout) as client:
+            started = time.perf_counter()
+            interval = 1.0 / self.args.rps
+            total = int(self.args.rps * self.args.duration)
+            for index in range(total):
+                # Schedule against the start time so the arrival rate does not drift
+                delay = started + index * interval - time.perf_counter()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                if self.in_flight >= self.args.max_in_flight:
+                    self.dropped += 1
+                    continue
+                self.sent += 1
+                task = asyncio.create_task(self.send(client, self.next_payload()))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+            if tasks:
+                await asyncio.gather(*tasks)
+            return time.perf_counter() - started
+
+    def report(self, wall_time: float) -> Dict:
+        latencies = sorted(self.latencies)
+        completed = sum(count for status, count in self.statuses.items() if status == 200)
+        failed = sum(count for status, count in self.statuses.items() if status != 200)
+
+        def summary(values: List[float]) -> Dict[str, float]:
+            values = sorted(values)
+            return {
+                "count": len(values),
+                "p50_ms": round(percentile(values, 50) * 1000, 1),
+                "p95_ms": round(percentile(values, 95) * 1000, 1),
+                "p99_ms": round(percentile(values, 99) * 1000, 1),
+                "max_ms": round(values[-1] * 1000, 1) if values else 0.0,
+                "mean_ms": round(statistics.fmean(values) * 1000, 1) if values else 0.0,
+            }
+
+        report = {
+            "target_rps": self.args.rps,
+            "duration_seconds": round(wall_time, 2),
+            "sent": self.sent,
+            "dropped": self.dropped,
+            "completed": completed,
+            "throughput_rps": round(completed / wall_time, 2) if wall_time else 0.0,
+            "http_error_rate": round(failed / self.sent, 4) if self.sent else 0.0,
+            "ai_error_rate": round(self.ai_errors / self.sent, 4) if self.sent else 0.0,
+            "cached": self.cached,
+            "statuses": {str(status): count for status, count in self.statuses.items()},
+            "latency": summary(latencies),
+            "by_scope": {label: summary(values) for label, values in sorted(self.by_scope.items())},
+        }
+        if self.args.stream:
+            report["time_to_first_token"] = summary(self.first_token)
+        return report
+
+
+def print_report(report: Dict):
+    print(f"\nTarget {report['target_rps']} rps for {report['duration_seconds']}s")
+    print(f"Sent {report['sent']}, dropped {report['dropped']} (max in flight), completed {report['completed']}")
+    print(f"Throughput {report['throughput_rps']} rps, HTTP errors {report['http_error_rate']:.2%}, "
+          f"AI errors {report['ai_error_rate']:.2%}, cache hits {report['cached']}")
+    print(f"Statuses: {report['statuses']}")
+    rows = [("all", report["latency"])] + list(report["by_scope"].items())
+    if "time_to_first_token" in report:
+        rows.append(("first token", report["time_to_first_token"]))
+    print(f"\n{'':<20}{'count':>8}{'p50':>10}{'p95':>10}{'p99':>10}{'max':>10}")
+    for label, row in rows:
+        print(f"{label:<20}{row['count']:>8}{row['p50_ms']:>10}{row['p95_ms']:>10}{row['p99_ms']:>10}{row['max_ms']:>10}")
+
+
+async def fetch_section_ids(base_url: str) -> List[str]:
+    try:
+        async with httpx.AsyncClient(base_url=base_url, timeout=10) as client:
+            response = await client.get("/api/policies")
+            response.raise_for_status()
+            return [section["section_id"] for section in response.json()]
+    except (httpx.HTTPError, ValueError, KeyError) as e:
+        print(f"Could not load policy sections, sending global questions only: {e}")
+        return []
+
+
+async def main(args: argparse.Namespace) -> Optional[Dict]:
+    section_ids = await fetch_section_ids(args.base_url)
+    mode = "streaming" if args.stream else "non-streaming"
+    print(f"Driving {args.base_url} at {args.rps} rps for {args.duration}s ({mode}, {len(section_ids)} guided sections)")
+    load_test = LoadTest(args, section_ids)
+    wall_time = await load_test.run()
+    report = load_test.report(wall_time)
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print_report(report)
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Load test /api/ask")
+    parser.add_argument("--base-url", default="http://127.0.0.1:8000")
+    parser.add_argument("--rps", type=float, default=10.0, help="Target arrival rate (requests per second)")
+    parser.add_argument("--duration", type=float, default=30.0, help="Seconds to generate load for")
+    parser.add_argument("--employee-ratio", type=float, default=0.3, help="Fraction of employee helpdesk questions")
+    parser.add_argument("--guided-ratio", type=float, default=0.3, help="Fraction of guided onboarding questions")
+    parser.add_argument("--unique", action="store_true", help="Make every question distinct to bypass the answer cache")
+    parser.add_argument("--stream", action="store_true", help="Use /api/ask/stream and report time to first token")
+    parser.add_argument("--max-in-flight", type=int, default=200, help="Requests beyond this many outstanding are dropped")
+    parser.add_argument("--timeout", type=float, default=60.0)
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--json", action="store_true", help="Print the report as JSON")
+    args = parser.parse_args()
+    random.seed(args.seed)
+    asyncio.run(main(args))
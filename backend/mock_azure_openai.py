@@ -0,0 +1,202 @@
+#!/usr/bin/env python3
+"""
+Local stand-in for the Azure OpenAI chat completions API
+
+Speaks the protocol AIConnector uses (non-streaming and stream=true SSE,
+`usage` blocks, Retry-After / x-ratelimit-* headers) with configurable
+latency, token rate and error injection, so /api/ask can be load-tested
+without Azure.
+
+Usage:
+    python mock_azure_openai.py --port 8001 --latency-ms 800 --tokens-per-second 60 --rate-429 0.02
+    AZURE_AI_ENDPOINT=http://127.0.0.1:8001 AZURE_AI_API_KEY=mock uvicorn app.main:app --port 8000
+
+The behaviour can be changed while running with POST /mock/config (same
+keys as the command line options, with underscores) and counters are
+available at GET /mock/stats.
+"""
+
+import argparse
+import asyncio
+import json
+import random
+import time
+import uuid
+from collections import Counter
+from dataclasses import asdict, dataclass, fields
+from typing import Any, Dict, Optional
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+FILLER_WORDS = (
+    "employees should review the policy and contact human resources with any questions about "
+    "leave benefits payroll onboarding equipment travel expenses and workplace guidelines"
+).split()
+
+
+@dataclass
+class MockConfig:
+    latency_dist: str = "lognormal"      # fixed, uniform, normal or lognormal
+    latency_ms: float = 600.0            # median time to first token
+    latency_jitter: float = 0.35         # sigma (lognormal) or relative spread (uniform/normal)
+    tokens_per_second: float = 50.0      # completion token rate after the first token
+    completion_tokens: int = 120         # answer length (capped by max_tokens)
+    rate_429: float = 0.0                # fraction of requests throttled
+    rate_5xx: float = 0.0                # fraction of requests failing with 500/503
+    retry_after_ms: int = 1000           # retry-after-ms sent with 429s
+    rpm: int = 0                         # emulated requests-per-minute quota (0 = unlimited)
+    tpm: int = 0                         # emulated tokens-per-minute quota (0 = unlimited)
+
+
+config = MockConfig()
+stats: Counter = Counter()
+_window: Dict[str, Any] = {"started": time.monotonic(), "requests": 0, "tokens": 0}
+
+app = FastAPI(title="Mock Azure OpenAI")
+
+
+def sample_latency() -> float:
+    """Seconds until the first byte, drawn from the configured distribution"""
+    median = config.latency_ms / 1000
+    if config.latency_dist == "fixed":
+        return median
+    if config.latency_dist == "uniform":
+        spread = median * config.latency_jitter
+        return max(0.0, random.uniform(median - spread, median + spread))
+    if config.latency_dist == "normal":
+        return max(0.0, random.gauss(median, median * config.latency_jitter))
+    return random.lognormvariate(0, config.latency_jitter) * median
+
+
+def estimate_tokens(text: str) -> int:
+    return max(1, len(text) // 4)
+
+
+def quota_exceeded(tokens: int) -> bool:
+    """Fixed one-minute window emulation of the deployment quotas"""
+    now = time.monotonic()
+    if now - _window["started"] >= 60:
+        _window.update(started=now, requests=0, tokens=0)
+    if config.rpm and _window["requests"] + 1 > config.rpm:
+        return True
+    if config.tpm and _window["tokens"] + tokens > config.tpm:
+        return True
+    _window["requests"] += 1
+    _window["tokens"] += tokens
+    return False
+
+
+def ratelimit_headers() -> Dict[str, str]:
+    headers = {}
+    if config.rpm:
+        headers["x-ratelimit-remaining-requests"] = str(max(0, config.rpm - _window["requests"]))
+    if config.tpm:
+        headers["x-ratelimit-remaining-tokens"] = str(max(0, config.tpm - _window["tokens"]))
+    return headers
+
+
+def error_response(status: int, message: str, headers: Optional[Dict[str, str]] = None) -> JSONResponse:
+    stats[f"status_{status}"] += 1
+    return JSONResponse({"error": {"code": str(status), "message": message}}, status_code=status, headers=headers)
+
+
+@app.post("/openai/deployments/{deployment}/chat/completions")
+async def chat_completions(deployment: str, request: Request):
+    body = await request.json()
+    stats["requests"] += 1
+    if not request.headers.get("api-key"):
+        return error_response(401, "Access denied due to missing api-key")
+
+    prompt_text = " ".join(str(message.get("content", "")) for message in body.get("messages", []))
+    prompt_tokens = estimate_tokens(prompt_text)
+    completion_tokens = max(1, min(config.completion_tokens, int(body.get("max_tokens") or config.completion_tokens)))
+
+    # Azure charges prompt + max_tokens against the quota when a request is admitted
+    if quota_exceeded(prompt_tokens + int(body.get("max_tokens") or completion_tokens)):
+        return error_response(429, "Rate limit is exceeded.", {"retry-after-ms": str(config.retry_after_ms), "retry-after": str(max(1, config.retry_after_ms // 1000))})
+    roll = random.random()
+    if roll < config.rate_429:
+        return error_response(429, "Rate limit is exceeded.", {"retry-after-ms": str(config.retry_after_ms), "retry-after": str(max(1, config.retry_after_ms // 1000))})
+    if roll < config.rate_429 + config.rate_5xx:
+        await asyncio.sleep(sample_latency() / 2)
+        return error_response(random.choice([500, 503]), "The server had an error while processing your request.")
+
+    words = [FILLER_WORDS[i % len(FILLER_WORDS)] for i in range(completion_tokens)]
+    usage = {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens, "total_tokens": prompt_tokens + completion_tokens}
+    completion_id = f"chatcmpl-{uuid.uuid4().hex[:24]}"
+    created = int(time.time())
+    token_delay = 1.0 / config.tokens_per_second if config.tokens_per_second > 0 else 0.0
+    stats["status_200"] += 1
+    stats["prompt_tokens"] += prompt_tokens
+    stats["completion_tokens"] += completion_tokens
+
+    if body.get("stream"):
+        include_usage = bool((body.get("stream_options") or {}).get("include_usage"))
+
+        async def events():
+            await asyncio.sleep(sample_latency())
+            for index, word in enumerate(words):
+                if index:
+                    await asyncio.sleep(token_delay)
+                chunk = {
+                    "id": completion_id, "object": "chat.completion.chunk", "created": created, "model": deployment,
+                    "choices": [{"index": 0, "delta": {"content": word if index == 0 else " " + word}, "finish_reason": None}],
+                }
+                yield f"data: {json.dumps(chunk)}\n\n"
+            final = {"id": completion_id, "object": "chat.completion.chunk", "created": created, "model": deployment,
+                     "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}]}
+            yield f"data: {json.dumps(final)}\n\n"
+            if include_usage:
+                yield f"data: {json.dumps({'id': completion_id, 'object': 'chat.completion.chunk', 'choices': [], 'usage': usage})}\n\n"
+            yield "data: [DONE]\n\n"
+
+        return StreamingResponse(events(), media_type="text/event-stream", headers=ratelimit_headers())
+
+    await asyncio.sleep(sample_latency() + token_delay * (completion_tokens - 1))
+    return JSONResponse({
+        "id": completion_id,
+        "object": "chat.completion",
+        "created": created,
+        "model": deployment,
+        "choices": [{"index": 0, "message": {"role": "assistant", "content": " ".join(words)}, "finish_reason": "stop"}],
+        "usage": usage,
+    }, headers=ratelimit_headers())
+
+
+@app.get("/mock/stats")
+async def mock_stats():
+    return {"config": asdict(config), "stats": dict(stats)}
+
+
+@app.post("/mock/config")
+async def update_config(request: Request):
+    updates = await request.json()
+    for item in fields(MockConfig):
+        if item.name in updates:
+            setattr(config, item.name, type(getattr(config, item.name))(updates[item.name]))
+    return asdict(config)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Mock Azure OpenAI chat completions server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8001)
+    for item in fields(MockConfig):
+        default = getattr(config, item.name)
+        option = "--" + item.name.replace("_", "-")
+        if item.name == "latency_dist":
+            parser.add_argument(option, default=default, choices=["fixed", "uniform", "normal", "lognormal"])
+        else:
+            parser.add_argument(option, type=type(default), default=default)
+    args = parser.parse_args()
+
+    for item in fields(MockConfig):
+        setattr(config, item.name, getattr(args, item.name))
+    print(f"Mock Azure OpenAI on http://{args.host}:{args.port} with {asdict(config)}")
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
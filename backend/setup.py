@@ -36,6 +36,7 @@ def check_dependencies():
         "fastapi",
         "uvicorn",
         "pymongo",
+        "motor",
         "pandas",
         "openpyxl",
         "httpx",
@@ -47,6 +47,10 @@ api.interceptors.response.use(
   }
 )
 
+// Follow-up memory on /ask is keyed by a per-chat id, separate from the onboarding X-Session-ID
+const chatSessionConfig = (chatSessionId) =>
+  chatSessionId ? { headers: { 'X-Chat-Session-ID': chatSessionId } } : undefined
+
 // API endpoints
 export const endpoints = {
   health: () => api.get('/health'),
@@ -60,8 +64,15 @@ export const endpoints = {
   getEmployees: () => api.get('/employees'),
   getEmployeeById: (id) => api.get(`/employees/${id}`),
   createEmployee: (employeeData) => api.post('/onboard', employeeData),
-  askQuestion: (request) => api.post('/ask', request),
-  enhancedAsk: (request) => api.post('/ask', request),
+  askQuestion: (request, chatSessionId) => api.post('/ask', request, chatSessionConfig(chatSessionId)),
+  enhancedAsk: (request, chatSessionId) => api.post('/ask', request, chatSessionConfig(chatSessionId)),
+  // Server-sent events; returns the fetch Response so the caller can read its body stream
+  askQuestionStream: (request, chatSessionId) => fetch(`${API_BASE}/ask/stream`, {
+    method: 'POST',
+    headers: { 'Content-Type': 'application/json', ...chatSessionConfig(chatSessionId)?.headers },
+    body: JSON.stringify(request),
+  }),
+  clearChatSession: (chatSessionId) => api.delete(`/ask/sessions/${encodeURIComponent(chatSessionId)}`),
   // Feedback endpoints
   submitFeedback: (feedbackData) => api.post('/feedback', feedbackData),
   getFeedback: (params = {}) => api.get('/feedback', { params }),
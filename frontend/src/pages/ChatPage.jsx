@@ -39,6 +39,10 @@ import { endpoints } from '../lib/api'
 import ReactMarkdown from 'react-markdown'
 import remarkGfm from 'remark-gfm'
 
+// Per-chat id sent as X-Chat-Session-ID, so the backend answers follow-ups with this chat's earlier turns
+const createChatSessionId = () =>
+  'chat_' + (window.crypto?.randomUUID?.() || `${Date.now()}_${Math.random().toString(36).slice(2)}`)
+
 export const ChatPage = () => {
   const [messages, setMessages] = useState([
     {
@@ -81,7 +85,7 @@ export const ChatPage = () => {
         }
         
         // Set a simple session ID for chat (no need for employee creation)
-        const chatSessionId = 'chat_' + Date.now()
+        const chatSessionId = createChatSessionId()
         setSessionId(chatSessionId)
         console.log('💬 Chat session initialized:', chatSessionId)
         
@@ -89,7 +93,7 @@ export const ChatPage = () => {
         console.error('❌ Failed to initialize chat:', error)
         
         // Create a fallback session ID for basic chat
-        const fallbackSessionId = 'chat_' + Date.now()
+        const fallbackSessionId = createChatSessionId()
         console.log('⚠️ Using fallback session ID:', fallbackSessionId)
         setSessionId(fallbackSessionId)
         
@@ -259,7 +263,7 @@ export const ChatPage = () => {
       console.log('🔍 Making API call to /api/ask with:', requestPayload)
       
       // Make the API call to the /api/ask endpoint
-      const response = await endpoints.askQuestion(requestPayload)
+      const response = await endpoints.askQuestion(requestPayload, sessionId)
       const responseData = response.data
       console.log('✅ /api/ask response:', responseData)
       
@@ -317,7 +321,18 @@ export const ChatPage = () => {
     }
   }
 
+  // Forget the current chat's turns on the server and give the next questions a fresh id
+  const startNewChatSession = () => {
+    if (sessionId) {
+      endpoints.clearChatSession(sessionId).catch(() => {
+        // 404 when nothing was asked yet; the old session also expires on its own
+      })
+    }
+    setSessionId(createChatSessionId())
+  }
+
   const handleNewChat = () => {
+    startNewChatSession()
           setMessages([
         {
           id: Date.now(),
@@ -331,6 +346,7 @@ export const ChatPage = () => {
 
   const handleClearChat = () => {
     if (confirm('Are you sure you want to clear the chat history?')) {
+      startNewChatSession()
       setMessages([
         {
           id: Date.now(),